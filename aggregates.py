@@ -0,0 +1,263 @@
+"""
+Running rating aggregates and top-k leaderboards.
+
+Every place's ratings are folded into running totals (count, sum, sum of
+squares per rating, so mean and variance come out in O(1)) for its city,
+each of its tags and each city×tag pair. Adding, editing or deleting a
+place adjusts only the groups it belongs to; nothing is rescanned.
+
+Each group also keeps a heap of its places by overall score (the mean of
+the place's ratings). Heaps don't support removal, so an edited or deleted
+place's old entries are left behind and skipped when read: every entry
+carries the place's version at the time it was pushed. A heap is rebuilt
+from its live entries once stale ones outnumber them.
+
+A rating of 0 means "not rated" (imports leave missing ratings at 0) and
+doesn't count towards that rating's figures; a place without any rating
+isn't ranked. Groups are keyed by ("city", city), ("tag", tag) and
+("city_tag", city, tag); ("all",) covers every place. Cities are grouped
+folded ("São Paulo " and "sao paulo" are one city) and shown in their most
+common spelling. Groups are also indexed by kind (and city_tag groups by
+city), so listing one kind doesn't scan the others.
+"""
+import heapq
+import itertools
+import math
+import threading
+from collections import Counter
+
+from gazetteer import fold
+
+
+TOP_K = 10
+OVERALL = "overall"
+STALE_SLACK = 32   # stale heap entries tolerated beyond the live ones
+
+
+def overall_score(ratings: dict):
+    rated = [x for x in ratings.values() if x]
+    return sum(rated) / len(rated) if rated else None
+
+
+def group_keys(city: str, tags):
+    """Keys of the groups a place belongs to; `city` is already folded."""
+    keys = [("all",)]
+    if city:
+        keys.append(("city", city))
+    for tag in tags:
+        keys.append(("tag", tag))
+        if city:
+            keys.append(("city_tag", city, tag))
+    return keys
+
+
+class RunningStats:
+    """Count, sum and sum of squares of one rating within a group."""
+
+    __slots__ = ("count", "sum", "sumsq")
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.sumsq = 0.0
+
+    def add(self, x: float, sign: int = 1):
+        self.count += sign
+        self.sum += sign * x
+        self.sumsq += sign * x * x
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else None
+
+    @property
+    def variance(self):
+        if not self.count:
+            return None
+        mean = self.sum / self.count
+        return max(0.0, self.sumsq / self.count - mean * mean)
+
+    def to_dict(self) -> dict:
+        variance = self.variance
+        return {
+            "count": self.count,
+            "mean": self.mean,
+            "variance": variance,
+            "stdev": math.sqrt(variance) if variance is not None else None,
+        }
+
+
+class Group:
+    __slots__ = ("places", "stats", "heap", "ranked")
+
+    def __init__(self, fields):
+        self.places = 0
+        self.stats = {f: RunningStats() for f in (*fields, OVERALL)}
+        self.heap = []    # (-score, name, id, version)
+        self.ranked = 0   # live entries in the heap
+
+
+class RatingAggregates:
+    """Aggregates and leaderboards over every place, kept current by the
+    store's write paths (`add`, `update`, `remove`). `fields` are the
+    rating columns."""
+
+    def __init__(self, fields, places=()):
+        self.fields = tuple(fields)
+        self._groups = {}
+        self._kinds = {"city": {}, "tag": {}, "city_tag": {}}   # kind -> name -> group (city_tag: city -> tag -> group)
+        self._spellings = {}   # folded city -> Counter of the spellings saved
+        self._places = {}    # id -> (name, city, tags, ratings, score, version)
+        self._versions = itertools.count()
+        self._lock = threading.Lock()
+        for p in places:
+            self.add(p)
+
+    def __len__(self):
+        return len(self._places)
+
+    # ----- writes -----
+    def add(self, place: dict):
+        with self._lock:
+            self._add(place)
+
+    def update(self, place_id: str, fields: dict):
+        """Apply edited `fields` of a place (any subset of its columns)."""
+        if not {"name", "city", "tags", *self.fields} & fields.keys():
+            return
+        with self._lock:
+            old = self._remove(place_id)
+            if old is None:
+                return
+            name, city, tags, ratings, _, _ = old
+            self._add({"id": place_id, "name": name, "city": city, "tags": tags, **ratings, **fields})
+
+    def remove(self, place_id: str):
+        with self._lock:
+            self._remove(place_id)
+
+    def _add(self, place: dict):
+        city = (place.get("city") or "").strip()
+        tags = tuple(dict.fromkeys(place.get("tags") or ()))
+        ratings = {f: place.get(f) or 0 for f in self.fields}
+        score = overall_score(ratings)
+        version = next(self._versions)
+        self._places[place["id"]] = (place.get("name") or "", city, tags, ratings, score, version)
+        entry = (-score, place.get("name") or "", place["id"], version) if score is not None else None
+        city_key = fold(city)
+        if city_key:
+            self._spellings.setdefault(city_key, Counter())[city] += 1
+        for key in group_keys(city_key, tags):
+            group = self._groups.get(key)
+            if group is None:
+                group = self._groups[key] = Group(self.fields)
+                index = self._kind_index(key)
+                if index is not None:
+                    index[key[-1]] = group
+            self._fold(group, ratings, score, 1)
+            if entry:
+                heapq.heappush(group.heap, entry)
+                group.ranked += 1
+
+    def _remove(self, place_id: str):
+        old = self._places.pop(place_id, None)
+        if old is None:
+            return None
+        _, city, tags, ratings, score, _ = old
+        city_key = fold(city)
+        if city_key:
+            spellings = self._spellings[city_key]
+            spellings[city] -= 1
+            if spellings[city] <= 0:
+                del spellings[city]
+                if not spellings:
+                    del self._spellings[city_key]
+        for key in group_keys(city_key, tags):
+            group = self._groups[key]
+            self._fold(group, ratings, score, -1)
+            if score is not None:
+                group.ranked -= 1   # its heap entry is now stale
+            if not group.places:
+                del self._groups[key]
+                index = self._kind_index(key)
+                if index is not None:
+                    del index[key[-1]]
+                    if key[0] == "city_tag" and not index:
+                        del self._kinds["city_tag"][key[1]]
+            elif len(group.heap) > 2 * group.ranked + STALE_SLACK:
+                group.heap = [e for e in group.heap if self._live(e)]
+                heapq.heapify(group.heap)
+        return old
+
+    def _kind_index(self, key):
+        """The {name: group} index a group key belongs in, or None for ("all",)."""
+        if key[0] == "city_tag":
+            return self._kinds["city_tag"].setdefault(key[1], {})
+        return self._kinds.get(key[0])
+
+    @staticmethod
+    def _fold(group: Group, ratings: dict, score, sign: int):
+        group.places += sign
+        for f, x in ratings.items():
+            if x:
+                group.stats[f].add(x, sign)
+        if score is not None:
+            group.stats[OVERALL].add(score, sign)
+
+    def _live(self, entry) -> bool:
+        current = self._places.get(entry[2])
+        return current is not None and current[5] == entry[3]
+
+    # ----- reads -----
+    @staticmethod
+    def _key(key) -> tuple:
+        """A group key with its city (as shown or as saved) folded."""
+        if key[0] in ("city", "city_tag"):
+            return (key[0], fold(key[1]), *key[2:])
+        return tuple(key)
+
+    def _city_name(self, city_key: str) -> str:
+        return self._spellings[city_key].most_common(1)[0][0]
+
+    def stats(self, key) -> dict:
+        """{"places": n, rating: {count, mean, variance, stdev}} for a group."""
+        with self._lock:
+            group = self._groups.get(self._key(key))
+            if group is None:
+                group = Group(self.fields)
+            return {"places": group.places, **{f: s.to_dict() for f, s in group.stats.items()}}
+
+    def top(self, key, k: int = TOP_K) -> list:
+        """The group's k best places as {id, name, city, score}, best first.
+
+        Pops the heap until k live entries turn up (dropping stale ones for
+        good) and pushes those back: O(k log n) plus the stale entries met.
+        """
+        with self._lock:
+            group = self._groups.get(self._key(key))
+            if group is None:
+                return []
+            best = []
+            while group.heap and len(best) < k:
+                entry = heapq.heappop(group.heap)
+                if self._live(entry):
+                    best.append(entry)
+            for entry in best:
+                heapq.heappush(group.heap, entry)
+            return [
+                {"id": place_id, "name": name, "city": self._places[place_id][1], "score": -neg}
+                for neg, name, place_id, _ in best
+            ]
+
+    def groups(self, kind: str, city: str = None) -> dict:
+        """{name: places} of the groups of one kind ("city", "tag" or, within
+        `city`, "city_tag"), most places first. Cities are named by their
+        most common spelling."""
+        with self._lock:
+            if kind == "city_tag":
+                found = {tag: g.places for tag, g in self._kinds[kind].get(fold(city or ""), {}).items()}
+            elif kind == "city":
+                found = {self._city_name(c): g.places for c, g in self._kinds[kind].items()}
+            else:
+                found = {name: g.places for name, g in self._kinds[kind].items()}
+        return dict(sorted(found.items(), key=lambda kv: (-kv[1], kv[0])))
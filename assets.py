@@ -0,0 +1,110 @@
+"""
+Static assets: a downscaled, content-hashed logo and the minified stylesheet.
+
+The logo is served as `static/logo/logo.<hash>.<ext>` (the hash covers the
+source file and the target size, so a new logo gets a new URL) through
+Streamlit's static file server instead of inlining ~400 KB of base64 on
+every rerun. The renditions are committed (`python assets.py` rebuilds
+them after the logo changes), so a fresh deploy finds them without
+loading Pillow; if they are missing, they are rendered on a background
+thread and pages go without the logo until they're there.
+
+Streamlit only serves images (and PDFs) from `static/` with their real
+content type, so the stylesheet can't be linked the same way; it is
+minified once per process and injected as is. Generated initials avatars
+are small SVG data URIs, memoized per set of initials.
+"""
+import base64
+import hashlib
+import os
+import re
+import threading
+from functools import lru_cache
+
+from photos import STATIC_DIR
+
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+LOGO_DIR = os.path.join(STATIC_DIR, "logo")
+LOGO_URL = "app/static/logo"
+LOGO_SOURCE = os.path.join(ROOT, "trustbites_logo.png")
+LOGO_HEIGHT = 72   # 2x the 36px header logo
+
+
+def minify_css(css: str) -> str:
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    css = re.sub(r"\s+", " ", css)
+    css = re.sub(r"\s*([{}:;,>])\s*", r"\1", css)
+    return css.replace(";}", "}").strip()
+
+
+def logo_names(src: str = LOGO_SOURCE, height: int = LOGO_HEIGHT):
+    """{"png": file name, "webp": file name} of the logo renditions, or None
+    without a source file."""
+    try:
+        with open(src, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    digest = hashlib.sha256(data + f":{height}".encode()).hexdigest()[:12]
+    return {ext: f"logo.{digest}.{ext}" for ext in ("png", "webp")}
+
+
+def find_logo(src: str = LOGO_SOURCE, height: int = LOGO_HEIGHT, out_dir: str = LOGO_DIR):
+    """{"png": url, "webp": url} if the renditions exist, else None."""
+    names = logo_names(src, height)
+    if not names or not all(os.path.exists(os.path.join(out_dir, n)) for n in names.values()):
+        return None
+    return {ext: f"{LOGO_URL}/{name}" for ext, name in names.items()}
+
+
+def build_logo(src: str = LOGO_SOURCE, height: int = LOGO_HEIGHT, out_dir: str = LOGO_DIR):
+    """Write the logo renditions if needed; returns {"png": url, "webp": url} or None."""
+    names = logo_names(src, height)
+    if not names:
+        return None
+    if not all(os.path.exists(os.path.join(out_dir, n)) for n in names.values()):
+        from PIL import Image
+
+        os.makedirs(out_dir, exist_ok=True)
+        img = Image.open(src)
+        img.thumbnail((height * 4, height), Image.LANCZOS)
+        img.save(os.path.join(out_dir, names["png"]), format="PNG", optimize=True)
+        img.save(os.path.join(out_dir, names["webp"]), format="WEBP", quality=90)
+    return {ext: f"{LOGO_URL}/{name}" for ext, name in names.items()}
+
+
+@lru_cache(maxsize=4096)
+def initials_avatar(initials: str) -> str:
+    """Data URI of the generated avatar; one SVG per distinct set of initials."""
+    svg = f"""
+    <svg xmlns="http://www.w3.org/2000/svg" width="64" height="64">
+      <circle cx="32" cy="32" r="32" fill="#1F2937"/>
+      <text x="50%" y="52%" dominant-baseline="middle" text-anchor="middle"
+            fill="#E5E7EB" font-family="system-ui" font-size="28">{initials}</text>
+    </svg>""".strip()
+    return "data:image/svg+xml;base64," + base64.b64encode(svg.encode()).decode()
+
+
+class Assets:
+    def __init__(self, css: str):
+        self.css = minify_css(css)
+        self.logo = find_logo()
+        if self.logo is None and logo_names():
+            threading.Thread(target=self._build_logo, name="trustbites-logo", daemon=True).start()
+
+    def _build_logo(self):
+        self.logo = build_logo()
+
+    def logo_html(self, style: str = "", alt: str = "TrustBites") -> str:
+        if not self.logo:
+            return ""
+        style_attr = f' style="{style}"' if style else ""
+        return (
+            f'<picture><source srcset="{self.logo["webp"]}" type="image/webp" />'
+            f'<img src="{self.logo["png"]}" alt="{alt}"{style_attr} /></picture>'
+        )
+
+
+if __name__ == "__main__":
+    print(build_logo())
@@ -0,0 +1,9 @@
+"""
+Benchmark suite for the TrustBites pages.
+
+`python -m bench.run` builds seeded synthetic datasets (see synthetic.py),
+drives the app headlessly with Streamlit's `AppTest` and reports, per page
+and dataset size, rerun latency percentiles, peak Python memory and the
+size of what the page sends to the browser. Results can be saved as a
+baseline and later runs compared against it.
+"""
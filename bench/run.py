@@ -0,0 +1,348 @@
+"""
+Headless page benchmarks: `python -m bench.run [--scales 10 1000] [--save-baseline]`.
+
+Every dataset size runs in its own process (the store, caches and data
+directory are per process), which signs in as the dataset's first user and
+reruns each scenario with `AppTest`. Reported per scenario:
+
+  first_ms        the first run, which also pays for the process-wide
+                  caches on the first scenario
+  p50_ms, p95_ms  rerun latency over `--runs` reruns
+  peak_kb         peak Python memory during one more rerun (tracemalloc)
+  payload_kb      serialized size of every element the page renders
+
+Cold start is measured separately, in a fresh `python -X importtime`
+process per page (the sign-in page and the map) run from a fresh copy of
+the checkout, so nothing generated under static/ by earlier runs is there:
+the first run's time, the time spent importing modules the app loaded
+during it, the slowest of those imports, and which heavy optional
+dependencies it pulled in.
+
+Results go to bench/results/latest.json; `--save-baseline` also writes
+bench/baseline.json, and every later run is compared against it, flagging
+metrics that grew by more than `--tolerance`.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench.synthetic import SCALES, SEED, load_or_generate  # noqa: E402
+
+
+APP = os.path.join(ROOT, "trustbites.py")
+BENCH_DIR = os.path.join(ROOT, "bench")
+RESULTS_PATH = os.path.join(BENCH_DIR, "results", "latest.json")
+BASELINE_PATH = os.path.join(BENCH_DIR, "baseline.json")
+DATASET_DIR = os.path.join(ROOT, ".trustbites", "bench")
+RUNS = 10
+TOLERANCE = 0.2
+# latency differences below this many ms are noise, whatever the ratio
+LATENCY_SLACK_MS = 5.0
+APP_TIMEOUT = 600
+
+# scenario -> (page, session state set before the first run)
+SCENARIOS = {
+    "Home": ("Home", {}),
+    "My list": ("My list", {}),
+    "My list (everyone)": ("My list", {"list_scope": "Everyone's"}),
+    "Map": ("Map", {}),
+    "Map (everyone)": ("Map", {"map_everyone": True}),
+    "Feed": ("Feed", {}),
+    "Stats": ("Stats", {}),
+    "Add a place": ("Add a place", {}),
+}
+METRICS = ("first_ms", "p50_ms", "p95_ms", "peak_kb", "payload_kb")
+
+# cold-start page -> session state of its first run (None: signed out)
+COLD_PAGES = {"Sign in": None, "Map": {"page": "Map"}}
+HEAVY_MODULES = ("folium", "streamlit_folium", "PIL", "requests", "numpy", "pandas")
+SLOWEST_IMPORTS = 5
+
+
+def percentile(values, p: float) -> float:
+    """Nearest-rank percentile of `values` (0 < p <= 100)."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def payload_bytes(node) -> int:
+    """Serialized size of the element protos under `node` of an AppTest tree."""
+    proto = getattr(node, "proto", None)
+    total = proto.ByteSize() if proto is not None and hasattr(proto, "ByteSize") else 0
+    children = getattr(node, "children", None)
+    if isinstance(children, dict):
+        total += sum(payload_bytes(c) for c in children.values())
+    return total
+
+
+def run_app(at):
+    at.run()
+    if at.exception:
+        raise RuntimeError(f"the app raised: {at.exception[0].message}")
+
+
+def measure(manifest: dict, page: str, state: dict, runs: int) -> dict:
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP, default_timeout=APP_TIMEOUT)
+    at.session_state["auth"] = {"signed_in": True, "email": manifest["user"], "first_name": "", "last_name": ""}
+    at.session_state["page"] = page
+    for key, value in state.items():
+        at.session_state[key] = value
+
+    start = time.perf_counter()
+    run_app(at)
+    first = time.perf_counter() - start
+
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        run_app(at)
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        run_app(at)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "first_ms": round(first * 1000, 1),
+        "p50_ms": round(percentile(times, 50) * 1000, 1),
+        "p95_ms": round(percentile(times, 95) * 1000, 1),
+        "peak_kb": round(peak / 1024, 1),
+        "payload_kb": round(payload_bytes(at._tree) / 1024, 1),
+    }
+
+
+def cold_worker(page: str, out: str):
+    """First run of `page` in this fresh process; records the modules it imported."""
+    from streamlit.testing.v1 import AppTest
+
+    with open(os.path.join(os.environ["TRUSTBITES_DATA_DIR"], "dataset.json")) as f:
+        manifest = json.load(f)
+    before = set(sys.modules)
+    at = AppTest.from_file(APP, default_timeout=APP_TIMEOUT)
+    state = COLD_PAGES[page]
+    if state is not None:
+        at.session_state["auth"] = {"signed_in": True, "email": manifest["user"], "first_name": "", "last_name": ""}
+        for key, value in state.items():
+            at.session_state[key] = value
+    start = time.perf_counter()
+    run_app(at)
+    first = time.perf_counter() - start
+
+    loaded = set(sys.modules) - before
+    with open(out, "w") as f:
+        json.dump({"first_ms": round(first * 1000, 1), "modules": sorted(loaded)}, f)
+
+
+def parse_importtime(stderr: str, modules) -> dict:
+    """Import time of the top-level imports (of the `modules` the app loaded) in
+    `python -X importtime` output, and the slowest of them."""
+    cumulative = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue   # the header
+        name = fields[2].rstrip()[1:]   # "| " + two spaces per nesting level
+        if name.startswith(" ") or name not in modules:
+            continue   # nested: already counted in its importer's cumulative time
+        cumulative[name] = cumulative.get(name, 0) + int(fields[1])
+    slowest = sorted(cumulative.items(), key=lambda kv: -kv[1])[:SLOWEST_IMPORTS]
+    return {
+        "import_ms": round(sum(cumulative.values()) / 1000, 1),
+        "slowest": [[name, round(us / 1000, 1)] for name, us in slowest],
+    }
+
+
+def fresh_checkout(dest: str):
+    """Copy the files git knows about (tracked or not ignored) into `dest`."""
+    listed = subprocess.run(
+        ["git", "ls-files", "-z", "--cached", "--others", "--exclude-standard"],
+        cwd=ROOT, stdout=subprocess.PIPE, check=True,
+    ).stdout.decode()
+    for name in filter(None, listed.split("\0")):
+        src = os.path.join(ROOT, name)
+        if os.path.isfile(src):   # tracked but deleted in the working tree otherwise
+            os.makedirs(os.path.dirname(os.path.join(dest, name)), exist_ok=True)
+            shutil.copy2(src, os.path.join(dest, name))
+
+
+def run_cold(data_dir: str) -> dict:
+    results = {}
+    for page in COLD_PAGES:
+        out = os.path.join(data_dir, "cold.json")
+        env = {**os.environ, "TRUSTBITES_DATA_DIR": data_dir}
+        with tempfile.TemporaryDirectory(prefix="trustbites-cold-") as checkout:
+            fresh_checkout(checkout)
+            proc = subprocess.run(
+                [sys.executable, "-X", "importtime", "-m", "bench.run", "--cold", page, "--out", out],
+                cwd=checkout, env=env, stderr=subprocess.PIPE, text=True,
+            )
+        if proc.returncode:
+            sys.exit(f"cold start worker for {page} failed:\n{proc.stderr[-4000:]}")
+        with open(out) as f:
+            cold = json.load(f)
+        modules = set(cold.pop("modules"))
+        results[page] = {
+            **cold,
+            **parse_importtime(proc.stderr, modules),
+            "heavy": [m for m in HEAVY_MODULES if m in modules],
+        }
+    return results
+
+
+def worker(runs: int, scenarios, out: str):
+    """Benchmark one dataset size in this process (TRUSTBITES_DATA_DIR is already set)."""
+    with open(os.path.join(os.environ["TRUSTBITES_DATA_DIR"], "dataset.json")) as f:
+        manifest = json.load(f)
+    results = {name: measure(manifest, *SCENARIOS[name], runs) for name in scenarios}
+    with open(out, "w") as f:
+        json.dump(results, f)
+
+
+def dataset_dir(scale: int, seed: int) -> str:
+    data_dir = os.path.join(DATASET_DIR, f"{scale}-s{seed}")
+    start = time.perf_counter()
+    load_or_generate(data_dir, scale, seed)
+    print(f"{scale:>7} places: dataset ready in {time.perf_counter() - start:.1f}s", flush=True)
+    return data_dir
+
+
+def run_scale(scale: int, seed: int, runs: int, scenarios) -> dict:
+    data_dir = dataset_dir(scale, seed)
+
+    out = os.path.join(data_dir, "results.json")
+    env = {**os.environ, "TRUSTBITES_DATA_DIR": data_dir}
+    # Streamlit warns about the missing runtime on every element; keep stderr
+    # for when the worker fails
+    proc = subprocess.run(
+        [sys.executable, "-m", "bench.run", "--worker", str(scale), "--runs", str(runs),
+         "--out", out, "--scenarios", *scenarios],
+        cwd=ROOT, env=env, stderr=subprocess.PIPE, text=True,
+    )
+    if proc.returncode:
+        sys.exit(f"benchmark worker for {scale} places failed:\n{proc.stderr[-4000:]}")
+    with open(out) as f:
+        return json.load(f)
+
+
+def compare(results: dict, baseline: dict, tolerance: float):
+    """[(scale, scenario, metric, baseline value, current value)] that regressed."""
+    regressions = []
+    for scale, scenarios in results.items():
+        for name, metrics in scenarios.items():
+            before = baseline.get(scale, {}).get(name)
+            if not before:
+                continue
+            for metric, new in metrics.items():
+                old = before.get(metric)
+                if not isinstance(new, (int, float)) or not isinstance(old, (int, float)):
+                    continue
+                slack = LATENCY_SLACK_MS if metric.endswith("_ms") else 0
+                if new > old * (1 + tolerance) + slack:
+                    regressions.append((scale, name, metric, old, new))
+    return regressions
+
+
+def print_table(results: dict):
+    header = f"{'places':>7}  {'scenario':<20}" + "".join(f"{m:>12}" for m in METRICS)
+    print(header)
+    print("-" * len(header))
+    for scale, scenarios in results.items():
+        if scale == "cold":
+            continue
+        for name, metrics in scenarios.items():
+            print(f"{scale:>7}  {name:<20}" + "".join(f"{metrics[m]:>12}" for m in METRICS))
+
+
+def print_cold(cold: dict):
+    print(f"{'cold start':<10}{'first_ms':>10}{'import_ms':>11}  heavy modules / slowest imports (ms)")
+    for page, c in cold.items():
+        slowest = ", ".join(f"{name} {ms}" for name, ms in c["slowest"])
+        print(f"{page:<10}{c['first_ms']:>10}{c['import_ms']:>11}  {', '.join(c['heavy']) or '-'} / {slowest}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark TrustBites pages on synthetic data.")
+    parser.add_argument("--scales", type=int, nargs="+", default=list(SCALES))
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument("--runs", type=int, default=RUNS, help="reruns per scenario (default %(default)s)")
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE,
+                        help="allowed growth over the baseline (default %(default)s)")
+    parser.add_argument("--save-baseline", action="store_true", help="also save the results as the baseline")
+    parser.add_argument("--worker", type=int, help=argparse.SUPPRESS)   # dataset size, for ps
+    parser.add_argument("--cold", choices=list(COLD_PAGES), help=argparse.SUPPRESS)
+    parser.add_argument("--out", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker is not None:
+        worker(args.runs, args.scenarios, args.out)
+        return 0
+    if args.cold is not None:
+        cold_worker(args.cold, args.out)
+        return 0
+
+    results = {str(scale): run_scale(scale, args.seed, args.runs, args.scenarios) for scale in args.scales}
+    # cold start on the smallest dataset: it is about imports, not data
+    results["cold"] = run_cold(dataset_dir(min(args.scales), args.seed))
+    print()
+    print_table(results)
+    print()
+    print_cold(results["cold"])
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "runs": args.runs,
+            "seed": args.seed,
+            "at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(RESULTS_PATH), exist_ok=True)
+    with open(RESULTS_PATH, "w") as f:
+        json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        with open(BASELINE_PATH, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nBaseline saved to {os.path.relpath(BASELINE_PATH, ROOT)}")
+        return 0
+
+    try:
+        with open(BASELINE_PATH) as f:
+            baseline = json.load(f)["results"]
+    except (OSError, ValueError, KeyError):
+        print("\nNo baseline yet; run with --save-baseline to record one.")
+        return 0
+
+    regressions = compare(results, baseline, args.tolerance)
+    if not regressions:
+        print(f"\nNo regressions against the baseline (tolerance {args.tolerance:.0%}).")
+        return 0
+    print(f"\n{len(regressions)} regression(s) against the baseline:")
+    for scale, name, metric, old, new in regressions:
+        print(f"  {scale:>7}  {name:<20} {metric:<11} {old} -> {new}")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
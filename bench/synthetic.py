@@ -0,0 +1,152 @@
+"""
+Seeded synthetic data for the benchmarks.
+
+`generate(data_dir, places)` fills a fresh TrustBites data directory with
+users, follows, places and feed events. The same seed and size always give the
+same dataset: place cities and coordinates come from the offline
+gazetteer, a share of places has a photo (a handful of generated images,
+stored once each, as repeated uploads are) and a share has no
+coordinates, and ownership is skewed so the first user, the one the
+benchmark signs in as, has a long list of their own.
+"""
+import json
+import math
+import os
+import random
+from datetime import datetime, timedelta
+from io import BytesIO
+
+from gazetteer import Gazetteer
+from photos import BlobStore
+from storage import RATING_FIELDS, Store
+
+
+SCALES = (10, 1_000, 10_000, 100_000)
+SEED = 1
+PASSWORD = "bench"
+PHOTO_SHARE = 0.3       # places with a photo
+COORDS_SHARE = 0.8      # places with coordinates (the rest failed to geocode)
+DISTINCT_PHOTOS = 12
+FOLLOWS_PER_USER = 5
+CITY_SPREAD_KM = 5.0    # places scatter around their city center
+EPOCH = datetime(2025, 1, 1)
+HISTORY_DAYS = 730
+MANIFEST = "dataset.json"
+
+FIRST_NAMES = ["Ana", "João", "Marta", "Rui", "Inês", "Pedro", "Sofia", "Tiago", "Lena", "Omar"]
+LAST_NAMES = ["Silva", "Costa", "Moreira", "Lopes", "Nunes", "Weber", "Haddad", "Rossi"]
+NAME_WORDS = [
+    ("Taberna", "Casa", "Tasca", "Café", "Trattoria", "Bistro", "Cervejaria", "Pastelaria"),
+    ("do Mar", "da Esquina", "Central", "Velha", "do Largo", "Nova", "da Ribeira", "Bela Vista"),
+]
+NOTE_WORDS = (
+    "grilled fish octopus pastel nata wine view terrace friendly slow queue cheap "
+    "pricey brunch pizza seafood cocktails garden cozy loud vegan dessert espresso"
+).split()
+TAGS = ["Casual", "Romantic", "Pizza", "Seafood", "Cocktails", "Brunch"]
+
+
+def user_count(places: int) -> int:
+    # every password is hashed with PBKDF2, so users are kept to dozens
+    return max(2, min(50, places // 200))
+
+
+def make_photos(blobs: BlobStore, count: int, rng: random.Random):
+    from PIL import Image
+
+    digests = []
+    for _ in range(count):
+        img = Image.new("RGB", (640, 480), tuple(rng.randrange(256) for _ in range(3)))
+        img.paste(tuple(rng.randrange(256) for _ in range(3)), (rng.randrange(320), rng.randrange(240), 640, 480))
+        buf = BytesIO()
+        img.save(buf, format="JPEG", quality=85)
+        digests.append(blobs.put(buf.getvalue()))
+    return digests
+
+
+def make_users(store: Store, count: int, rng: random.Random):
+    emails = []
+    for i in range(count):
+        email = f"user{i}@bench.trustbites"
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        store.add_user(
+            email, PASSWORD, event=("join", f"{first} {last} joined TrustBites."),
+            first_name=first, last_name=last, city="Lisbon",
+        )
+        emails.append(email)
+    return emails
+
+
+def make_follows(store: Store, users, rng: random.Random):
+    for user in users:
+        for other in rng.sample(users, min(FOLLOWS_PER_USER + 1, len(users))):
+            store.follow(user, other)   # following oneself is a no-op
+
+
+def make_place(rng: random.Random, owners, cities, photos):
+    name = f"{rng.choice(NAME_WORDS[0])} {rng.choice(NAME_WORDS[1])}"
+    city, lat, lon = rng.choice(cities)
+    # Pareto-skewed owner: user 0 owns the largest share
+    owner = owners[min(int(rng.paretovariate(1.2)) - 1, len(owners) - 1)]
+    place = {
+        "owner": owner,
+        "name": name,
+        "city": city,
+        "notes": " ".join(rng.choices(NOTE_WORDS, k=rng.randint(0, 12))),
+        "tags": rng.sample(TAGS, rng.randint(0, 3)),
+        "photo": rng.choice(photos) if photos and rng.random() < PHOTO_SHARE else None,
+        "created_at": (EPOCH + timedelta(seconds=rng.randrange(HISTORY_DAYS * 86400))).isoformat(timespec="seconds"),
+        **{k: rng.randint(1, 5) for k in RATING_FIELDS},
+    }
+    if rng.random() < COORDS_SHARE:
+        r = CITY_SPREAD_KM * math.sqrt(rng.random()) / 111.2
+        a = rng.uniform(0, 2 * math.pi)
+        place.update(
+            lat=lat + r * math.sin(a),
+            lon=lon + r * math.cos(a) / max(0.01, math.cos(math.radians(lat))),
+            geo_status="ok",
+        )
+    else:
+        place["geo_status"] = "not_found"
+    return place
+
+
+def generate(data_dir: str, places: int, seed: int = SEED, batch: int = 5_000) -> dict:
+    """Build the dataset in `data_dir` (which must not hold one yet); returns its manifest."""
+    rng = random.Random(seed)
+    store = Store(os.path.join(data_dir, "trustbites.db"))
+    blobs = BlobStore(root=os.path.join(data_dir, "blobs"))
+    gaz = Gazetteer()
+    cities = [(gaz.names[i], gaz.lats[i], gaz.lons[i]) for i in range(len(gaz))] or [("Lisbon", 38.7223, -9.1393)]
+
+    photos = make_photos(blobs, DISTINCT_PHOTOS, rng)
+    users = make_users(store, user_count(places), rng)
+    for start in range(0, places, batch):
+        store.add_places(
+            (make_place(rng, users, cities, photos) for _ in range(min(batch, places - start))),
+            event=lambda p: ("add", f"Added {p['name']} in {p['city']}."),
+        )
+    make_follows(store, users, rng)
+    store.close()
+
+    manifest = {"places": places, "users": len(users), "seed": seed, "user": users[0], "password": PASSWORD}
+    with open(os.path.join(data_dir, MANIFEST), "w") as f:
+        json.dump(manifest, f)
+    return manifest
+
+
+def load_or_generate(data_dir: str, places: int, seed: int = SEED) -> dict:
+    """The dataset in `data_dir`, generated first if it isn't complete."""
+    try:
+        with open(os.path.join(data_dir, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        pass
+    # a missing manifest means a run that was interrupted: start over
+    for name in ("trustbites.db", "trustbites.db-wal", "trustbites.db-shm"):
+        try:
+            os.remove(os.path.join(data_dir, name))
+        except FileNotFoundError:
+            pass
+    os.makedirs(data_dir, exist_ok=True)
+    return generate(data_dir, places, seed)
@@ -0,0 +1,201 @@
+"""
+Export of places to CSV, GeoJSON and Parquet.
+
+An export runs on a background thread and streams: places are read from
+the store a page at a time (`Store.iter_places`, the same filters and
+order as My list), turned into flat rows by a generator and written out as
+they come, so neither memory nor the store's read lock grows with the
+size of the export. Parquet is written one row group at a time.
+
+Photos are never inlined. By default the `photo` column holds the URL of
+the photo on this server; with `archive=True` the export is a zip holding
+the data file plus `photos/<digest>.jpg` for every photo, and the column
+holds that path. Finished files land in `static/exports/` under a random
+name (the page links to them with a download attribute) and are deleted
+after EXPORT_TTL seconds, along with their jobs.
+"""
+import csv
+import io
+import json
+import os
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from uuid import uuid4
+
+from instrument import span
+from photos import STATIC_DIR
+
+
+EXPORT_DIR = os.path.join(STATIC_DIR, "exports")
+EXPORT_URL = "app/static/exports"
+EXPORT_TTL = 3600   # seconds a finished export stays downloadable
+PARQUET_ROW_GROUP = 10_000
+
+FORMATS = {"CSV": "csv", "GeoJSON": "geojson", "Parquet": "parquet"}
+COLUMNS = (
+    "id", "name", "city", "food", "service", "location", "price",
+    "notes", "tags", "lat", "lon", "created_at", "photo",
+)
+
+
+# ---------- ROWS ----------
+def export_rows(places, photo_ref, photos=None):
+    """Flat export rows for `places`; `photo_ref(digest)` gives the photo
+    column and every digest is also added to the `photos` set if given."""
+    for p in places:
+        row = {c: p.get(c) for c in COLUMNS}
+        if row["photo"]:
+            if photos is not None:
+                photos.add(row["photo"])
+            row["photo"] = photo_ref(row["photo"])
+        yield row
+
+
+def write_csv(rows, out):
+    text = io.TextIOWrapper(out, encoding="utf-8", newline="")
+    try:
+        writer = csv.writer(text)
+        writer.writerow(COLUMNS)
+        for row in rows:
+            writer.writerow([", ".join(row[c]) if c == "tags" else row[c] for c in COLUMNS])
+        text.flush()
+    finally:
+        text.detach()   # the caller owns `out`
+
+
+def write_geojson(rows, out):
+    out.write(b'{"type": "FeatureCollection", "features": [\n')
+    for i, row in enumerate(rows):
+        lat, lon = row["lat"], row["lon"]
+        feature = {
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [lon, lat]} if lat is not None else None,
+            "properties": {c: row[c] for c in COLUMNS if c not in ("lat", "lon")},
+        }
+        out.write((",\n" if i else "").encode() + json.dumps(feature, ensure_ascii=False).encode())
+    out.write(b"\n]}\n")
+
+
+def write_parquet(rows, out):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("id", pa.string()), ("name", pa.string()), ("city", pa.string()),
+        ("food", pa.int8()), ("service", pa.int8()), ("location", pa.int8()), ("price", pa.int8()),
+        ("notes", pa.string()), ("tags", pa.list_(pa.string())),
+        ("lat", pa.float64()), ("lon", pa.float64()),
+        ("created_at", pa.string()), ("photo", pa.string()),
+    ])
+    with pq.ParquetWriter(out, schema) as writer:
+        group = []
+        for row in rows:
+            group.append(row)
+            if len(group) == PARQUET_ROW_GROUP:
+                writer.write_table(pa.Table.from_pylist(group, schema=schema))
+                group = []
+        if group:
+            writer.write_table(pa.Table.from_pylist(group, schema=schema))
+
+
+WRITERS = {"csv": write_csv, "geojson": write_geojson, "parquet": write_parquet}
+
+
+# ---------- JOBS ----------
+class ExportJob:
+    def __init__(self, fmt: str, archive: bool, total: int):
+        self.id = uuid4().hex
+        self.fmt = fmt
+        self.archive = archive
+        self.total = total
+        self.rows = 0
+        self.status = "queued"   # -> running -> done | failed
+        self.error = None
+        self.filename = f"trustbites-places.{'zip' if archive else fmt}"
+        self.url = None
+        self.finished_at = None   # time.time() once done or failed
+
+    def _count(self, rows):
+        for row in rows:
+            self.rows += 1
+            yield row
+
+
+class Exporter:
+    """Runs exports one at a time on a worker thread; jobs are kept by id."""
+
+    def __init__(self, blobs, out_dir: str = EXPORT_DIR, url_prefix: str = EXPORT_URL):
+        self.blobs = blobs
+        self.out_dir = out_dir
+        self.url_prefix = url_prefix
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="trustbites-export")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def start(self, store, fmt: str, archive: bool = False, owner=None, q: str = "", tags=(), sort: str = "Newest", near=None) -> ExportJob:
+        """Queue an export of the places matching the My list filters."""
+        if fmt not in WRITERS:
+            raise ValueError(f"unknown export format: {fmt}")
+        job = ExportJob(fmt, archive, store.count_places(owner=owner, q=q, tags=tags, near=near))
+        with self._lock:
+            self._jobs[job.id] = job
+        places = store.iter_places(owner=owner, q=q, tags=tags, sort=sort, near=near)
+        self._pool.submit(self._run, job, places)
+        return job
+
+    def get(self, job_id: str):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job: ExportJob, places):
+        job.status = "running"
+        os.makedirs(self.out_dir, exist_ok=True)
+        self.purge_expired()
+        name = f"{job.id}-{job.filename}"
+        tmp = os.path.join(self.out_dir, f".{name}.tmp")
+        try:
+            with span("export.run"), open(tmp, "wb") as out:
+                if job.archive:
+                    self._write_archive(job, places, out)
+                else:
+                    rows = export_rows(places, lambda digest: self.blobs.url(digest, "full"))
+                    WRITERS[job.fmt](job._count(rows), out)
+            os.replace(tmp, os.path.join(self.out_dir, name))
+        except Exception as e:
+            job.status, job.error = "failed", str(e)
+            job.finished_at = time.time()
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return
+        job.url = f"{self.url_prefix}/{name}"
+        job.finished_at = time.time()
+        job.status = "done"
+
+    def _write_archive(self, job: ExportJob, places, out):
+        photos = set()
+        rows = export_rows(places, lambda digest: f"photos/{digest}.jpg", photos)
+        with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as zf:
+            with zf.open(f"places.{job.fmt}", "w", force_zip64=True) as entry:
+                WRITERS[job.fmt](job._count(rows), entry)
+            for digest in sorted(photos):
+                path = self.blobs.path(digest, "full")
+                if os.path.exists(path):
+                    # JPEGs don't shrink any further
+                    zf.write(path, f"photos/{digest}.jpg", compress_type=zipfile.ZIP_STORED)
+
+    def purge_expired(self):
+        """Delete export files older than EXPORT_TTL and forget the jobs that
+        finished before then (their files are gone or never existed)."""
+        cutoff = time.time() - EXPORT_TTL
+        with self._lock:
+            for job_id in [i for i, job in self._jobs.items() if job.finished_at is not None and job.finished_at < cutoff]:
+                del self._jobs[job_id]
+        for name in os.listdir(self.out_dir):
+            path = os.path.join(self.out_dir, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                continue
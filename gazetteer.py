@@ -0,0 +1,188 @@
+"""
+Offline city gazetteer: city-level geocoding without a network call.
+
+Loads a GeoNames-style cities file (the tab-separated `cities500.txt` /
+`cities15000.txt` layout) into flat arrays. Reverse lookups use a k-d tree
+over unit-sphere coordinates, so the nearest city is found in O(log n)
+without any trigonometry in the inner loop; forward lookups use an exact
+index on accent-folded names plus a sorted key list for prefix search.
+
+The app ships a small sample in `data/cities.tsv`. Point
+`TRUSTBITES_GAZETTEER` at a full GeoNames dump for worldwide coverage.
+"""
+import bisect
+import math
+import os
+import unicodedata
+from array import array
+
+
+GAZETTEER_PATH = os.environ.get(
+    "TRUSTBITES_GAZETTEER",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "cities.tsv"),
+)
+
+# Reverse lookups farther than this from every known city return None.
+MAX_REVERSE_KM = float(os.environ.get("TRUSTBITES_GAZETTEER_MAX_KM", 40))
+
+EARTH_RADIUS_KM = 6371.0
+_LEAF_SIZE = 8
+
+# GeoNames column positions
+_NAME, _ASCII, _ALT, _LAT, _LON, _COUNTRY, _POPULATION = 1, 2, 3, 4, 5, 8, 14
+
+
+def fold(text: str) -> str:
+    """Lowercase, strip accents and punctuation, collapse whitespace ("São  Paulo" -> "sao paulo")."""
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = "".join(ch if ch.isalnum() else " " for ch in text.lower())
+    return " ".join(text.split())
+
+
+def _unit_vector(lat: float, lon: float):
+    la, lo = math.radians(lat), math.radians(lon)
+    c = math.cos(la)
+    return c * math.cos(lo), c * math.sin(lo), math.sin(la)
+
+
+def _chord2_to_km(chord2: float) -> float:
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(chord2) / 2))
+
+
+class Gazetteer:
+    def __init__(self, path: str = GAZETTEER_PATH):
+        self.names = []
+        self.countries = []
+        self.lats = array("d")
+        self.lons = array("d")
+        self.population = array("q")
+        self._by_name = {}   # folded name -> city indices, most populous first
+        self._keys = []      # sorted folded names, for prefix search
+
+        if os.path.exists(path):
+            self._load(path)
+        self._build_name_index()
+        self._build_tree()
+
+    def __len__(self):
+        return len(self.names)
+
+    # ----- loading -----
+    def _load(self, path: str):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip() or line.startswith("#"):
+                    continue
+                cols = line.rstrip("\n").split("\t")
+                try:
+                    lat, lon = float(cols[_LAT]), float(cols[_LON])
+                except (IndexError, ValueError):
+                    continue
+                i = len(self.names)
+                self.names.append(cols[_NAME])
+                self.countries.append(cols[_COUNTRY] if len(cols) > _COUNTRY else "")
+                self.lats.append(lat)
+                self.lons.append(lon)
+                pop = cols[_POPULATION] if len(cols) > _POPULATION else ""
+                self.population.append(int(pop) if pop.isdigit() else 0)
+
+                aliases = {cols[_NAME], cols[_ASCII] if len(cols) > _ASCII else ""}
+                if len(cols) > _ALT and cols[_ALT]:
+                    aliases.update(cols[_ALT].split(","))
+                for alias in aliases:
+                    key = fold(alias)
+                    # skip scripts we can't match against typed Latin input
+                    if key and key.isascii():
+                        self._by_name.setdefault(key, []).append(i)
+
+    def _build_name_index(self):
+        for ids in self._by_name.values():
+            ids.sort(key=lambda i: -self.population[i])
+        self._keys = sorted(self._by_name)
+
+    # ----- k-d tree -----
+    def _build_tree(self):
+        """Lay the points out in k-d tree order: each [lo, hi) range splits at its
+        middle element on axis depth % 3, so the tree needs no node objects."""
+        pts = [_unit_vector(la, lo) for la, lo in zip(self.lats, self.lons)]
+        order = list(range(len(pts)))
+
+        stack = [(0, len(order), 0)]
+        while stack:
+            lo, hi, depth = stack.pop()
+            if hi - lo <= _LEAF_SIZE:
+                continue
+            axis = depth % 3
+            order[lo:hi] = sorted(order[lo:hi], key=lambda i: pts[i][axis])
+            mid = (lo + hi) // 2
+            stack.append((lo, mid, depth + 1))
+            stack.append((mid + 1, hi, depth + 1))
+
+        self._tree_ids = array("l", order)
+        self._tx = array("d", (pts[i][0] for i in order))
+        self._ty = array("d", (pts[i][1] for i in order))
+        self._tz = array("d", (pts[i][2] for i in order))
+
+    def nearest(self, lat: float, lon: float):
+        """Return (city index, distance in km) of the nearest city, or None if empty."""
+        if not self.names:
+            return None
+        q = _unit_vector(lat, lon)
+        coords = (self._tx, self._ty, self._tz)
+        tx, ty, tz = coords
+        best = [float("inf"), -1]
+
+        def search(lo, hi, depth):
+            if hi - lo <= _LEAF_SIZE:
+                for j in range(lo, hi):
+                    d = (tx[j] - q[0]) ** 2 + (ty[j] - q[1]) ** 2 + (tz[j] - q[2]) ** 2
+                    if d < best[0]:
+                        best[0], best[1] = d, j
+                return
+            mid = (lo + hi) // 2
+            d = (tx[mid] - q[0]) ** 2 + (ty[mid] - q[1]) ** 2 + (tz[mid] - q[2]) ** 2
+            if d < best[0]:
+                best[0], best[1] = d, mid
+            axis = depth % 3
+            diff = q[axis] - coords[axis][mid]
+            near, far = ((lo, mid), (mid + 1, hi)) if diff < 0 else ((mid + 1, hi), (lo, mid))
+            search(near[0], near[1], depth + 1)
+            if diff * diff < best[0]:
+                search(far[0], far[1], depth + 1)
+
+        search(0, len(self._tree_ids), 0)
+        return self._tree_ids[best[1]], _chord2_to_km(best[0])
+
+    # ----- public lookups -----
+    def reverse_city(self, lat: float, lon: float, max_km: float = MAX_REVERSE_KM):
+        """Name of the closest city within `max_km`, else None."""
+        hit = self.nearest(lat, lon)
+        if hit is None or hit[1] > max_km:
+            return None
+        return self.names[hit[0]]
+
+    def lookup(self, query: str):
+        """(lat, lon) of the most populous city called `query` ("Lisbon", "lisboa", "Lisbon, PT")."""
+        key = fold(query)
+        ids = self._by_name.get(key)
+        if not ids and "," in query:
+            ids = self._by_name.get(fold(query.split(",")[0]))
+        if not ids:
+            return None
+        i = ids[0]
+        return self.lats[i], self.lons[i]
+
+    def suggest(self, prefix: str, limit: int = 10):
+        """City names whose folded name starts with `prefix`, most populous first."""
+        key = fold(prefix)
+        if not key:
+            return []
+        start = bisect.bisect_left(self._keys, key)
+        ids = set()
+        for k in self._keys[start:]:
+            if not k.startswith(key):
+                break
+            ids.update(self._by_name[k])
+        ranked = sorted(ids, key=lambda i: -self.population[i])[:limit]
+        return [self.names[i] for i in ranked]
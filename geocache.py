@@ -0,0 +1,191 @@
+"""
+Two-tier cache for geocoding lookups.
+
+An in-memory LRU sits in front of a small SQLite table on disk, so repeated
+queries ("Lisbon", a click next to an earlier click) are answered without a
+Nominatim round trip, across sessions and across restarts. Positive answers,
+"nothing found" answers and failures each get their own TTL. Expired rows
+are skipped on read and deleted when the app starts and then, on a write,
+at most every PURGE_INTERVAL seconds, so the table doesn't keep growing.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from storage import DATA_DIR
+
+
+CACHE_PATH = os.path.join(DATA_DIR, "geocache.db")
+
+# TTLs in seconds, overridable from the environment.
+POSITIVE_TTL = float(os.environ.get("TRUSTBITES_GEOCACHE_TTL", 30 * 24 * 3600))
+NEGATIVE_TTL = float(os.environ.get("TRUSTBITES_GEOCACHE_NEGATIVE_TTL", 24 * 3600))
+ERROR_TTL = float(os.environ.get("TRUSTBITES_GEOCACHE_ERROR_TTL", 60))
+MEMORY_SIZE = int(os.environ.get("TRUSTBITES_GEOCACHE_SIZE", 2048))
+PURGE_INTERVAL = 3600   # seconds between sweeps of expired rows
+
+# Reverse lookups are snapped to this grid (degrees, ~1.1 km at 0.01)
+# so that clicks close to each other share one cache entry.
+REVERSE_GRID_DEG = float(os.environ.get("TRUSTBITES_REVERSE_GRID", 0.01))
+
+_FAILED = {"__failed__": True}
+# Returned by `cached(..., default=LOOKUP_FAILED)` when the lookup failed, so
+# a caller can tell "the service is down" from "nothing found" (None).
+LOOKUP_FAILED = object()
+
+
+class LookupFailed(RuntimeError):
+    """A lookup failed (timeout, server error, open circuit); worth retrying later."""
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+def snap_to_grid(lat: float, lon: float, grid: float = REVERSE_GRID_DEG):
+    """Return the centre of the grid cell containing (lat, lon)."""
+    return round(round(lat / grid) * grid, 6), round(round(lon / grid) * grid, 6)
+
+
+class GeoCache:
+    def __init__(
+        self,
+        path: str = CACHE_PATH,
+        maxsize: int = MEMORY_SIZE,
+        ttl: float = POSITIVE_TTL,
+        negative_ttl: float = NEGATIVE_TTL,
+        error_ttl: float = ERROR_TTL,
+    ):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.error_ttl = error_ttl
+
+        self._lock = threading.Lock()
+        self._mem = OrderedDict()   # key -> (expires_at, value)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS geocache ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_geocache_expires ON geocache(expires_at)")
+        self._conn.commit()
+        self._purged_at = 0.0
+
+        self.counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "errors": 0,
+            "lookup_seconds": 0.0,   # time spent on real lookups (misses)
+        }
+
+    # ----- tiers -----
+    def _mem_get(self, key, now):
+        hit = self._mem.get(key)
+        if hit is None:
+            return None
+        if hit[0] <= now:
+            del self._mem[key]
+            return None
+        self._mem.move_to_end(key)
+        return hit
+
+    def _mem_put(self, key, expires_at, value):
+        self._mem[key] = (expires_at, value)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.maxsize:
+            self._mem.popitem(last=False)
+
+    def get(self, key: str):
+        """Return (found, value). `value` may be None for a cached "no result"."""
+        now = time.time()
+        with self._lock:
+            hit = self._mem_get(key, now)
+            if hit is not None:
+                self.counters["memory_hits"] += 1
+                return True, hit[1]
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM geocache WHERE key = ?", (key,)
+            ).fetchone()
+            if row and row[1] > now:
+                value = json.loads(row[0])
+                self._mem_put(key, row[1], value)
+                self.counters["disk_hits"] += 1
+                return True, value
+        return False, None
+
+    def put(self, key: str, value, ttl: float):
+        now = time.time()
+        if now - self._purged_at > PURGE_INTERVAL:
+            self.purge_expired()
+        expires_at = now + ttl
+        with self._lock:
+            self._mem_put(key, expires_at, value)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO geocache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires_at),
+            )
+            self._conn.commit()
+
+    def cached(self, key: str, lookup, default=None):
+        """Return the cached answer for `key`, calling `lookup()` on a miss.
+
+        `lookup` returns a JSON-serialisable value, or None when nothing was
+        found, and raises on failure. Failures are remembered for
+        `error_ttl` seconds and reported as `default`.
+        """
+        found, value = self.get(key)
+        if found:
+            return default if value == _FAILED else value
+
+        started = time.perf_counter()
+        try:
+            value = lookup()
+        except Exception:
+            value = None
+            failed = True
+        else:
+            failed = False
+        elapsed = time.perf_counter() - started
+
+        with self._lock:
+            self.counters["misses"] += 1
+            self.counters["lookup_seconds"] += elapsed
+            if failed:
+                self.counters["errors"] += 1
+
+        if failed:
+            self.put(key, _FAILED, self.error_ttl)
+            return default
+        self.put(key, value, self.ttl if value is not None else self.negative_ttl)
+        return value
+
+    def purge_expired(self):
+        """Delete expired entries from both tiers."""
+        now = time.time()
+        with self._lock:
+            self._purged_at = now
+            for key in [k for k, (exp, _) in self._mem.items() if exp <= now]:
+                del self._mem[key]
+            self._conn.execute("DELETE FROM geocache WHERE expires_at <= ?", (now,))
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            c = dict(self.counters)
+            c["memory_entries"] = len(self._mem)
+        hits = c["memory_hits"] + c["disk_hits"]
+        lookups = hits + c["misses"]
+        avg_miss = c["lookup_seconds"] / c["misses"] if c["misses"] else 0.0
+        c["hit_rate"] = hits / lookups if lookups else 0.0
+        c["avg_lookup_seconds"] = avg_miss
+        # every hit saves roughly one average miss
+        c["saved_seconds"] = hits * avg_miss
+        return c
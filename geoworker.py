@@ -0,0 +1,155 @@
+"""
+Background geocoding for newly saved places.
+
+Saving a place no longer waits on Nominatim: the page enqueues the place and
+returns, and one process-wide worker thread resolves the queue and writes
+the coordinates back. Identical queries waiting in the queue are merged into
+a single lookup, and every request to Nominatim goes through a token bucket
+so the whole process stays within the 1 request/second usage policy.
+
+A lookup that fails (Nominatim down, timing out or behind an open circuit)
+is not a "not found": its places stay pending and the job is queued again
+after a delay that doubles with each failure, up to RETRY_MAX_DELAY.
+"""
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from geocache import LookupFailed, normalize_query
+
+
+log = logging.getLogger(__name__)
+
+NOMINATIM_RPS = float(os.environ.get("TRUSTBITES_NOMINATIM_RPS", 1.0))
+RETRY_DELAY = 60.0        # seconds before a failed job is first retried
+RETRY_MAX_DELAY = 3600.0
+
+
+def place_queries(name: str, city: str):
+    """Queries tried in order for a place: full name + city, then the city alone."""
+    return [f"{name} {city}".strip(), city.strip()]
+
+
+class TokenBucket:
+    """Blocking token bucket: `rate` tokens per second, bursts up to `capacity`."""
+
+    def __init__(self, rate: float = NOMINATIM_RPS, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class GeocodeWorker:
+    """Resolves queued places on a daemon thread.
+
+    `geocode(query)` returns (lat, lon) or None, and raises when the lookup
+    failed; `on_result(place_ids, coords)` is called once per answered job
+    with every place that was waiting on it. Each job is a tuple of queries
+    tried in order, e.g. ("name city", "city").
+    """
+
+    def __init__(self, geocode, on_result, retry_delay: float = RETRY_DELAY):
+        self._geocode = geocode
+        self._on_result = on_result
+        self.retry_delay = retry_delay
+        self._pending = OrderedDict()   # queries -> [place ids]
+        self._retries = []   # heap of (due, seq, queries, place ids, failures)
+        self._failures = {}  # queries -> consecutive failures of a job being retried
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self.counters = {"submitted": 0, "coalesced": 0, "resolved": 0, "not_found": 0, "failed": 0}
+        self._thread = threading.Thread(
+            target=self._run, name="trustbites-geocoder", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, place_id: str, queries):
+        self.submit_many([(place_id, queries)])
+
+    def submit_many(self, jobs):
+        """Queue [(place_id, queries)] at once, e.g. a batch of imported places."""
+        jobs = [
+            (place_id, tuple(dict.fromkeys(q for q in map(normalize_query, queries) if q)))
+            for place_id, queries in jobs
+        ]
+        with self._cond:
+            for place_id, queries in jobs:
+                if not queries:
+                    continue
+                self.counters["submitted"] += 1
+                waiting = self._pending.get(queries)
+                if waiting is None:
+                    self._pending[queries] = [place_id]
+                elif place_id not in waiting:   # already queued: once is enough
+                    waiting.append(place_id)
+                    self.counters["coalesced"] += 1
+            self._cond.notify()
+
+    def pending(self) -> int:
+        """Places queued or waiting for a retry."""
+        with self._cond:
+            return sum(len(ids) for ids in self._pending.values()) + sum(len(r[3]) for r in self._retries)
+
+    def _next_job(self):
+        """Wait for a queued job, moving retries that are due into the queue."""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                while self._retries and self._retries[0][0] <= now:
+                    _, _, queries, place_ids, _ = heapq.heappop(self._retries)
+                    self._pending.setdefault(queries, []).extend(place_ids)
+                if self._pending:
+                    return self._pending.popitem(last=False)
+                self._cond.wait(self._retries[0][0] - now if self._retries else None)
+
+    def _retry_later(self, queries, place_ids):
+        failures = self._failures.get(queries, 0) + 1
+        delay = min(RETRY_MAX_DELAY, self.retry_delay * 2 ** (failures - 1))
+        with self._cond:
+            self._failures[queries] = failures
+            heapq.heappush(self._retries, (time.monotonic() + delay, next(self._seq), queries, place_ids, failures))
+        self.counters["failed"] += 1
+        return delay
+
+    def _run(self):
+        while True:
+            queries, place_ids = self._next_job()
+
+            coords = None
+            try:
+                for q in queries:
+                    coords = self._geocode(q)
+                    if coords:
+                        break
+            except Exception as e:
+                delay = self._retry_later(queries, place_ids)
+                if isinstance(e, LookupFailed):
+                    log.warning("%s; retrying %d places in %.0fs", e, len(place_ids), delay)
+                else:
+                    log.exception("Geocoding %s failed; retrying in %.0fs", queries, delay)
+                continue
+            self._failures.pop(queries, None)
+            self.counters["resolved" if coords else "not_found"] += 1
+
+            try:
+                self._on_result(place_ids, coords)
+            except Exception:
+                log.exception("Could not store geocoding result for %s", place_ids)
@@ -0,0 +1,181 @@
+"""
+Shared HTTP client for outbound calls (currently Nominatim).
+
+One pooled `requests.Session` keeps connections alive between calls, failed
+requests are retried a bounded number of times with jittered exponential
+backoff, and a per-host circuit breaker fails fast while a service is down
+instead of letting every caller wait out the timeout. Latency is recorded
+per endpoint in fixed-bucket histograms (see instrument.py).
+"""
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from instrument import LatencyHistogram, count, timed
+
+
+USER_AGENT = "TrustBites/0.1 (student project)"
+
+# Upper bounds (seconds) of the latency histogram buckets; the last bucket is +Inf.
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of making a request while the host's circuit is open."""
+
+
+class RetryableStatus(requests.HTTPError):
+    pass
+
+
+class CircuitBreaker:
+    """closed -> open after `failure_threshold` consecutive failures;
+    open -> half_open after `reset_timeout` seconds, letting one probe through;
+    the probe's outcome closes or re-opens the circuit."""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                self._probing = False
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+
+class HttpClient:
+    def __init__(
+        self,
+        user_agent: str = USER_AGENT,
+        timeout: float = 5.0,
+        retries: int = 2,
+        backoff: float = 0.5,
+        pool_size: int = 4,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+    ):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = user_agent
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._lock = threading.Lock()
+        self.breakers = {}     # host -> CircuitBreaker
+        self.histograms = {}   # "host/path" -> LatencyHistogram
+
+    def _breaker(self, host: str) -> CircuitBreaker:
+        with self._lock:
+            if host not in self.breakers:
+                self.breakers[host] = CircuitBreaker(self._failure_threshold, self._reset_timeout)
+            return self.breakers[host]
+
+    def _histogram(self, endpoint: str) -> LatencyHistogram:
+        with self._lock:
+            if endpoint not in self.histograms:
+                self.histograms[endpoint] = LatencyHistogram(LATENCY_BUCKETS)
+            return self.histograms[endpoint]
+
+    def _sleep_before_retry(self, attempt: int, resp=None):
+        delay = random.uniform(0, self.backoff * 2 ** attempt)   # full jitter
+        if resp is not None and resp.headers.get("Retry-After", "").isdigit():
+            delay = max(delay, float(resp.headers["Retry-After"]))
+        time.sleep(delay)
+
+    @timed("http.get")
+    def get_json(self, url: str, params=None, limiter=None):
+        """GET `url` and decode JSON.
+
+        `limiter` (anything with `acquire()`) is consulted before every
+        attempt, retries included. Raises CircuitOpenError without touching
+        the network while the host's circuit is open.
+        """
+        parts = urlsplit(url)
+        breaker = self._breaker(parts.netloc)
+        histogram = self._histogram(parts.netloc + parts.path)
+
+        for attempt in range(self.retries + 1):
+            if not breaker.allow():
+                raise CircuitOpenError(f"{parts.netloc} is unavailable, not retrying yet")
+            if limiter is not None:
+                limiter.acquire()
+
+            count("http.requests")
+            resp = None
+            started = time.perf_counter()
+            try:
+                resp = self.session.get(url, params=params, timeout=self.timeout)
+                if resp.status_code in RETRY_STATUSES:
+                    raise RetryableStatus(f"{resp.status_code} from {url}", response=resp)
+                resp.raise_for_status()
+                data = resp.json()
+            except (requests.ConnectionError, requests.Timeout, RetryableStatus):
+                histogram.observe(time.perf_counter() - started)
+                breaker.record_failure()
+                if attempt == self.retries:
+                    raise
+                self._sleep_before_retry(attempt, resp)
+                continue
+            except Exception:
+                # 4xx or a malformed body: the host is up, retrying won't help
+                histogram.observe(time.perf_counter() - started)
+                breaker.record_success()
+                raise
+
+            histogram.observe(time.perf_counter() - started)
+            breaker.record_success()
+            return data
+
+    def stats(self) -> dict:
+        with self._lock:
+            breakers = dict(self.breakers)
+            histograms = dict(self.histograms)
+        return {
+            "breakers": {host: b.state for host, b in breakers.items()},
+            "latency": {
+                endpoint: {
+                    **h.snapshot(),
+                    "p50": h.quantile(0.5),
+                    "p95": h.quantile(0.95),
+                }
+                for endpoint, h in histograms.items()
+            },
+        }
@@ -0,0 +1,341 @@
+"""
+Bulk import of places from CSV, GeoJSON and Google Takeout files.
+
+Files are read as a stream, one row or feature at a time: CSV through
+`csv.DictReader`, GeoJSON by decoding the `features` array an element at
+a time out of a sliding buffer, so memory stays flat whatever the file
+size. Columns and properties are matched to the place schema through a
+list of aliases, which also covers Google Takeout's "Saved Places.json"
+(place details nested under `location`) and its saved-list CSVs.
+
+Places are inserted in batches, one transaction each, and every batch
+also saves the import's checkpoint (the `imports` table in storage.py): an
+import cut short by a bad row, a closed tab or a restart resumes after the
+last committed batch when the same file is imported again. Rows without
+coordinates are saved as pending and handed to the background geocoder a
+batch at a time; rows that can't be used are counted and skipped, and the
+first few reasons are kept.
+
+From the command line (pending places are geocoded the next time the app
+starts): `python importer.py FILE --owner EMAIL`.
+"""
+import csv
+import hashlib
+import io
+import itertools
+import json
+import re
+from datetime import datetime, timezone
+
+from geoworker import place_queries
+from storage import RATING_FIELDS
+
+
+BATCH_SIZE = 500
+CHUNK_SIZE = 64 * 1024         # bytes read at a time from a GeoJSON file
+FINGERPRINT_BYTES = 64 * 1024  # a file is recognized by its head and its size
+MAX_ERRORS_KEPT = 20
+
+# place field -> accepted column / property names, normalized by _field_key
+FIELD_ALIASES = {
+    "name": ("name", "title", "business_name", "place", "restaurant"),
+    "city": ("city", "town", "locality", "village"),
+    "address": ("address", "formatted_address"),
+    "notes": ("notes", "note", "comment", "description"),
+    "tags": ("tags", "labels", "categories", "category"),
+    "lat": ("lat", "latitude"),
+    "lon": ("lon", "lng", "long", "longitude"),
+    "created_at": ("created_at", "date", "published", "updated", "added"),
+    **{field: (field,) for field in RATING_FIELDS},
+}
+TAG_SEPARATORS = re.compile(r"[,;|]")
+_FEATURES_START = re.compile(r'"features"\s*:\s*\[')
+
+
+def _field_key(name: str) -> str:
+    return re.sub(r"[\s\-]+", "_", str(name).strip().lower())
+
+
+# ---------- READERS ----------
+def sniff_format(filename: str, head: bytes) -> str:
+    """"csv" or "geojson", from the extension or else the first character."""
+    ext = filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
+    if ext in ("json", "geojson"):
+        return "geojson"
+    if ext == "csv":
+        return "csv"
+    return "geojson" if head.lstrip(b"\xef\xbb\xbf \t\r\n")[:1] in (b"{", b"[") else "csv"
+
+
+def iter_csv(text):
+    """Rows of a CSV file as dicts; the delimiter (, ; or tab) is taken from the header."""
+    header = text.readline()
+    delimiter = max(",;\t", key=header.count)
+    reader = csv.DictReader(itertools.chain([header], text), delimiter=delimiter)
+    try:
+        for row in reader:
+            yield {k: v for k, v in row.items() if k is not None}
+    except csv.Error as e:
+        raise ValueError(f"unreadable CSV near line {reader.line_num}: {e}") from None
+
+
+def iter_geojson(text, chunk_size: int = CHUNK_SIZE):
+    """Elements of a FeatureCollection's `features` array (or of a top-level
+    array), decoded one at a time."""
+    decoder = json.JSONDecoder()
+    buf, pos, eof = "", 0, False
+
+    def more():
+        nonlocal buf, pos, eof
+        chunk = text.read(chunk_size)
+        eof = not chunk
+        buf, pos = buf[pos:] + chunk, 0
+
+    # find where the array starts, keeping a little tail in case the key
+    # straddles two chunks
+    while True:
+        more()
+        m = _FEATURES_START.search(buf)
+        if m:
+            pos = m.end()
+            break
+        stripped = buf.lstrip()
+        if stripped.startswith("["):
+            pos = len(buf) - len(stripped) + 1
+            break
+        if eof:
+            raise ValueError("no GeoJSON features found")
+        pos = max(0, len(buf) - 32)
+
+    while True:
+        while pos < len(buf) and buf[pos] in " \t\r\n,":
+            pos += 1
+        if pos == len(buf):
+            if eof:
+                raise ValueError("the GeoJSON file ends in the middle of the features")
+            more()
+            continue
+        if buf[pos] == "]":
+            return
+        try:
+            feature, pos = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise ValueError("malformed GeoJSON feature") from None
+            more()   # the feature continues in the next chunk
+            continue
+        yield feature
+
+
+def feature_record(feature) -> dict:
+    """Flat {property: value} for a GeoJSON feature, coordinates as lat/lon."""
+    if not isinstance(feature, dict):
+        return {}
+    props = dict(feature.get("properties") or {})
+    # Google Takeout nests the place under "location" (older exports:
+    # "Location", with "Geo Coordinates" instead of a geometry)
+    for key in ("location", "Location"):
+        if isinstance(props.get(key), dict):
+            nested = dict(props.pop(key))
+            geo = nested.pop("Geo Coordinates", None)
+            if isinstance(geo, dict):
+                nested.update(geo)
+            props = {**nested, **props}
+    geometry = feature.get("geometry") or {}
+    coords = geometry.get("coordinates")
+    # Takeout writes [0, 0] for a place it has no coordinates for
+    if geometry.get("type") == "Point" and isinstance(coords, list) and len(coords) >= 2 and any(coords[:2]):
+        props.setdefault("lon", coords[0])
+        props.setdefault("lat", coords[1])
+    return props
+
+
+# ---------- FIELD MAPPING ----------
+def _coordinate(value, limit: float):
+    try:
+        x = float(value)
+    except (TypeError, ValueError):
+        return None
+    return x if -limit <= x <= limit else None
+
+
+def _rating(field: str, value) -> int:
+    if value in (None, ""):
+        return 0
+    try:
+        return max(0, min(5, round(float(value))))
+    except (TypeError, ValueError):
+        raise ValueError(f"{field} rating {value!r} is not a number") from None
+
+
+def _timestamp(value) -> str:
+    now = datetime.utcnow().isoformat(timespec="seconds")
+    if not value:
+        return now
+    try:
+        ts = datetime.fromisoformat(str(value).strip())
+    except ValueError:
+        return now
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts.isoformat(timespec="seconds")
+
+
+def to_place(record: dict, owner: str):
+    """(place, geocoding queries) for one source row; ValueError says why a row can't be used."""
+    fields = {_field_key(k): v for k, v in record.items() if k is not None}
+
+    def pick(field):
+        for alias in FIELD_ALIASES[field]:
+            value = fields.get(alias)
+            if value not in (None, ""):
+                return value
+        return None
+
+    name = str(pick("name") or "").strip()
+    if not name:
+        raise ValueError("no name")
+    city = str(pick("city") or "").strip()
+    address = str(pick("address") or "").strip()
+
+    tags = pick("tags") or []
+    if isinstance(tags, str):
+        tags = TAG_SEPARATORS.split(tags)
+    tags = list(dict.fromkeys(str(t).strip().title() for t in tags if str(t).strip()))
+
+    lat, lon = _coordinate(pick("lat"), 90), _coordinate(pick("lon"), 180)
+    if lat is None or lon is None or (lat == 0 and lon == 0):
+        lat = lon = None
+
+    place = {
+        "owner": owner,
+        "name": name,
+        "city": city,
+        "notes": str(pick("notes") or "").strip(),
+        "tags": tags,
+        "created_at": _timestamp(pick("created_at")),
+        "lat": lat,
+        "lon": lon,
+        "geo_status": "ok" if lat is not None else "pending",
+        **{field: _rating(field, pick(field)) for field in RATING_FIELDS},
+    }
+    return place, place_queries(name, city or address)
+
+
+# ---------- IMPORT ----------
+def fingerprint(stream):
+    """(digest, head, size) of the file in `stream`, which is left where it was."""
+    start = stream.tell()
+    head = stream.read(FINGERPRINT_BYTES)
+    stream.seek(0, io.SEEK_END)
+    size = stream.tell()
+    stream.seek(start)
+    return hashlib.sha256(head + f":{size}".encode()).hexdigest()[:24], head, size
+
+
+def run_import(store, stream, filename: str, owner: str, submit_geocodes=None, batch_size: int = BATCH_SIZE):
+    """Import the places in the binary `stream`, yielding progress after every batch.
+
+    Progress is the import's checkpoint plus "fraction" (of the file read)
+    and "resumed_from" (rows already imported by an earlier attempt).
+    `submit_geocodes([(place_id, queries)])` receives each batch's places
+    that have no coordinates. A file this owner already imported in full is
+    not imported again: the single progress yielded has "already_imported" set.
+    Raises ValueError when the file itself can't be read further; the rows
+    before the last batch stay imported and a new attempt resumes after them.
+    """
+    digest, head, size = fingerprint(stream)
+    fmt = sniff_format(filename, head)
+    progress = store.get_import(f"{owner}:{digest}") or {
+        "key": f"{owner}:{digest}",
+        "owner": owner,
+        "filename": filename,
+        "rows_done": 0,
+        "imported": 0,
+        "failed": 0,
+        "errors": [],
+        "done": False,
+    }
+    resumed_from = progress["rows_done"]
+
+    def report():
+        return {**progress, "fraction": min(1.0, stream.tell() / size) if size else 1.0, "resumed_from": resumed_from}
+
+    if progress["done"]:
+        yield {**report(), "fraction": 1.0, "already_imported": True}
+        return
+
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    try:
+        records = iter_csv(text) if fmt == "csv" else map(feature_record, iter_geojson(text))
+        batch, queries = [], []
+        row = 0
+        for row, record in enumerate(records, start=1):
+            if row <= resumed_from:
+                continue
+            try:
+                place, q = to_place(record, owner)
+            except ValueError as e:
+                progress["failed"] += 1
+                if len(progress["errors"]) < MAX_ERRORS_KEPT:
+                    progress["errors"].append([row, str(e)])
+                continue
+            batch.append(place)
+            queries.append(q)
+            if len(batch) >= batch_size:
+                _commit(store, progress, batch, queries, row, submit_geocodes)
+                batch, queries = [], []
+                yield report()
+
+        if batch:
+            _commit(store, progress, batch, queries, row, submit_geocodes)
+        progress.update(done=True, rows_done=max(row, resumed_from))
+        event = ("import", f"Imported {progress['imported']} places from {filename}.") if progress["imported"] else None
+        store.save_import(progress, event=event)
+        yield report()
+    finally:
+        text.detach()   # leave the caller's stream open
+
+
+def _commit(store, progress: dict, batch, queries, row: int, submit_geocodes):
+    """Insert a batch together with the checkpoint after its last row."""
+    progress.update(rows_done=row, imported=progress["imported"] + len(batch))
+    added = store.add_places(batch, progress=progress)
+    if submit_geocodes:
+        jobs = [(p["id"], q) for p, q in zip(added, queries) if p["geo_status"] == "pending"]
+        if jobs:
+            submit_geocodes(jobs)
+
+
+def main(argv=None):
+    import argparse
+    import os
+
+    from storage import Store
+
+    parser = argparse.ArgumentParser(description="Import places into TrustBites.")
+    parser.add_argument("file", help="CSV, GeoJSON or Google Takeout saved places file")
+    parser.add_argument("--owner", required=True, help="email of the account the places belong to")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    store = Store()
+    if not store.get_user(args.owner):
+        parser.error(f"no account for {args.owner}")
+    with open(args.file, "rb") as f:
+        try:
+            for progress in run_import(store, f, os.path.basename(args.file), args.owner, batch_size=args.batch_size):
+                print(f"\r{progress['fraction']:4.0%}  {progress['imported']} imported, {progress['failed']} skipped", end="", flush=True)
+        except ValueError as e:
+            print()
+            return f"Import stopped: {e}. Run it again to continue after the last saved batch."
+    print()
+    if progress.get("already_imported"):
+        print("This file was already imported.")
+    for row, reason in progress["errors"]:
+        print(f"  row {row}: {reason}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
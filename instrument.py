@@ -0,0 +1,261 @@
+"""
+Timing spans, counters and a per-rerun trace.
+
+Code wraps the interesting work in `span("name")` (or decorates it with
+`timed("name")`) and bumps `count("name")`. Every span feeds a process-wide
+latency histogram; inside a rerun (`rerun(page)`, opened by the main script
+around the page) spans and counts are also recorded, nested and in order,
+on a trace of that rerun, which the debug panel shows. Work on other
+threads (the background geocoder) only reaches the histograms.
+
+Collectors are callables returning flat {stat: number} dicts (the geocoding
+cache, the HTTP client) read at export time. With `TRUSTBITES_METRICS_FILE`
+set, each finished rerun appends its trace as one JSON line, or, with
+`TRUSTBITES_METRICS_FORMAT=prometheus`, the file is rewritten every few
+seconds in the Prometheus text format (for node_exporter's textfile
+collector or a plain scrape of the file).
+"""
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+
+# Upper bounds (seconds) of the span histogram buckets; the last bucket is +Inf.
+SPAN_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+EXPORT_PATH = os.environ.get("TRUSTBITES_METRICS_FILE", "")
+EXPORT_FORMAT = os.environ.get("TRUSTBITES_METRICS_FORMAT", "jsonl")   # or "prometheus"
+PROMETHEUS_INTERVAL = 5.0   # seconds between rewrites of the Prometheus file
+PREFIX = "trustbites"
+
+
+def prometheus_value(value) -> str:
+    """A sample value in the exposition format (which spells infinity +Inf)."""
+    if isinstance(value, float) and not math.isfinite(value):
+        return "NaN" if math.isnan(value) else ("+Inf" if value > 0 else "-Inf")
+    return str(int(value) if isinstance(value, bool) else value)
+
+
+class LatencyHistogram:
+    def __init__(self, buckets=SPAN_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        i = 0
+        while i < len(self.buckets) and seconds > self.buckets[i]:
+            i += 1
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.total += seconds
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th observation (inf if past the last bucket)."""
+        with self._lock:
+            if not self.count:
+                return 0.0
+            rank = q * self.count
+            seen = 0
+            for bound, n in zip(self.buckets + (float("inf"),), self.counts):
+                seen += n
+                if seen >= rank:
+                    return bound
+        return float("inf")
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counts = list(self.counts)
+            count, total = self.count, self.total
+        return {
+            "count": count,
+            "sum": total,
+            "buckets": dict(zip([*map(str, self.buckets), "+Inf"], counts)),
+        }
+
+
+class Trace:
+    """What one rerun did: spans as (name, depth, start offset, duration) in
+    seconds, in the order they started, and its counts."""
+
+    def __init__(self, page: str):
+        self.page = page
+        self.ts = time.time()
+        self.started = time.perf_counter()
+        self.seconds = None   # set when the rerun ends
+        self.spans = []
+        self.counts = {}
+        self.gauges = {}
+        self._depth = 0
+
+    def elapsed(self) -> float:
+        return self.seconds if self.seconds is not None else time.perf_counter() - self.started
+
+    def to_dict(self) -> dict:
+        return {
+            "ts": round(self.ts, 3),
+            "page": self.page,
+            "ms": round(self.elapsed() * 1000, 2),
+            "spans": [
+                {"name": name, "depth": depth, "start_ms": round(start * 1000, 2), "ms": round(secs * 1000, 2)}
+                for name, depth, start, secs in self.spans
+            ],
+            "counts": dict(self.counts),
+            **self.gauges,
+        }
+
+
+class Registry:
+    def __init__(self, export_path: str = EXPORT_PATH, export_format: str = EXPORT_FORMAT):
+        self.export_path = export_path
+        self.export_format = export_format
+        self._lock = threading.Lock()
+        self._local = threading.local()   # .trace: the rerun running on this thread
+        self.histograms = {}   # span name -> LatencyHistogram
+        self.counters = {}     # name -> total count
+        self.collectors = {}   # name -> callable returning {stat: number}
+        self._exported_at = 0.0
+
+    def _histogram(self, name: str) -> LatencyHistogram:
+        with self._lock:
+            if name not in self.histograms:
+                self.histograms[name] = LatencyHistogram()
+            return self.histograms[name]
+
+    def current_trace(self):
+        return getattr(self._local, "trace", None)
+
+    @contextmanager
+    def span(self, name: str):
+        trace = self.current_trace()
+        if trace is not None:
+            slot = len(trace.spans)
+            trace.spans.append((name, trace._depth, time.perf_counter() - trace.started, 0.0))
+            trace._depth += 1
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - started
+            self._histogram(name).observe(seconds)
+            if trace is not None:
+                trace._depth -= 1
+                trace.spans[slot] = trace.spans[slot][:3] + (seconds,)
+
+    def timed(self, name: str):
+        """Decorator running the function inside `span(name)`."""
+        def decorate(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def count(self, name: str, n: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+        trace = self.current_trace()
+        if trace is not None:
+            trace.counts[name] = trace.counts.get(name, 0) + n
+
+    def register_collector(self, name: str, collect):
+        with self._lock:
+            self.collectors[name] = collect
+
+    @contextmanager
+    def rerun(self, page: str):
+        """Trace the rerun running on this thread; exported when it ends,
+        however it ends (st.rerun() and st.stop() raise)."""
+        trace = Trace(page)
+        self._local.trace = trace
+        try:
+            yield trace
+        finally:
+            self._local.trace = None
+            trace.seconds = time.perf_counter() - trace.started
+            self._histogram("rerun").observe(trace.seconds)
+            if self.export_path:
+                self._export(trace)
+
+    # ----- export -----
+    def collect(self) -> dict:
+        """{collector: {stat: number}}; a failing collector is skipped."""
+        with self._lock:
+            collectors = dict(self.collectors)
+        out = {}
+        for name, collect in collectors.items():
+            try:
+                out[name] = {k: v for k, v in collect().items() if isinstance(v, (int, float))}
+            except Exception:
+                continue
+        return out
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            histograms = dict(self.histograms)
+            counters = dict(self.counters)
+        return {
+            "spans": {
+                name: {**h.snapshot(), "p50": h.quantile(0.5), "p95": h.quantile(0.95)}
+                for name, h in sorted(histograms.items())
+            },
+            "counters": counters,
+            "collectors": self.collect(),
+        }
+
+    def prometheus_text(self) -> str:
+        snap = self.snapshot()
+        lines = [f"# TYPE {PREFIX}_span_seconds histogram"]
+        for name, h in snap["spans"].items():
+            cumulative = 0
+            for le, n in h["buckets"].items():
+                cumulative += n
+                lines.append(f'{PREFIX}_span_seconds_bucket{{span="{name}",le="{le}"}} {cumulative}')
+            lines.append(f'{PREFIX}_span_seconds_sum{{span="{name}"}} {h["sum"]:.6f}')
+            lines.append(f'{PREFIX}_span_seconds_count{{span="{name}"}} {h["count"]}')
+        lines.append(f"# TYPE {PREFIX}_events_total counter")
+        for name, n in sorted(snap["counters"].items()):
+            lines.append(f'{PREFIX}_events_total{{name="{name}"}} {n}')
+        for collector, stats in snap["collectors"].items():
+            lines.append(f"# TYPE {PREFIX}_{collector} gauge")
+            for stat, value in sorted(stats.items()):
+                lines.append(f'{PREFIX}_{collector}{{stat="{stat}"}} {prometheus_value(value)}')
+        return "\n".join(lines) + "\n"
+
+    def _export(self, trace: Trace):
+        try:
+            if self.export_format == "prometheus":
+                now = time.monotonic()
+                with self._lock:
+                    if now - self._exported_at < PROMETHEUS_INTERVAL:
+                        return
+                    self._exported_at = now
+                text = self.prometheus_text()
+                directory = os.path.dirname(os.path.abspath(self.export_path))
+                # write-then-rename so a scrape never sees half a file
+                fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+                with os.fdopen(fd, "w") as f:
+                    f.write(text)
+                os.replace(tmp, self.export_path)
+            else:
+                line = json.dumps(trace.to_dict())
+                with self._lock, open(self.export_path, "a") as f:
+                    f.write(line + "\n")
+        except OSError:
+            pass   # metrics must never break a page
+
+
+registry = Registry()
+span = registry.span
+timed = registry.timed
+count = registry.count
+rerun = registry.rerun
@@ -0,0 +1,48 @@
+"""
+Folium map building for the Map page.
+
+Folium and streamlit-folium take longer to import than the rest of the
+app put together, so they live here and trustbites.py imports this module
+inside `page_map`: a session that never opens the map never loads them.
+"""
+import html
+
+import folium
+from folium.plugins import FastMarkerCluster
+from streamlit_folium import st_folium  # noqa: F401 (re-exported for page_map)
+
+from instrument import timed
+
+
+# Built in the browser for each [lat, lon, popup] row of the cluster layer,
+# so the page carries one data array instead of one Marker object per place.
+MARKER_CALLBACK = """function (row) {
+    var marker = L.marker(new L.LatLng(row[0], row[1]));
+    marker.setIcon(L.AwesomeMarkers.icon({icon: 'cutlery', prefix: 'fa', markerColor: 'red'}));
+    marker.bindPopup(row[2]);
+    return marker;
+}"""
+
+
+@timed("map.base")
+def base_map(center, zoom: int):
+    return folium.Map(location=center, zoom_start=zoom, tiles="OpenStreetMap")
+
+
+@timed("map.layer")
+def marker_layer(places, selected=None):
+    """One clustered layer for all visible places, popups pre-escaped, plus
+    a blue pin at the `selected` (lat, lon) if given."""
+    rows = [
+        [p["lat"], p["lon"], html.escape(f"{p['name']} – {p.get('city') or ''}")]
+        for p in places
+    ]
+    layer = folium.FeatureGroup(name="Places")
+    FastMarkerCluster(rows, callback=MARKER_CALLBACK, disableClusteringAtZoom=17).add_to(layer)
+    if selected:
+        folium.Marker(
+            list(selected),
+            popup="Selected point",
+            icon=folium.Icon(color="blue", icon="map-marker", prefix="fa"),
+        ).add_to(layer)
+    return layer
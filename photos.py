@@ -0,0 +1,128 @@
+"""
+Content-addressed photo storage.
+
+An upload is keyed by the SHA-256 of its original bytes and stored as a set
+of renditions (full view, card thumbnail, avatar, header avatar), each as
+WebP plus a JPEG fallback, under `static/blobs/<aa>/<sha256>_<rendition>.<ext>`.
+Streamlit's static file server (`server.enableStaticServing`) serves them at
+`app/static/blobs/...`. Places and profiles keep only the digest, pages emit
+a `<picture>` for the smallest rendition that fits, and uploading the same
+picture twice stores (and decodes) it once.
+"""
+import hashlib
+import html
+import os
+import re
+import tempfile
+from io import BytesIO
+
+from instrument import count, timed
+
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+BLOB_DIR = os.path.join(STATIC_DIR, "blobs")
+BLOB_URL = "app/static/blobs"
+
+# rendition -> longest edge in px (2x the CSS size, for high-DPI screens)
+RENDITIONS = {
+    "full": 1024,
+    "card": 440,     # 220x150 card image
+    "avatar": 200,   # 100px profile avatar
+    "header": 76,    # 38px header avatar
+}
+FORMATS = {"webp": ("WEBP", {"quality": 80, "method": 4}), "jpg": ("JPEG", {"quality": 85, "optimize": True})}
+
+_LEGACY_NAME = re.compile(r"^([0-9a-f]{64})\.jpg$")
+
+
+@timed("photo.renditions")
+def make_renditions(data: bytes) -> dict:
+    """Decode `data` once and return {(rendition, ext): encoded bytes}."""
+    # Pillow is only needed once someone uploads a photo
+    from PIL import Image, ImageOps
+
+    img = Image.open(BytesIO(data))
+    # JPEG only: let the decoder downscale by 1/2, 1/4 or 1/8 while decoding
+    # instead of building the full-resolution bitmap first
+    img.draft("RGB", (RENDITIONS["full"], RENDITIONS["full"]))
+    img = ImageOps.exif_transpose(img).convert("RGB")
+
+    out = {}
+    # largest first, each step shrinking the previous one
+    for name, size in sorted(RENDITIONS.items(), key=lambda kv: -kv[1]):
+        img.thumbnail((size, size), Image.LANCZOS)
+        for ext, (fmt, options) in FORMATS.items():
+            buf = BytesIO()
+            img.save(buf, format=fmt, **options)
+            out[(name, ext)] = buf.getvalue()
+    return out
+
+
+class BlobStore:
+    def __init__(self, root: str = BLOB_DIR, url_prefix: str = BLOB_URL):
+        self.root = root
+        self.url_prefix = url_prefix
+        os.makedirs(root, exist_ok=True)
+
+    def _relpath(self, digest: str, rendition: str, ext: str) -> str:
+        return f"{digest[:2]}/{digest}_{rendition}.{ext}"
+
+    def path(self, digest: str, rendition: str = "full", ext: str = "jpg") -> str:
+        return os.path.join(self.root, self._relpath(digest, rendition, ext))
+
+    def url(self, digest: str, rendition: str = "full", ext: str = "jpg") -> str:
+        return f"{self.url_prefix}/{self._relpath(digest, rendition, ext)}"
+
+    def exists(self, digest: str) -> bool:
+        return all(
+            os.path.exists(self.path(digest, r, ext)) for r in RENDITIONS for ext in FORMATS
+        )
+
+    def _write(self, path: str, data: bytes):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write-then-rename so a half-written file is never served
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def _store_renditions(self, digest: str, data: bytes):
+        for (rendition, ext), encoded in make_renditions(data).items():
+            self._write(self.path(digest, rendition, ext), encoded)
+
+    def put(self, data: bytes) -> str:
+        """Store every rendition of the image in `data` and return its digest.
+
+        Re-uploading an image that is already stored costs one hash, not a decode.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        if self.exists(digest):
+            count("photo.already_stored")
+        else:
+            self._store_renditions(digest, data)
+        return digest
+
+    def backfill_renditions(self):
+        """Expand single-file blobs written by older versions (`<digest>.jpg`)
+        into the rendition set, keeping their digest."""
+        for sub in os.listdir(self.root):
+            subdir = os.path.join(self.root, sub)
+            if not os.path.isdir(subdir):
+                continue
+            for name in os.listdir(subdir):
+                m = _LEGACY_NAME.match(name)
+                if not m:
+                    continue
+                legacy = os.path.join(subdir, name)
+                with open(legacy, "rb") as f:
+                    self._store_renditions(m.group(1), f.read())
+                os.remove(legacy)
+
+    def picture_html(self, digest: str, rendition: str, style: str = "", css_class: str = "", alt: str = "") -> str:
+        """`<picture>` serving WebP where supported and the JPEG rendition elsewhere."""
+        attrs = f' class="{css_class}"' if css_class else ""
+        attrs += f' style="{style}"' if style else ""
+        return (
+            f'<picture><source srcset="{self.url(digest, rendition, "webp")}" type="image/webp" />'
+            f'<img src="{self.url(digest, rendition, "jpg")}" alt="{html.escape(alt)}"{attrs} /></picture>'
+        )
@@ -0,0 +1,238 @@
+"""
+Trust-weighted recommendations from the people a user follows.
+
+Ratings are held in a dense user × restaurant matrix: a restaurant is a
+place's folded name and city, so two people who saved the same spot rate
+the same column, and a cell is the mean overall score (see aggregates.py)
+of that person's places there. The matrix is filled once from the store
+and then kept current by the store's change notifications (`Store.watch`):
+a rating, edit or delete rewrites one cell.
+
+To recommend for a user, everyone reachable through follows within
+MAX_DEPTH hops is weighted by trust: a weight for the distance (people you
+follow count more than the people they follow) times how closely their
+ratings agree with yours on the restaurants you both rated, shrunk towards
+neutral when there are few of those. A restaurant's score is the
+trust-weighted mean of their ratings, shrunk towards their overall mean
+when few trusted people rated it; restaurants the user already saved are
+left out. All of it is a handful of NumPy operations over the rows of the
+people involved.
+
+Results are cached per user. When someone's ratings change, only the
+users whose results drew on them are recomputed (on their next request);
+a change to the follow graph clears the cache.
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from aggregates import overall_score
+from gazetteer import fold
+
+
+MAX_DEPTH = 2
+DISTANCE_WEIGHTS = (1.0, 0.5)   # trust for one hop, two hops
+AGREEMENT_PRIOR = 3   # co-rated restaurants' worth of neutral agreement
+NEUTRAL_AGREEMENT = 0.5
+SCORE_PRIOR = 1.0     # trust weight given to the trusted people's mean rating
+RATING_RANGE = 4.0    # ratings run 1..5
+TOP_N = 5
+CACHED_USERS = 256
+
+
+def restaurant_key(name: str, city: str) -> str:
+    return f"{fold(name or '')}|{fold(city or '')}"
+
+
+class Recommender:
+    """Subscribe with `store.watch(recommender.apply)`; `fields` are the
+    store's rating columns."""
+
+    def __init__(self, fields):
+        self.fields = tuple(fields)
+        self._lock = threading.Lock()
+        self._users = {}   # email -> row
+        self._emails = []  # row -> email
+        self._restaurants = {}   # key -> column
+        self._names = []         # column -> (name, city) as first saved
+        self._places = {}   # place id -> (row, column, name, city, ratings)
+        self._cells = {}    # (row, column) -> {place id: score}
+        self._follows = {}  # row -> set of rows they follow
+        self.ratings = np.zeros((8, 64), dtype=np.float32)
+        self.rated = np.zeros((8, 64), dtype=bool)
+        self._cache = OrderedDict()   # row -> recommendations
+        self._used_by = {}   # row -> rows whose cached results used its ratings
+
+    # ----- index -----
+    def _row(self, email: str) -> int:
+        row = self._users.get(email)
+        if row is None:
+            row = self._users[email] = len(self._emails)
+            self._emails.append(email)
+            if row == self.ratings.shape[0]:
+                self._grow(rows=row * 2)
+        return row
+
+    def _column(self, name: str, city: str) -> int:
+        key = restaurant_key(name, city)
+        col = self._restaurants.get(key)
+        if col is None:
+            col = self._restaurants[key] = len(self._names)
+            self._names.append((name, city))
+            if col == self.ratings.shape[1]:
+                self._grow(cols=col * 2)
+        return col
+
+    def _grow(self, rows=None, cols=None):
+        shape = (rows or self.ratings.shape[0], cols or self.ratings.shape[1])
+        for attr in ("ratings", "rated"):
+            old = getattr(self, attr)
+            new = np.zeros(shape, dtype=old.dtype)
+            new[:old.shape[0], :old.shape[1]] = old
+            setattr(self, attr, new)
+
+    # ----- changes -----
+    def apply(self, kind: str, *args):
+        """Store change callback (see `Store.watch`)."""
+        with self._lock:
+            if kind == "load":
+                places, follows = args
+                for p in places:
+                    self._add(p)
+                for follower, followee in follows:
+                    self._follows.setdefault(self._row(follower), set()).add(self._row(followee))
+            elif kind == "add":
+                for p in args[0]:
+                    self._invalidate(self._add(p))
+            elif kind == "update":
+                place_id, fields = args
+                if not {"name", "city", *self.fields} & fields.keys():
+                    return
+                old = self._remove(place_id)
+                if old is not None:
+                    row, _, name, city, ratings = old
+                    self._invalidate(row)
+                    self._add({"id": place_id, "owner": self._emails[row], "name": name, "city": city, **ratings, **fields})
+            elif kind == "delete":
+                old = self._remove(args[0])
+                if old is not None:
+                    self._invalidate(old[0])
+            elif kind in ("follow", "unfollow"):
+                follower, followee = self._row(args[0]), self._row(args[1])
+                following = self._follows.setdefault(follower, set())
+                if kind == "follow":
+                    following.add(followee)
+                else:
+                    following.discard(followee)
+                self._cache.clear()
+                self._used_by.clear()
+            elif kind == "rename":
+                old, new = args
+                if old in self._users:
+                    row = self._users[new] = self._users.pop(old)
+                    self._emails[row] = new
+
+    def _add(self, place: dict) -> int:
+        row = self._row(place["owner"])
+        col = self._column(place["name"], place.get("city") or "")
+        ratings = {f: place.get(f) or 0 for f in self.fields}
+        self._places[place["id"]] = (row, col, place["name"], place.get("city") or "", ratings)
+        score = overall_score(ratings)
+        if score is not None:
+            self._cells.setdefault((row, col), {})[place["id"]] = score
+            self._set_cell(row, col)
+        return row
+
+    def _remove(self, place_id: str):
+        old = self._places.pop(place_id, None)
+        if old is not None:
+            row, col = old[:2]
+            self._cells.get((row, col), {}).pop(place_id, None)
+            self._set_cell(row, col)
+        return old
+
+    def _set_cell(self, row: int, col: int):
+        scores = self._cells.get((row, col))
+        if scores:
+            self.ratings[row, col] = sum(scores.values()) / len(scores)
+            self.rated[row, col] = True
+        else:
+            self._cells.pop((row, col), None)
+            self.ratings[row, col] = 0.0
+            self.rated[row, col] = False
+
+    def _invalidate(self, row: int):
+        """Drop cached results that used `row`'s ratings (its own included)."""
+        for user in self._used_by.pop(row, set()) | {row}:
+            self._cache.pop(user, None)
+
+    # ----- scoring -----
+    def _reach(self, row: int):
+        """{row: hops} of everyone within MAX_DEPTH follows of `row`."""
+        hops, frontier = {}, {row}
+        for depth in range(1, MAX_DEPTH + 1):
+            frontier = {f for r in frontier for f in self._follows.get(r, ())} - hops.keys() - {row}
+            for f in frontier:
+                hops[f] = depth
+        return hops
+
+    def recommend(self, email: str, n: int = TOP_N) -> list:
+        """The user's top `n` restaurants as {place_id, name, city, score, via},
+        `via` being the emails of the most trusted people who rated each."""
+        with self._lock:
+            row = self._users.get(email)
+            if row is None:
+                return []
+            if row not in self._cache:
+                self._cache[row] = self._score(row)
+                if len(self._cache) > CACHED_USERS:
+                    self._cache.popitem(last=False)
+            self._cache.move_to_end(row)
+            return self._cache[row][:n]
+
+    def _score(self, row: int, keep: int = TOP_N * 4) -> list:
+        hops = self._reach(row)
+        if not hops:
+            return []
+        for friend in hops:
+            self._used_by.setdefault(friend, set()).add(row)
+        friends = np.fromiter(hops, dtype=np.intp, count=len(hops))
+        n = len(self._names)
+        mine, mine_rated = self.ratings[row, :n], self.rated[row, :n]
+        theirs, theirs_rated = self.ratings[friends, :n], self.rated[friends, :n]
+
+        # agreement on the restaurants each friend and the user both rated
+        both = theirs_rated & mine_rated
+        shared = both.sum(axis=1)
+        gap = (np.abs(theirs - mine) * both).sum(axis=1) / RATING_RANGE
+        agreement = (shared - gap + AGREEMENT_PRIOR * NEUTRAL_AGREEMENT) / (shared + AGREEMENT_PRIOR)
+        distance = np.asarray(DISTANCE_WEIGHTS)[np.fromiter(hops.values(), dtype=np.intp, count=len(hops)) - 1]
+        trust = (distance * agreement).astype(np.float32)
+
+        weight = trust @ theirs_rated
+        total = trust @ theirs
+        if not weight.any():
+            return []
+        prior = total.sum() / weight.sum()
+        score = (total + SCORE_PRIOR * prior) / (weight + SCORE_PRIOR)
+        score[(weight == 0) | mine_rated] = -np.inf
+
+        candidates = np.flatnonzero(np.isfinite(score))
+        if len(candidates) > keep:
+            candidates = candidates[np.argpartition(-score[candidates], keep)[:keep]]
+        candidates = candidates[np.argsort(-score[candidates], kind="stable")]
+
+        results = []
+        for col in candidates:
+            raters = friends[theirs_rated[:, col]]
+            raters = raters[np.argsort(-trust[theirs_rated[:, col]], kind="stable")]
+            name, city = self._names[col]
+            results.append({
+                "place_id": next(iter(self._cells[(int(raters[0]), int(col))])),
+                "name": name,
+                "city": city,
+                "score": float(score[col]),
+                "via": [self._emails[r] for r in raters],
+            })
+        return results
@@ -0,0 +1,93 @@
+"""
+Full-text search over places: query parsing and typo tolerance.
+
+Places are indexed in an SQLite FTS5 table (`places_fts`, see storage.py)
+over name, city, notes and tags, with accents removed and prefix indexes,
+and triggers keep it current on every insert, edit and delete. This module
+turns what the user typed into an FTS5 MATCH expression: each word is a
+prefix match widened to the indexed terms sharing most of its trigrams, so
+"lisboa" also finds a place in "Lisbon" and "piza" finds "pizza". Words
+that match no indexed term get a looser threshold than ones that do.
+"""
+import bisect
+
+from gazetteer import fold
+
+
+# FTS5 column weights for bm25(): a hit in the name counts most.
+RANK_WEIGHTS = {"name": 10.0, "city": 4.0, "notes": 1.0, "tags": 3.0}
+
+# Trigram Jaccard similarity for a typo candidate of a word that matches no
+# indexed term, and for a spelling variant of one that does ("lisboa" -> "lisbon").
+MIN_SIMILARITY = 0.3
+VARIANT_SIMILARITY = 0.5
+MAX_ALTERNATIVES = 5
+
+
+def tokenize(text: str):
+    """Search terms in `text`, normalized the way the FTS5 tokenizer does."""
+    return fold(text or "").split()
+
+
+def trigrams(term: str):
+    padded = f"  {term} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TermIndex:
+    """Every term in the full-text index, sorted for prefix checks and
+    posted by trigram for typo candidates.
+
+    Terms are only ever added: a term whose last place was deleted costs a
+    wasted alternative in a query, never a wrong result.
+    """
+
+    def __init__(self, terms=()):
+        self._terms = []
+        self._known = set()
+        self._by_trigram = {}
+        self.add(terms)
+
+    def __len__(self):
+        return len(self._terms)
+
+    def add(self, terms):
+        for term in terms:
+            if term in self._known:
+                continue
+            self._known.add(term)
+            bisect.insort(self._terms, term)
+            for g in trigrams(term):
+                self._by_trigram.setdefault(g, set()).add(term)
+
+    def has_prefix(self, prefix: str) -> bool:
+        i = bisect.bisect_left(self._terms, prefix)
+        return i < len(self._terms) and self._terms[i].startswith(prefix)
+
+    def similar(self, term: str, limit: int = MAX_ALTERNATIVES, min_similarity: float = MIN_SIMILARITY):
+        """Indexed terms closest to `term` by trigram similarity, best first."""
+        grams = trigrams(term)
+        shared = {}
+        for g in grams:
+            for candidate in self._by_trigram.get(g, ()):
+                shared[candidate] = shared.get(candidate, 0) + 1
+        scored = []
+        for candidate, n in shared.items():
+            score = n / (len(grams) + len(trigrams(candidate)) - n)
+            if score >= min_similarity:
+                scored.append((-score, candidate))
+        return [c for _, c in sorted(scored)[:limit]]
+
+
+def match_expression(query: str, terms: TermIndex):
+    """FTS5 MATCH string for `query` (every word must match), or None if it has no words."""
+    clauses = []
+    for word in tokenize(query):
+        options = [f'"{word}"*']
+        if not terms.has_prefix(word):
+            options += [f'"{alt}"' for alt in terms.similar(word)]
+        elif len(word) >= 4:
+            variants = terms.similar(word, min_similarity=VARIANT_SIMILARITY)
+            options += [f'"{alt}"' for alt in variants if not alt.startswith(word)]
+        clauses.append(options[0] if len(options) == 1 else f"({' OR '.join(options)})")
+    return " AND ".join(clauses) or None
@@ -0,0 +1,233 @@
+"""
+"Similar places": nearest neighbours on ratings and tags.
+
+Each place is a unit vector: its ratings centred on 3 and scaled to
+[-1, 1] (an unrated 0 counts as neutral), a constant BIAS, and its tags,
+one-hot in TAG_DIMS columns a tag is hashed to, so the width stays fixed
+however many tags people invent. Without the bias, an all-3s place with
+no tags would be the zero vector and like nothing at all; with it, such
+places are like each other. The vectors are the rows of one float32
+matrix, and the cosine similarity of a place to every other is a single
+matrix-vector product; a page of cards asks for theirs in one
+matrix-matrix product. The matrix is filled once from the store and kept
+current by its change notifications (`Store.watch`): a write rewrites one
+row, and a deleted place's row is zeroed and reused.
+
+Past EXACT_LIMIT places, a query first goes through a random-hyperplane
+LSH index: TABLES hash tables, each keyed by which side of BITS random
+hyperplanes the vector falls, so vectors at a small angle share a bucket
+in at least one table with high probability. Only the places sharing a
+bucket with the query are scored, and if fewer than needed turn up, the
+query falls back to the full product.
+
+With `max_km`, only places within that distance of the one asked about
+are considered; places saved twice (the same name and city) never count
+as similar to each other.
+"""
+import threading
+import zlib
+
+import numpy as np
+
+from recommend import restaurant_key
+from spatial import EARTH_RADIUS_KM
+
+
+TAG_DIMS = 64
+BIAS = 0.5   # small enough that two neutral places sharing no tag stay apart
+EXACT_LIMIT = 20_000   # places scored exhaustively below this
+TABLES, BITS = 8, 12
+SEED = 7
+TOP_K = 3
+MIN_SIMILARITY = 0.5
+
+
+def tag_column(tag: str) -> int:
+    return zlib.crc32(tag.strip().lower().encode()) % TAG_DIMS
+
+
+def distances_km(lat, lon, lats, lons):
+    """Great-circle distances from (lat, lon) to each of `lats`/`lons` (NaN where unknown)."""
+    p1, p2 = np.radians(lat), np.radians(lats)
+    a = np.sin((p2 - p1) / 2) ** 2 + np.cos(p1) * np.cos(p2) * np.sin(np.radians(lons - lon) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(1.0, a)))
+
+
+class SimilarPlaces:
+    """Subscribe with `store.watch(similar.apply)`; `fields` are the store's
+    rating columns."""
+
+    def __init__(self, fields, exact_limit: int = EXACT_LIMIT):
+        self.fields = tuple(fields)
+        self.exact_limit = exact_limit
+        self.dims = len(self.fields) + 1 + TAG_DIMS
+        self._lock = threading.Lock()
+        self._rows = {}     # place id -> row
+        self._places = []   # row -> place snapshot, None when free
+        self._free = []
+        self._keys = {}     # restaurant key -> number
+        capacity = 1024
+        self.vectors = np.zeros((capacity, self.dims), dtype=np.float32)
+        self.lats = np.full(capacity, np.nan)
+        self.lons = np.full(capacity, np.nan)
+        self.restaurants = np.full(capacity, -1, dtype=np.int64)
+        rng = np.random.default_rng(SEED)
+        self._planes = rng.standard_normal((self.dims, TABLES * BITS)).astype(np.float32)
+        self._powers = 1 << np.arange(BITS, dtype=np.int64)
+        self._codes = None     # row -> code per table, once the index is built
+        self._buckets = None   # per table: code -> set of rows
+
+    def __len__(self):
+        return len(self._rows)
+
+    # ----- vectors -----
+    def _vector(self, place: dict):
+        v = np.zeros(self.dims, dtype=np.float32)
+        for i, f in enumerate(self.fields):
+            if place.get(f):
+                v[i] = (place[f] - 3) / 2
+        v[len(self.fields)] = BIAS
+        for tag in place.get("tags") or ():
+            v[len(self.fields) + 1 + tag_column(tag)] = 1.0
+        return v / np.linalg.norm(v)
+
+    def _hash(self, vectors):
+        bits = (vectors @ self._planes > 0).reshape(len(vectors), TABLES, BITS)
+        return bits @ self._powers
+
+    # ----- changes -----
+    def apply(self, kind: str, *args):
+        """Store change callback (see `Store.watch`)."""
+        with self._lock:
+            if kind in ("load", "add"):
+                for p in args[0]:
+                    self._put(p)
+            elif kind == "update":
+                place_id, fields = args
+                row = self._rows.get(place_id)
+                if row is not None and {"name", "city", "tags", "lat", "lon", *self.fields} & fields.keys():
+                    self._put({**self._places[row], **fields})
+            elif kind == "delete":
+                self._drop(args[0])
+
+    def _put(self, place: dict):
+        row = self._rows.get(place["id"])
+        if row is None:
+            row = self._free.pop() if self._free else len(self._places)
+            if row == len(self._places):
+                self._places.append(None)
+                if row == len(self.vectors):
+                    self._grow(2 * row)
+            self._rows[place["id"]] = row
+        elif self._codes is not None:
+            self._unindex(row)
+        snapshot = {k: place.get(k) for k in ("id", "name", "city", "tags", "lat", "lon", *self.fields)}
+        self._places[row] = snapshot
+        self.vectors[row] = self._vector(snapshot)
+        self.lats[row] = snapshot["lat"] if snapshot["lat"] is not None else np.nan
+        self.lons[row] = snapshot["lon"] if snapshot["lon"] is not None else np.nan
+        key = restaurant_key(snapshot["name"], snapshot["city"])
+        self.restaurants[row] = self._keys.setdefault(key, len(self._keys))
+        if self._codes is not None:
+            self._index(row)
+
+    def _drop(self, place_id: str):
+        row = self._rows.pop(place_id, None)
+        if row is None:
+            return
+        if self._codes is not None:
+            self._unindex(row)
+        self._places[row] = None
+        self.vectors[row] = 0.0
+        self.lats[row] = self.lons[row] = np.nan
+        self.restaurants[row] = -1
+        self._free.append(row)
+
+    def _grow(self, capacity: int):
+        for attr, fill in (("vectors", 0.0), ("lats", np.nan), ("lons", np.nan), ("restaurants", -1)):
+            old = getattr(self, attr)
+            new = np.full((capacity, *old.shape[1:]), fill, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, attr, new)
+        if self._codes is not None:
+            codes = np.zeros((capacity, TABLES), dtype=np.int64)
+            codes[:len(self._codes)] = self._codes
+            self._codes = codes
+
+    # ----- LSH index -----
+    def _build_index(self):
+        n = len(self._places)
+        self._codes = np.zeros((len(self.vectors), TABLES), dtype=np.int64)
+        self._codes[:n] = self._hash(self.vectors[:n])
+        self._buckets = [{} for _ in range(TABLES)]
+        for row in self._rows.values():
+            for t in range(TABLES):
+                self._buckets[t].setdefault(int(self._codes[row, t]), set()).add(row)
+
+    def _index(self, row: int):
+        self._codes[row] = self._hash(self.vectors[row:row + 1])[0]
+        for t in range(TABLES):
+            self._buckets[t].setdefault(int(self._codes[row, t]), set()).add(row)
+
+    def _unindex(self, row: int):
+        for t in range(TABLES):
+            bucket = self._buckets[t].get(int(self._codes[row, t]))
+            if bucket:
+                bucket.discard(row)
+
+    def _candidates(self, row: int):
+        rows = set()
+        for t in range(TABLES):
+            rows |= self._buckets[t].get(int(self._codes[row, t]), set())
+        return np.fromiter(rows, dtype=np.intp, count=len(rows))
+
+    # ----- queries -----
+    def similar(self, place_ids, k: int = TOP_K, max_km: float = None) -> dict:
+        """{place id: [{id, name, city, score}, ...]} with the `k` places most
+        like each of `place_ids` (cosine at least MIN_SIMILARITY), best first."""
+        with self._lock:
+            rows = [self._rows[pid] for pid in place_ids if pid in self._rows]
+            if not rows:
+                return {}
+            if len(self._rows) > self.exact_limit and self._codes is None:
+                self._build_index()
+            out = {}
+            exact = []
+            for row in rows:
+                if self._codes is not None:
+                    found = self._rank(row, self._candidates(row), k, max_km)
+                    if len(found) == k:
+                        out[self._places[row]["id"]] = found
+                        continue
+                exact.append(row)
+            if exact:
+                n = len(self._places)
+                scores = self.vectors[exact] @ self.vectors[:n].T   # one product for the batch
+                for row, row_scores in zip(exact, scores):
+                    out[self._places[row]["id"]] = self._rank(row, np.arange(n), k, max_km, row_scores)
+            return out
+
+    def _rank(self, row: int, candidates, k: int, max_km, scores=None) -> list:
+        if scores is None:
+            scores = self.vectors[candidates] @ self.vectors[row]
+        keep = (scores >= MIN_SIMILARITY) & (self.restaurants[candidates] != self.restaurants[row])
+        candidates, scores = candidates[keep], scores[keep]
+        if max_km is not None:
+            if np.isnan(self.lats[row]):
+                return []
+            near = distances_km(self.lats[row], self.lons[row], self.lats[candidates], self.lons[candidates])
+            keep = near <= max_km   # NaN (no coordinates) compares False
+            candidates, scores = candidates[keep], scores[keep]
+        if len(candidates) > k:
+            best = np.argpartition(-scores, k)[:k]
+            candidates, scores = candidates[best], scores[best]
+        order = np.argsort(-scores, kind="stable")
+        return [
+            {
+                "id": self._places[r]["id"],
+                "name": self._places[r]["name"],
+                "city": self._places[r]["city"] or "",
+                "score": float(s),
+            }
+            for r, s in zip(candidates[order], scores[order])
+        ]
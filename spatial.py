@@ -0,0 +1,51 @@
+"""
+Geometry helpers for the places spatial index.
+
+The index itself is an SQLite R*Tree (`places_rtree`, see storage.py) that
+triggers keep in step with every insert, coordinate change and delete. It
+answers rectangle queries only; this module turns "within N km of a point"
+into a bounding box for it to prefilter, and provides the great-circle
+distance used for the exact check and for ordering results.
+"""
+import math
+
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEG_LAT = math.pi * EARTH_RADIUS_KM / 180
+MAX_DISTANCE_KM = math.pi * EARTH_RADIUS_KM   # half the circumference
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km; None if any coordinate is missing."""
+    if lat1 is None or lon1 is None or lat2 is None or lon2 is None:
+        return None
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def wrap_lon(lon: float) -> float:
+    return (lon + 180) % 360 - 180
+
+
+def bbox_around(lat: float, lon: float, km: float):
+    """(south, west, north, east) enclosing every point within `km` of (lat, lon).
+
+    West > east means the box crosses the antimeridian. Near a pole the box
+    widens to every longitude.
+    """
+    dlat = km / KM_PER_DEG_LAT
+    south, north = max(-90.0, lat - dlat), min(90.0, lat + dlat)
+    if south <= -90 or north >= 90:
+        return south, -180.0, north, 180.0
+    # the widest the circle gets is at the latitude nearest the pole
+    widest = max(abs(south), abs(north))
+    dlon = km / (KM_PER_DEG_LAT * math.cos(math.radians(widest)))
+    if dlon >= 180:
+        return south, -180.0, north, 180.0
+    return south, wrap_lon(lon - dlon), north, wrap_lon(lon + dlon)
+
+
+def format_distance(km: float) -> str:
+    return f"{km * 1000:.0f} m" if km < 1 else f"{km:.1f} km"
@@ -0,0 +1,982 @@
+"""
+SQLite storage for TrustBites: users, places and the activity feed.
+
+A single `Store` is shared by every Streamlit session (see `get_store` in
+trustbites.py). The database runs in WAL mode so readers never wait on the
+writer, and every list query is paged (by a cursor on the sort key) so a
+rerun only pulls the rows it is about to render. Each list order has a
+matching index, so a page is read straight off a sorted view.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from uuid import uuid4
+
+from aggregates import RatingAggregates
+from search import RANK_WEIGHTS, TermIndex, match_expression, tokenize
+from spatial import MAX_DISTANCE_KM, bbox_around, haversine_km
+
+
+log = logging.getLogger(__name__)
+
+
+DATA_DIR = os.environ.get(
+    "TRUSTBITES_DATA_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".trustbites"),
+)
+DB_PATH = os.path.join(DATA_DIR, "trustbites.db")
+
+RATING_FIELDS = ("food", "service", "location", "price")
+
+# UI sort label -> ORDER BY column. Every order is descending (as the
+# list page always was) and ties fall back to created_at, then id.
+SORT_COLUMNS = {
+    "Newest": "created_at",
+    "Name": "name",
+    "Food": "food",
+    "Service": "service",
+    "Location": "location",
+    "Price": "price",
+}
+SORT_COLLATIONS = {"name": " COLLATE NOCASE"}
+# Only offered with a "near" filter / a search query; both rank best first.
+DISTANCE_SORT = "Distance"
+RELEVANCE_SORT = "Relevance"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    email         TEXT PRIMARY KEY,
+    password_hash TEXT NOT NULL,
+    first_name    TEXT NOT NULL DEFAULT '',
+    last_name     TEXT NOT NULL DEFAULT '',
+    city          TEXT NOT NULL DEFAULT '',
+    fav           TEXT NOT NULL DEFAULT '',
+    bio           TEXT NOT NULL DEFAULT '',
+    photo         TEXT,
+    created_at    TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS places (
+    id         TEXT PRIMARY KEY,
+    owner      TEXT NOT NULL DEFAULT '',
+    name       TEXT NOT NULL,
+    city       TEXT NOT NULL DEFAULT '',
+    food       INTEGER NOT NULL DEFAULT 0,
+    service    INTEGER NOT NULL DEFAULT 0,
+    location   INTEGER NOT NULL DEFAULT 0,
+    price      INTEGER NOT NULL DEFAULT 0,
+    notes      TEXT NOT NULL DEFAULT '',
+    tags       TEXT NOT NULL DEFAULT '[]',
+    photo      TEXT,
+    created_at TEXT NOT NULL,
+    lat        REAL,
+    lon        REAL,
+    geo_status TEXT
+);
+-- One sorted view per list order, matching ORDER BY <key> DESC, created_at
+-- DESC, id DESC for one owner: the first page of any order is a range scan
+-- of `limit` entries, and each write updates the views in O(log n).
+DROP INDEX IF EXISTS idx_places_owner_created;
+CREATE INDEX IF NOT EXISTS idx_places_owner_newest ON places(owner, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_places_owner_name ON places(owner, name COLLATE NOCASE, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_places_owner_food ON places(owner, food, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_places_owner_service ON places(owner, service, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_places_owner_location ON places(owner, location, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_places_owner_price ON places(owner, price, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_places_city ON places(city COLLATE NOCASE);
+-- The same sorted views across every owner, for the Everyone's scope.
+DROP INDEX IF EXISTS idx_places_created;
+DROP INDEX IF EXISTS idx_places_food;
+DROP INDEX IF EXISTS idx_places_service;
+DROP INDEX IF EXISTS idx_places_location;
+DROP INDEX IF EXISTS idx_places_price;
+CREATE INDEX IF NOT EXISTS idx_places_all_newest ON places(created_at, id);
+CREATE INDEX IF NOT EXISTS idx_places_all_name ON places(name COLLATE NOCASE, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_places_all_food ON places(food, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_places_all_service ON places(service, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_places_all_location ON places(location, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_places_all_price ON places(price, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_places_latlon ON places(lat, lon) WHERE lat IS NOT NULL;
+
+CREATE TABLE IF NOT EXISTS place_tags (
+    tag      TEXT NOT NULL,
+    place_id TEXT NOT NULL REFERENCES places(id) ON DELETE CASCADE,
+    PRIMARY KEY (tag, place_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_place_tags_place ON place_tags(place_id);
+
+-- Append-only log of every mutation (join/add/edit/pin/delete). Rows are
+-- written in the same transaction as the change they describe and never
+-- updated; the feed page reads its tail.
+CREATE TABLE IF NOT EXISTS feed (
+    seq   INTEGER PRIMARY KEY AUTOINCREMENT,
+    id    TEXT NOT NULL,
+    ts    TEXT NOT NULL,
+    kind  TEXT NOT NULL,
+    text  TEXT NOT NULL,
+    actor TEXT,
+    ref   TEXT
+);
+
+-- Checkpoint of each bulk import (see importer.py), keyed by owner and file
+-- fingerprint. `rows_done` counts the source rows consumed up to the last
+-- committed batch and is saved in that batch's transaction, so an
+-- interrupted import resumes exactly where it stopped.
+CREATE TABLE IF NOT EXISTS imports (
+    key        TEXT PRIMARY KEY,
+    owner      TEXT NOT NULL,
+    filename   TEXT NOT NULL DEFAULT '',
+    rows_done  INTEGER NOT NULL DEFAULT 0,
+    imported   INTEGER NOT NULL DEFAULT 0,
+    failed     INTEGER NOT NULL DEFAULT 0,
+    errors     TEXT NOT NULL DEFAULT '[]',
+    done       INTEGER NOT NULL DEFAULT 0,
+    updated_at TEXT NOT NULL
+);
+
+-- Who follows whom; a changed email carries over through the foreign keys.
+CREATE TABLE IF NOT EXISTS follows (
+    follower   TEXT NOT NULL REFERENCES users(email) ON UPDATE CASCADE ON DELETE CASCADE,
+    followee   TEXT NOT NULL REFERENCES users(email) ON UPDATE CASCADE ON DELETE CASCADE,
+    created_at TEXT NOT NULL,
+    PRIMARY KEY (follower, followee)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_follows_followee ON follows(followee);
+"""
+
+PLACE_COLUMNS = (
+    "id", "owner", "name", "city", "food", "service", "location", "price",
+    "notes", "tags", "photo", "created_at", "lat", "lon", "geo_status",
+)
+
+# Columns added after the first release: (table, column, declaration).
+# Databases created earlier get them through ALTER TABLE on startup.
+ADDED_COLUMNS = [
+    ("places", "geo_status", "TEXT"),
+    ("places", "photo", "TEXT"),
+    ("users", "photo", "TEXT"),
+    ("feed", "actor", "TEXT"),
+    ("feed", "ref", "TEXT"),
+]
+
+USER_FIELDS = ("first_name", "last_name", "city", "fav", "bio", "photo")
+
+# R*Tree over place coordinates, keyed by places.rowid. Triggers keep it in
+# step with every write, so no code path can forget to update it.
+SPATIAL_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS places_rtree USING rtree(id, min_lat, max_lat, min_lon, max_lon);
+
+CREATE TRIGGER IF NOT EXISTS places_rtree_insert AFTER INSERT ON places
+WHEN new.lat IS NOT NULL AND new.lon IS NOT NULL BEGIN
+    INSERT INTO places_rtree VALUES (new.rowid, new.lat, new.lat, new.lon, new.lon);
+END;
+
+CREATE TRIGGER IF NOT EXISTS places_rtree_update AFTER UPDATE OF lat, lon ON places BEGIN
+    DELETE FROM places_rtree WHERE id = old.rowid;
+    INSERT INTO places_rtree SELECT new.rowid, new.lat, new.lat, new.lon, new.lon
+        WHERE new.lat IS NOT NULL AND new.lon IS NOT NULL;
+END;
+
+CREATE TRIGGER IF NOT EXISTS places_rtree_delete AFTER DELETE ON places BEGIN
+    DELETE FROM places_rtree WHERE id = old.rowid;
+END;
+"""
+
+# Full-text index over the searchable columns, keyed by places.rowid like
+# the R*Tree and kept current the same way. Tags are indexed as their JSON text.
+SEARCH_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS places_fts USING fts5(
+    name, city, notes, tags,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS places_fts_terms USING fts5vocab(places_fts, 'row');
+
+CREATE TRIGGER IF NOT EXISTS places_fts_insert AFTER INSERT ON places BEGIN
+    INSERT INTO places_fts (rowid, name, city, notes, tags)
+    VALUES (new.rowid, new.name, new.city, new.notes, new.tags);
+END;
+
+CREATE TRIGGER IF NOT EXISTS places_fts_update AFTER UPDATE OF name, city, notes, tags ON places BEGIN
+    DELETE FROM places_fts WHERE rowid = old.rowid;
+    INSERT INTO places_fts (rowid, name, city, notes, tags)
+    VALUES (new.rowid, new.name, new.city, new.notes, new.tags);
+END;
+
+CREATE TRIGGER IF NOT EXISTS places_fts_delete AFTER DELETE ON places BEGIN
+    DELETE FROM places_fts WHERE rowid = old.rowid;
+END;
+"""
+
+
+# ---------- PASSWORDS ----------
+def hash_password(password: str) -> str:
+    salt = secrets.token_hex(16)
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode(), bytes.fromhex(salt), 200_000)
+    return f"pbkdf2_sha256$200000${salt}${digest.hex()}"
+
+
+def check_password(password: str, stored: str) -> bool:
+    try:
+        _, iterations, salt, expected = stored.split("$")
+        digest = hashlib.pbkdf2_hmac(
+            "sha256", password.encode(), bytes.fromhex(salt), int(iterations)
+        )
+        return hmac.compare_digest(digest.hex(), expected)
+    except ValueError:
+        return False
+
+
+# ---------- LOCKING ----------
+class RWLock:
+    """Many readers or one writer. Waiting writers block new readers, so a
+    steady stream of page renders can't starve a save. Not reentrant."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writing = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def reading(self):
+        with self._cond:
+            while self._writing or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def writing(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writing or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writing = False
+                self._cond.notify_all()
+
+
+# ---------- STORE ----------
+class Store:
+    """Repository over the TrustBites SQLite database.
+
+    One instance serves every Streamlit session (each rerun runs on its own
+    thread). Writes go through a single connection under the write side of
+    `self._lock`, which also guards the in-memory term index; reads take the
+    read side and a pooled read-only connection, so page renders in
+    different sessions run concurrently (WAL gives each a consistent
+    snapshot) and only wait while a write is in progress.
+    """
+
+    def __init__(self, path: str = DB_PATH):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._lock = RWLock()
+        self._readers = []   # idle read connections
+        self._watchers = []   # see watch()
+        self._changes = []    # notified within the open write transaction
+        self._conn = self._connect()
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # commits reach the WAL without an fsync each; SQLite syncs them in
+        # batches when it checkpoints the WAL back into the database file
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        with self._lock.writing(), self._conn:
+            self._conn.executescript(SCHEMA)
+            self._add_missing_columns()
+            self.has_rtree = self._init_spatial_index()
+            self.has_fts = self._init_search_index()
+            self.ratings = self._load_aggregates()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.create_function("distance_km", 4, haversine_km, deterministic=True)
+        return conn
+
+    @contextmanager
+    def _writing(self):
+        """Write lock plus a transaction on the write connection. The changes
+        `_notify`-ed within it reach the in-memory indexes and the watchers
+        only once it has committed, and are dropped if it rolls back."""
+        with self._lock.writing():
+            self._changes = []
+            try:
+                with self._conn:
+                    yield
+            except BaseException:
+                self._changes = []
+                raise
+            changes, self._changes = self._changes, []
+            for change in changes:
+                self._apply(*change)
+
+    @contextmanager
+    def _reading(self):
+        """Read lock plus a connection of this thread's own for the duration."""
+        if self.path == ":memory:":
+            # a private in-memory database exists only on the write connection
+            with self._lock.writing():
+                yield self._conn
+            return
+        with self._lock.reading():
+            try:
+                conn = self._readers.pop()
+            except IndexError:
+                conn = self._connect()
+                conn.execute("PRAGMA query_only=ON")
+            try:
+                yield conn
+            finally:
+                self._readers.append(conn)
+
+    def _add_missing_columns(self):
+        for table, column, decl in ADDED_COLUMNS:
+            existing = {r[1] for r in self._conn.execute(f"PRAGMA table_info({table})")}
+            if column not in existing:
+                self._conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+    def _init_spatial_index(self) -> bool:
+        """Create the R*Tree and reload it from `places`.
+
+        The reload runs on every start because VACUUM may renumber the rowids
+        it is keyed by. Builds of SQLite without the rtree module fall back to
+        the plain lat/lon index.
+        """
+        try:
+            self._conn.executescript(SPATIAL_SCHEMA)
+        except sqlite3.OperationalError:
+            return False
+        self._conn.execute("DELETE FROM places_rtree")
+        self._conn.execute(
+            "INSERT INTO places_rtree SELECT rowid, lat, lat, lon, lon FROM places"
+            " WHERE lat IS NOT NULL AND lon IS NOT NULL"
+        )
+        return True
+
+    def _init_search_index(self) -> bool:
+        """Create and reload the FTS5 index (same reasons as the R*Tree) and
+        load its vocabulary for typo-tolerant queries. Without FTS5, search
+        falls back to LIKE."""
+        self.terms = TermIndex()
+        try:
+            self._conn.executescript(SEARCH_SCHEMA)
+        except sqlite3.OperationalError:
+            return False
+        self._conn.execute("DELETE FROM places_fts")
+        self._conn.execute(
+            "INSERT INTO places_fts (rowid, name, city, notes, tags)"
+            " SELECT rowid, name, city, notes, tags FROM places"
+        )
+        self.terms.add(r[0] for r in self._conn.execute("SELECT term FROM places_fts_terms"))
+        return True
+
+    def _load_aggregates(self) -> RatingAggregates:
+        """Rating aggregates and leaderboards, built once from every place
+        and then kept current by each write."""
+        rows = self._conn.execute(f"SELECT id, name, city, tags, {', '.join(RATING_FIELDS)} FROM places")
+        return RatingAggregates(RATING_FIELDS, map(self._place_from_row, rows))
+
+    @staticmethod
+    def _place_terms(place: dict):
+        for key in ("name", "city", "notes"):
+            if isinstance(place.get(key), str):
+                yield from tokenize(place[key])
+        for tag in place.get("tags") or ():
+            yield from tokenize(tag)
+
+    def _index_terms(self, place: dict):
+        self.terms.add(self._place_terms(place))
+
+    def migrate_inline_photos(self, put_blob):
+        """Move base64 photos left by older versions into the blob store.
+
+        `put_blob(bytes) -> digest` stores the image; the row keeps the digest.
+        """
+        with self._lock.writing(), self._conn:
+            columns = {r[1] for r in self._conn.execute("PRAGMA table_info(places)")}
+            if "photo_b64" not in columns:
+                return
+            rows = self._conn.execute(
+                "SELECT id, photo_b64 FROM places WHERE photo_b64 IS NOT NULL"
+            ).fetchall()
+            for place_id, b64 in rows:
+                self._conn.execute(
+                    "UPDATE places SET photo = ?, photo_b64 = NULL WHERE id = ?",
+                    (put_blob(base64.b64decode(b64)), place_id),
+                )
+            try:
+                self._conn.execute("ALTER TABLE places DROP COLUMN photo_b64")
+            except sqlite3.OperationalError:
+                pass   # SQLite < 3.35: the column stays, always NULL
+
+    def close(self):
+        with self._lock.writing():
+            for conn in self._readers:
+                conn.close()
+            self._readers.clear()
+            self._conn.close()
+
+    # ----- users -----
+    def get_user(self, email: str):
+        with self._reading() as conn:
+            row = conn.execute(
+                "SELECT * FROM users WHERE email = ?", (email,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def add_user(self, email: str, password: str, event=None, **fields):
+        """`event` is an optional (kind, text) logged with the insert; the
+        same goes for the place mutations below."""
+        record = {k: fields.get(k) or "" for k in USER_FIELDS if k != "photo"}
+        with self._lock.writing(), self._conn:
+            self._conn.execute(
+                "INSERT INTO users (email, password_hash, first_name, last_name, city, fav, bio, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    email,
+                    hash_password(password),
+                    record["first_name"],
+                    record["last_name"],
+                    record["city"],
+                    record["fav"],
+                    record["bio"],
+                    datetime.utcnow().isoformat(timespec="seconds"),
+                ),
+            )
+            self._log(event, actor=email)
+
+    def display_names(self, emails) -> dict:
+        """{email: "First Last"} for the given users (the email's local part if unnamed)."""
+        emails = list(emails)
+        if not emails:
+            return {}
+        with self._reading() as conn:
+            rows = conn.execute(
+                "SELECT email, first_name, last_name FROM users"
+                f" WHERE email IN ({', '.join('?' * len(emails))})",
+                emails,
+            ).fetchall()
+        return {
+            r["email"]: f"{r['first_name']} {r['last_name']}".strip() or r["email"].split("@")[0]
+            for r in rows
+        }
+
+    def authenticate(self, email: str, password: str) -> bool:
+        user = self.get_user(email)
+        return bool(user) and check_password(password, user["password_hash"])
+
+    def update_user(self, email: str, new_email: str = None, **fields):
+        """Update profile fields; changing the email also moves the user's places."""
+        allowed = {k: v for k, v in fields.items() if k in USER_FIELDS}
+        new_email = new_email or email
+        with self._writing():
+            if allowed:
+                sets = ", ".join(f"{k} = ?" for k in allowed)
+                self._conn.execute(
+                    f"UPDATE users SET {sets} WHERE email = ?", (*allowed.values(), email)
+                )
+            if new_email != email:
+                self._conn.execute("UPDATE users SET email = ? WHERE email = ?", (new_email, email))
+                self._conn.execute("UPDATE places SET owner = ? WHERE owner = ?", (new_email, email))
+                self._notify("rename", email, new_email)
+
+    # ----- follows -----
+    def follow(self, follower: str, followee: str, event=None) -> bool:
+        """True if `follower` wasn't already following `followee`."""
+        if follower == followee:
+            return False
+        with self._writing():
+            added = self._conn.execute(
+                "INSERT OR IGNORE INTO follows (follower, followee, created_at) VALUES (?, ?, ?)",
+                (follower, followee, datetime.utcnow().isoformat(timespec="seconds")),
+            ).rowcount
+            if added:
+                self._log(event, actor=follower, ref=followee)
+                self._notify("follow", follower, followee)
+        return bool(added)
+
+    def unfollow(self, follower: str, followee: str):
+        with self._writing():
+            if self._conn.execute(
+                "DELETE FROM follows WHERE follower = ? AND followee = ?", (follower, followee)
+            ).rowcount:
+                self._notify("unfollow", follower, followee)
+
+    def following(self, email: str) -> list:
+        with self._reading() as conn:
+            rows = conn.execute(
+                "SELECT followee FROM follows WHERE follower = ? ORDER BY created_at, followee", (email,)
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def count_followers(self, email: str) -> int:
+        with self._reading() as conn:
+            return conn.execute("SELECT COUNT(*) FROM follows WHERE followee = ?", (email,)).fetchone()[0]
+
+    # ----- change notifications -----
+    def watch(self, callback):
+        """Call `callback(kind, *args)` on every change to places, follows
+        and user emails, starting with ("load", places, follows): every
+        place (id, owner, name, city, ratings, tags and coordinates, as an
+        iterator to consume during the call) and (follower, followee) pair
+        as they are now. It runs under the write lock, once the change's
+        transaction has committed, so the callback sees each committed change
+        exactly once and in commit order; it must be quick and must not use
+        the store. An exception from it is logged and doesn't undo the write.
+
+        Kinds: ("add", places), ("update", place_id, fields),
+        ("delete", place_id), ("follow" | "unfollow", follower, followee)
+        and ("rename", old_email, new_email).
+        """
+        with self._lock.writing():
+            rows = self._conn.execute(
+                f"SELECT id, owner, name, city, {', '.join(RATING_FIELDS)}, tags, lat, lon FROM places"
+            )
+            follows = self._conn.execute("SELECT follower, followee FROM follows").fetchall()
+            callback("load", map(self._place_from_row, rows), [tuple(f) for f in follows])
+            self._watchers.append(callback)
+
+    def _notify(self, kind: str, *args):
+        """Queue a change for when the open write transaction commits (see `_writing`)."""
+        self._changes.append((kind, *args))
+
+    def _apply(self, kind: str, *args):
+        """Bring the term index, the rating aggregates and every watcher up
+        to date with a committed change; one failing doesn't stop the others."""
+        for callback in (self._apply_terms, self._apply_ratings, *self._watchers):
+            try:
+                callback(kind, *args)
+            except Exception:
+                log.exception("change callback %r failed on %s", callback, kind)
+
+    def _apply_terms(self, kind: str, *args):
+        if kind == "add":
+            self.terms.add({t for p in args[0] for t in self._place_terms(p)})
+        elif kind == "update":
+            self._index_terms(args[1])
+
+    def _apply_ratings(self, kind: str, *args):
+        if kind == "add":
+            for p in args[0]:
+                self.ratings.add(p)
+        elif kind == "update":
+            self.ratings.update(*args)
+        elif kind == "delete":
+            self.ratings.remove(args[0])
+
+    # ----- places -----
+    @staticmethod
+    def _place_from_row(row):
+        p = dict(row)
+        p["tags"] = json.loads(p.get("tags") or "[]")
+        return p
+
+    def _write_tags(self, place_id: str, tags):
+        self._conn.execute("DELETE FROM place_tags WHERE place_id = ?", (place_id,))
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO place_tags (tag, place_id) VALUES (?, ?)",
+            [(t, place_id) for t in tags],
+        )
+
+    @staticmethod
+    def _new_place(place: dict) -> dict:
+        return {
+            "id": str(uuid4()),
+            "owner": "",
+            "city": "",
+            "notes": "",
+            "tags": [],
+            "photo": None,
+            "created_at": datetime.utcnow().isoformat(timespec="seconds"),
+            "lat": None,
+            "lon": None,
+            "geo_status": None,
+            **{k: 0 for k in RATING_FIELDS},
+            **place,
+        }
+
+    def _insert_place(self, p: dict, event=None):
+        values = [json.dumps(p["tags"]) if k == "tags" else p[k] for k in PLACE_COLUMNS]
+        self._conn.execute(
+            f"INSERT INTO places ({', '.join(PLACE_COLUMNS)})"
+            f" VALUES ({', '.join('?' * len(PLACE_COLUMNS))})",
+            values,
+        )
+        self._write_tags(p["id"], p["tags"])
+        self._log(event, actor=p["owner"], ref=p["id"])
+
+    def add_place(self, place: dict, event=None) -> dict:
+        p = self._new_place(place)
+        with self._writing():
+            self._insert_place(p, event)
+            self._notify("add", [p])
+        return p
+
+    def add_places(self, places, event=None, progress=None) -> list:
+        """Insert many places in one transaction (imports, benchmark data).
+
+        `event`, if given, maps each stored place to the (kind, text) logged
+        with it, or None for no event. `progress` is an import checkpoint
+        (see `save_import`) committed together with the places. The term
+        index is updated once for the whole batch.
+        """
+        added = [self._new_place(place) for place in places]
+        with self._writing():
+            for p in added:
+                self._insert_place(p, event(p) if event else None)
+            self._notify("add", added)
+            if progress is not None:
+                self._save_import(progress)
+        return added
+
+    def update_place(self, place_id: str, event=None, **fields):
+        fields = {k: v for k, v in fields.items() if k in PLACE_COLUMNS and k != "id"}
+        if not fields:
+            return
+        values = [json.dumps(v) if k == "tags" else v for k, v in fields.items()]
+        sets = ", ".join(f"{k} = ?" for k in fields)
+        with self._writing():
+            self._conn.execute(f"UPDATE places SET {sets} WHERE id = ?", (*values, place_id))
+            if "tags" in fields:
+                self._write_tags(place_id, fields["tags"])
+            self._notify("update", place_id, fields)
+            self._log(event, actor=self._owner_of(place_id), ref=place_id)
+
+    def delete_place(self, place_id: str, event=None):
+        with self._writing():
+            owner = self._owner_of(place_id)
+            self._conn.execute("DELETE FROM places WHERE id = ?", (place_id,))
+            self._notify("delete", place_id)
+            self._log(event, actor=owner, ref=place_id)
+
+    def _owner_of(self, place_id: str):
+        row = self._conn.execute("SELECT owner FROM places WHERE id = ?", (place_id,)).fetchone()
+        return row[0] if row else None
+
+    def get_place(self, place_id: str):
+        with self._reading() as conn:
+            row = conn.execute(
+                "SELECT * FROM places WHERE id = ?", (place_id,)
+            ).fetchone()
+        return self._place_from_row(row) if row else None
+
+    def _bbox_clause(self, south, west, north, east):
+        """WHERE fragment matching places inside the box (west > east wraps the antimeridian)."""
+        if not self.has_rtree:
+            if west > east:
+                return "lat BETWEEN ? AND ? AND (lon >= ? OR lon <= ?)", [south, north, west, east]
+            return "lat BETWEEN ? AND ? AND lon BETWEEN ? AND ?", [south, north, west, east]
+
+        box = "SELECT id FROM places_rtree WHERE min_lat <= ? AND max_lat >= ? AND min_lon <= ? AND max_lon >= ?"
+        if west > east:
+            return (
+                f"places.rowid IN ({box} UNION ALL {box})",
+                [north, south, 180.0, west, north, south, east, -180.0],
+            )
+        return f"places.rowid IN ({box})", [north, south, east, west]
+
+    def _place_filters(self, owner=None, q: str = "", tags=(), near=None):
+        """`near` is (lat, lon, km): keep places within km of the point."""
+        where, args = [], []
+        if owner is not None:
+            where.append("owner = ?")
+            args.append(owner)
+        if q and self.has_fts:
+            with self._lock.reading():   # the term index changes under writes
+                match = match_expression(q, self.terms)
+            if match:
+                where.append("places.rowid IN (SELECT rowid FROM places_fts WHERE places_fts MATCH ?)")
+                args.append(match)
+        elif q:
+            where.append("(name LIKE ? OR city LIKE ? OR notes LIKE ? OR tags LIKE ?)")
+            like = f"%{q.strip()}%"
+            args += [like] * 4
+        if tags:
+            # place_tags is keyed (tag, place_id): each tag's posting list is a
+            # sorted range of the primary key, and a multi-tag filter intersects them
+            tags = sorted(set(tags))
+            postings = " INTERSECT ".join(["SELECT place_id FROM place_tags WHERE tag = ?"] * len(tags))
+            where.append(f"id IN ({postings})")
+            args += tags
+        if near:
+            lat, lon, km = near
+            clause, box_args = self._bbox_clause(*bbox_around(lat, lon, km))
+            where.append(f"{clause} AND distance_km(lat, lon, ?, ?) <= ?")
+            args += [*box_args, lat, lon, km]
+        return (" WHERE " + " AND ".join(where) if where else ""), args
+
+    @staticmethod
+    def _sort_key(sort: str, near=None, ranked=False):
+        """(column, ascending) for a sort label."""
+        if sort == DISTANCE_SORT and near:
+            return "distance_km", True
+        if sort == RELEVANCE_SORT and ranked:
+            return "score", True
+        return SORT_COLUMNS.get(sort, "created_at"), False
+
+    def list_places(self, owner=None, q: str = "", tags=(), sort: str = "Newest", limit: int = 20, offset: int = 0, near=None, after=None):
+        """Return one page of places matching the filters, already sorted.
+
+        With `near`, each place carries its `distance_km` and the "Distance"
+        sort puts the closest first. With `q`, the "Relevance" sort ranks
+        full-text matches by bm25, name hits first.
+
+        `after` is a cursor from `page_cursor`: the page starts right after
+        that place, so rows added or removed elsewhere don't shift it.
+        """
+        match = None
+        if q and self.has_fts:
+            with self._lock.reading():
+                match = match_expression(q, self.terms)
+        ranked = sort == RELEVANCE_SORT and match is not None
+        where, args = self._place_filters(owner, "" if ranked else q, tags, near)
+        column, ascending = self._sort_key(sort, near, ranked)
+        collate = SORT_COLLATIONS.get(column, "")
+
+        columns, source = "places.*", "places"
+        head = []
+        if near:
+            columns += ", distance_km(lat, lon, ?, ?) AS distance_km"
+            head += [near[0], near[1]]
+        if ranked:
+            weights = ", ".join(str(w) for w in RANK_WEIGHTS.values())
+            columns += ", score"
+            source += (
+                f" JOIN (SELECT rowid AS hit, bm25(places_fts, {weights}) AS score"
+                " FROM places_fts WHERE places_fts MATCH ?) ON hit = places.rowid"
+            )
+            head.append(match)
+        if after is not None:
+            where += " AND " if where else " WHERE "
+            if ascending:
+                where += f"({column} > ? OR ({column} = ? AND (created_at, id) < (?, ?)))"
+                args = [*args, after[0], *after]
+            elif column == "created_at":
+                where += "(created_at, id) < (?, ?)"
+                args = [*args, *after[1:]]
+            else:
+                # a row-value range the sorted-view index can seek to (the
+                # collation goes on the right so the index stays usable)
+                where += f"({column}, created_at, id) < (?{collate}, ?, ?)"
+                args = [*args, *after]
+
+        order = [] if column == "created_at" else [column + collate + ("" if ascending else " DESC")]
+        order += ["created_at DESC", "id DESC"]
+        with self._reading() as conn:
+            rows = conn.execute(
+                f"SELECT {columns} FROM {source}{where}"
+                f" ORDER BY {', '.join(order)} LIMIT ? OFFSET ?",
+                (*head, *args, limit, offset),
+            ).fetchall()
+        return [self._place_from_row(r) for r in rows]
+
+    def page_cursor(self, place: dict, sort: str = "Newest", near=None):
+        """Cursor for `list_places(after=...)` positioned just after `place`."""
+        column, _ = self._sort_key(sort, near, ranked="score" in place)
+        return place[column], place["created_at"], place["id"]
+
+    def iter_places(self, owner=None, q: str = "", tags=(), sort: str = "Newest", near=None, batch: int = 1000):
+        """Every place matching the filters, in list order, read `batch` rows
+        at a time so the read lock is only held for one page."""
+        after = None
+        while True:
+            page = self.list_places(owner=owner, q=q, tags=tags, sort=sort, limit=batch, near=near, after=after)
+            yield from page
+            if len(page) < batch:
+                return
+            after = self.page_cursor(page[-1], sort, near)
+
+    def count_places(self, owner=None, q: str = "", tags=(), near=None) -> int:
+        where, args = self._place_filters(owner, q, tags, near)
+        with self._reading() as conn:
+            return conn.execute(f"SELECT COUNT(*) FROM places{where}", args).fetchone()[0]
+
+    def tag_counts(self, owner=None, q: str = "", tags=(), near=None) -> dict:
+        """Facet counts: {tag: places matching the filters that carry it}, most used first."""
+        where, args = self._place_filters(owner, q, tags, near)
+        with self._reading() as conn:
+            rows = conn.execute(
+                "SELECT t.tag, COUNT(*) AS n FROM place_tags t JOIN places ON places.id = t.place_id"
+                f"{where} GROUP BY t.tag ORDER BY n DESC, t.tag",
+                args,
+            ).fetchall()
+        return {tag: n for tag, n in rows}
+
+    def distinct_tags(self, owner=None):
+        with self._reading() as conn:
+            if owner is None:
+                rows = conn.execute("SELECT DISTINCT tag FROM place_tags ORDER BY tag")
+            else:
+                rows = conn.execute(
+                    "SELECT DISTINCT t.tag FROM place_tags t JOIN places p ON p.id = t.place_id"
+                    " WHERE p.owner = ? ORDER BY t.tag",
+                    (owner,),
+                )
+            return [r[0] for r in rows.fetchall()]
+
+    def places_with_coords(self, owner=None):
+        """Lightweight rows (no photo, notes or ratings) for places that have coordinates."""
+        sql = "SELECT id, name, city, lat, lon FROM places WHERE lat IS NOT NULL AND lon IS NOT NULL"
+        args = ()
+        if owner is not None:
+            sql += " AND owner = ?"
+            args = (owner,)
+        with self._reading() as conn:
+            return [dict(r) for r in conn.execute(sql, args).fetchall()]
+
+    def places_in_bbox(self, south, west, north, east, owner=None, limit=None):
+        """Like `places_with_coords`, limited to a lat/lon box.
+
+        A box with west > east crosses the antimeridian.
+        """
+        clause, args = self._bbox_clause(south, west, north, east)
+        sql = f"SELECT id, name, city, lat, lon FROM places WHERE {clause}"
+        if owner is not None:
+            sql += " AND owner = ?"
+            args.append(owner)
+        if limit is not None:
+            sql += " LIMIT ?"
+            args.append(int(limit))
+        with self._reading() as conn:
+            return [dict(r) for r in conn.execute(sql, args).fetchall()]
+
+    def places_within(self, lat: float, lon: float, km: float, owner=None, limit=None):
+        """Places within `km` of the point, closest first, each with `distance_km`."""
+        clause, args = self._bbox_clause(*bbox_around(lat, lon, km))
+        sql = (
+            "SELECT id, name, city, lat, lon, distance_km(lat, lon, ?, ?) AS distance_km"
+            f" FROM places WHERE {clause} AND distance_km <= ?"
+        )
+        args = [lat, lon, *args, km]
+        if owner is not None:
+            sql += " AND owner = ?"
+            args.append(owner)
+        sql += " ORDER BY distance_km"
+        if limit is not None:
+            sql += " LIMIT ?"
+            args.append(int(limit))
+        with self._reading() as conn:
+            return [dict(r) for r in conn.execute(sql, args).fetchall()]
+
+    def nearest_places(self, lat: float, lon: float, k: int = 5, owner=None, max_km: float = MAX_DISTANCE_KM):
+        """The `k` places closest to the point (at most `max_km` away).
+
+        Searches a growing radius, so a dense area is answered from a small
+        box and only sparse areas pay for a wider one.
+        """
+        km = min(1.0, max_km)
+        while True:
+            rows = self.places_within(lat, lon, km, owner=owner, limit=k)
+            if len(rows) >= k or km >= max_km:
+                return rows
+            km = min(km * 4, max_km)
+
+    def set_coords(self, place_ids, coords):
+        """Store the background geocoder's answer for every waiting place."""
+        with self._writing():
+            if coords:
+                self._conn.executemany(
+                    "UPDATE places SET lat = ?, lon = ?, geo_status = 'ok' WHERE id = ?",
+                    [(coords[0], coords[1], pid) for pid in place_ids],
+                )
+                for pid in place_ids:
+                    self._notify("update", pid, {"lat": coords[0], "lon": coords[1]})
+            else:
+                self._conn.executemany(
+                    "UPDATE places SET geo_status = 'not_found' WHERE id = ?",
+                    [(pid,) for pid in place_ids],
+                )
+
+    def pending_geocodes(self):
+        """Places still waiting for coordinates (e.g. queued before a restart)."""
+        with self._reading() as conn:
+            rows = conn.execute(
+                "SELECT id, name, city FROM places WHERE geo_status = 'pending'"
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+    # ----- imports -----
+    def get_import(self, key: str):
+        with self._reading() as conn:
+            row = conn.execute("SELECT * FROM imports WHERE key = ?", (key,)).fetchone()
+        if not row:
+            return None
+        record = dict(row)
+        record["errors"] = json.loads(record["errors"])
+        record["done"] = bool(record["done"])
+        return record
+
+    def _save_import(self, progress: dict):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO imports"
+            " (key, owner, filename, rows_done, imported, failed, errors, done, updated_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                progress["key"],
+                progress["owner"],
+                progress.get("filename", ""),
+                progress["rows_done"],
+                progress["imported"],
+                progress["failed"],
+                json.dumps(progress.get("errors", [])),
+                int(progress.get("done", False)),
+                datetime.utcnow().isoformat(timespec="seconds"),
+            ),
+        )
+
+    def save_import(self, progress: dict, event=None):
+        """Record an import checkpoint ({key, owner, filename, rows_done,
+        imported, failed, errors, done}) on its own."""
+        with self._lock.writing(), self._conn:
+            self._save_import(progress)
+            self._log(event, actor=progress["owner"])
+
+    # ----- feed -----
+    def _log(self, event, actor=None, ref=None):
+        """Append `event` ((kind, text) or None) inside the caller's transaction."""
+        if not event:
+            return
+        kind, text = event
+        self._conn.execute(
+            "INSERT INTO feed (id, ts, kind, text, actor, ref) VALUES (?, ?, ?, ?, ?, ?)",
+            (str(uuid4()), datetime.now().isoformat(timespec="seconds"), kind, text, actor, ref),
+        )
+
+    def push_event(self, kind: str, text: str, actor=None, ref=None):
+        with self._lock.writing(), self._conn:
+            self._log((kind, text), actor, ref)
+
+    def list_events(self, limit: int = 20, offset: int = 0):
+        """Newest events first."""
+        with self._reading() as conn:
+            rows = conn.execute(
+                "SELECT id, ts, kind, text, actor, ref FROM feed ORDER BY seq DESC LIMIT ? OFFSET ?",
+                (limit, offset),
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+    def count_events(self) -> int:
+        with self._reading() as conn:
+            return conn.execute("SELECT COUNT(*) FROM feed").fetchone()[0]
@@ -0,0 +1,73 @@
+from aggregates import RatingAggregates
+
+FIELDS = ("food", "service")
+
+
+def place(pid, city="", tags=(), food=0, service=0, name=None):
+    return {"id": pid, "name": name or pid, "city": city, "tags": list(tags), "food": food, "service": service}
+
+
+def test_remove_last_place_empties_everything():
+    agg = RatingAggregates(FIELDS, [place("a", "Lisbon", ["pizza"], 4, 5)])
+    agg.remove("a")
+    assert len(agg) == 0
+    assert agg.stats(("all",))["places"] == 0
+    assert agg.top(("all",)) == []
+    assert agg.groups("city") == {} and agg.groups("tag") == {}
+    assert agg.groups("city_tag", "Lisbon") == {}
+
+
+def test_update_only_place_moves_it():
+    agg = RatingAggregates(FIELDS, [place("a", "Lisbon", food=4)])
+    agg.update("a", {"city": "Porto"})
+    assert agg.groups("city") == {"Porto": 1}
+    assert agg.stats(("city", "Lisbon"))["places"] == 0
+
+
+def test_running_stats_skip_unrated():
+    agg = RatingAggregates(FIELDS, [place("a", food=4, service=2), place("b", food=2), place("c")])
+    stats = agg.stats(("all",))
+    assert stats["places"] == 3
+    assert stats["food"]["count"] == 2 and stats["food"]["mean"] == 3.0
+    assert stats["food"]["variance"] == 1.0 and stats["food"]["stdev"] == 1.0
+    assert stats["service"]["count"] == 1
+    assert stats["overall"]["count"] == 2   # "c" has no rating at all
+
+
+def test_empty_group_stats():
+    agg = RatingAggregates(FIELDS)
+    stats = agg.stats(("city", "Nowhere"))
+    assert stats["places"] == 0 and stats["food"]["mean"] is None and stats["food"]["stdev"] is None
+    assert agg.top(("all",)) == []
+
+
+def test_top_orders_by_score_and_skips_stale_entries():
+    agg = RatingAggregates(FIELDS, [place(p, food=f) for p, f in (("a", 3), ("b", 5), ("c", 4), ("d", 0))])
+    assert [p["id"] for p in agg.top(("all",))] == ["b", "c", "a"]
+    agg.update("b", {"food": 1})
+    agg.remove("c")
+    assert [(p["id"], p["score"]) for p in agg.top(("all",))] == [("a", 3), ("b", 1)]
+    assert [p["id"] for p in agg.top(("all",), k=1)] == ["a"]
+
+
+def test_heap_is_compacted_after_many_edits():
+    agg = RatingAggregates(FIELDS, [place("a", food=3)])
+    for i in range(200):
+        agg.update("a", {"food": 1 + i % 5})
+    group = agg._groups[("all",)]
+    assert len(group.heap) <= 2 * group.ranked + 32 + 1
+    assert agg.top(("all",))[0]["score"] == 5
+
+
+def test_groups_by_kind_fold_cities():
+    agg = RatingAggregates(FIELDS, [
+        place("a", "São Paulo", ["Pizza"], 4),
+        place("b", " sao paulo", ["Pizza", "Bar"], 3),
+        place("c", "Lisbon", ["Bar"], 5),
+    ])
+    assert agg.groups("city") == {"São Paulo": 2, "Lisbon": 1}
+    assert agg.groups("tag") == {"Bar": 2, "Pizza": 2}
+    assert agg.groups("city_tag", "SAO PAULO") == {"Pizza": 2, "Bar": 1}
+    assert agg.groups("city_tag", "Porto") == {}
+    assert agg.stats(("city_tag", "sao paulo", "Pizza"))["places"] == 2
+    assert [p["city"] for p in agg.top(("city", "Sao Paulo"))] == ["São Paulo", "sao paulo"]
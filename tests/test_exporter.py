@@ -0,0 +1,111 @@
+import csv
+import io
+import json
+import os
+import time
+import zipfile
+
+import pytest
+
+import exporter
+from exporter import COLUMNS, ExportJob, Exporter, export_rows, write_csv, write_geojson
+from photos import BlobStore
+from storage import Store
+
+OWNER = "ana@example.com"
+
+
+def row(**fields):
+    return {**{c: None for c in COLUMNS}, "id": "p1", "name": "Tasca", "tags": [], **fields}
+
+
+def test_export_rows_rewrites_photos():
+    seen = set()
+    rows = list(export_rows([row(photo="abc"), row(id="p2")], lambda d: f"photos/{d}.jpg", seen))
+    assert [r["photo"] for r in rows] == ["photos/abc.jpg", None]
+    assert seen == {"abc"}
+
+
+@pytest.mark.parametrize("rows", [[], [row(tags=["Pizza", "Bar"], food=4, notes='say "hi", ok')]])
+def test_csv(rows):
+    out = io.BytesIO()
+    write_csv(iter(rows), out)
+    parsed = list(csv.reader(io.StringIO(out.getvalue().decode())))
+    assert parsed[0] == list(COLUMNS)
+    assert len(parsed) == 1 + len(rows)
+    if rows:
+        record = dict(zip(COLUMNS, parsed[1]))
+        assert record["tags"] == "Pizza, Bar" and record["notes"] == 'say "hi", ok'
+
+
+@pytest.mark.parametrize("rows", [[], [row(lat=38.7, lon=-9.1)], [row(), row(id="p2", lat=1.0, lon=2.0)]])
+def test_geojson(rows):
+    out = io.BytesIO()
+    write_geojson(iter(rows), out)
+    doc = json.loads(out.getvalue())
+    assert len(doc["features"]) == len(rows)
+    for feature, r in zip(doc["features"], rows):
+        if r["lat"] is None:
+            assert feature["geometry"] is None
+        else:
+            assert feature["geometry"]["coordinates"] == [r["lon"], r["lat"]]
+        assert "lat" not in feature["properties"]
+
+
+def test_parquet():
+    pq = pytest.importorskip("pyarrow.parquet")
+    for rows in ([], [row(food=4, tags=["Pizza"])]):
+        out = io.BytesIO()
+        exporter.write_parquet(iter(rows), out)
+        table = pq.read_table(io.BytesIO(out.getvalue()))
+        assert table.num_rows == len(rows) and table.column_names == list(COLUMNS)
+
+
+@pytest.fixture
+def setup(tmp_path):
+    store = Store(":memory:")
+    blobs = BlobStore(str(tmp_path / "blobs"))
+    return store, Exporter(blobs, out_dir=str(tmp_path / "exports"), url_prefix="x"), tmp_path / "exports"
+
+
+def finish(exp, job):
+    exp._pool.shutdown(wait=True)
+    return exp.get(job.id)
+
+
+def test_export_job(setup):
+    store, exp, out_dir = setup
+    for i in range(3):
+        store.add_place({"owner": OWNER, "name": f"P{i}", "food": i + 1})
+    job = finish(exp, exp.start(store, "csv", owner=OWNER, sort="Food"))
+    assert (job.status, job.rows, job.total) == ("done", 3, 3)
+    with open(out_dir / job.url.split("/")[-1], newline="") as f:
+        assert [r["name"] for r in csv.DictReader(f)] == ["P2", "P1", "P0"]
+
+
+def test_archive_of_nothing(setup):
+    store, exp, out_dir = setup
+    job = finish(exp, exp.start(store, "geojson", archive=True, owner=OWNER))
+    assert job.status == "done" and job.rows == 0
+    with zipfile.ZipFile(out_dir / job.url.split("/")[-1]) as zf:
+        assert zf.namelist() == ["places.geojson"]
+
+
+def test_unknown_format(setup):
+    store, exp, _ = setup
+    with pytest.raises(ValueError):
+        exp.start(store, "xlsx")
+
+
+def test_purge_drops_old_files_and_jobs(setup):
+    _, exp, out_dir = setup
+    os.makedirs(out_dir)
+    old, fresh, running = ExportJob("csv", False, 0), ExportJob("csv", False, 0), ExportJob("csv", False, 0)
+    old.finished_at, fresh.finished_at = time.time() - exporter.EXPORT_TTL - 1, time.time()
+    exp._jobs = {j.id: j for j in (old, fresh, running)}
+    stale = out_dir / "stale.csv"
+    stale.write_text("")
+    os.utime(stale, (0, 0))
+    exp.purge_expired()
+    assert set(exp._jobs) == {fresh.id, running.id}
+    assert not stale.exists()
@@ -0,0 +1,80 @@
+import math
+import random
+
+import pytest
+
+from gazetteer import Gazetteer, fold
+
+
+def city_line(i, name, lat, lon, alt="", country="PT", population=0):
+    cols = [""] * 19
+    cols[0], cols[1], cols[2], cols[3] = str(i), name, name, alt
+    cols[4], cols[5], cols[8], cols[14] = str(lat), str(lon), country, str(population)
+    return "\t".join(cols) + "\n"
+
+
+@pytest.fixture
+def make(tmp_path):
+    def make(lines):
+        path = tmp_path / "cities.tsv"
+        path.write_text("".join(lines), encoding="utf-8")
+        return Gazetteer(str(path))
+    return make
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    a = math.sin((p2 - p1) / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2
+    return 2 * 6371.0 * math.asin(math.sqrt(a))
+
+
+def test_fold():
+    assert fold("  São  Paulo! ") == "sao paulo"
+    assert fold("") == ""
+
+
+def test_empty(tmp_path):
+    gaz = Gazetteer(str(tmp_path / "missing.tsv"))
+    assert len(gaz) == 0
+    assert gaz.nearest(38.7, -9.1) is None
+    assert gaz.reverse_city(38.7, -9.1) is None
+    assert gaz.lookup("Lisbon") is None
+
+
+def test_single_city(make):
+    gaz = make([city_line(1, "Lisbon", 38.7, -9.1, "Lisboa,Lissabon", population=500000)])
+    assert gaz.reverse_city(38.71, -9.12) == "Lisbon"
+    assert gaz.reverse_city(41.1, -8.6, max_km=40) is None
+    assert gaz.lookup("lisboa") == (38.7, -9.1)
+    assert gaz.lookup("Lisbon, PT") == (38.7, -9.1)
+
+
+def test_lookup_prefers_the_most_populous(make):
+    gaz = make([
+        city_line(1, "Valencia", 10.16, -68.0, country="VE", population=1_000),
+        city_line(2, "Valencia", 39.47, -0.38, country="ES", population=800_000),
+    ])
+    assert gaz.lookup("Valencia") == (39.47, -0.38)
+
+
+def test_nearest_matches_brute_force(make):
+    rng = random.Random(3)
+    cities = [(rng.uniform(-80, 80), rng.uniform(-180, 180)) for _ in range(500)]
+    gaz = make([city_line(i, f"c{i}", lat, lon) for i, (lat, lon) in enumerate(cities)])
+    for _ in range(200):
+        lat, lon = rng.uniform(-90, 90), rng.uniform(-180, 180)
+        index, km = gaz.nearest(lat, lon)
+        best = min(haversine(lat, lon, *c) for c in cities)
+        assert km == pytest.approx(best, abs=1e-6)
+        assert haversine(lat, lon, gaz.lats[index], gaz.lons[index]) == pytest.approx(best, abs=1e-6)
+
+
+def test_suggest_by_prefix(make):
+    gaz = make([
+        city_line(1, "Lisbon", 38.7, -9.1, "Lisboa", population=500_000),
+        city_line(2, "Lisburn", 54.5, -6.0, country="GB", population=45_000),
+        city_line(3, "Porto", 41.1, -8.6, population=250_000),
+    ])
+    assert gaz.suggest("lisb") == ["Lisbon", "Lisburn"]
+    assert gaz.suggest("LISBO", limit=1) == ["Lisbon"]   # through the "Lisboa" alias
+    assert gaz.suggest("xyz") == [] and gaz.suggest("  ") == []
@@ -0,0 +1,38 @@
+import time
+
+import geocache
+from geocache import LOOKUP_FAILED, GeoCache
+
+
+def rows(cache):
+    return cache._conn.execute("SELECT key FROM geocache ORDER BY key").fetchall()
+
+
+def test_hits_misses_and_failures():
+    cache = GeoCache(":memory:")
+    assert cache.cached("a", lambda: [1.0, 2.0]) == [1.0, 2.0]
+    assert cache.cached("a", lambda: 1 / 0) == [1.0, 2.0]
+    assert cache.cached("none", lambda: None) is None
+    assert cache.cached("down", lambda: 1 / 0, default=LOOKUP_FAILED) is LOOKUP_FAILED
+    assert cache.cached("down", lambda: [0, 0], default=LOOKUP_FAILED) is LOOKUP_FAILED   # remembered
+    assert cache.stats()["misses"] == 3
+
+
+def test_purge_expired_deletes_rows():
+    cache = GeoCache(":memory:")
+    cache.put("old", [1, 2], ttl=-1)
+    cache.put("new", [3, 4], ttl=60)
+    cache.purge_expired()
+    assert rows(cache) == [("new",)]
+    assert cache.get("old") == (False, None)
+
+
+def test_writes_purge_at_most_every_interval(monkeypatch):
+    cache = GeoCache(":memory:")
+    cache.put("old", [1, 2], ttl=-1)   # the first write sweeps, before adding its row
+    cache.put("other", [1, 2], ttl=60)
+    assert ("old",) in rows(cache)
+    monkeypatch.setattr(geocache, "PURGE_INTERVAL", 0)
+    time.sleep(0.01)
+    cache.put("more", [1, 2], ttl=60)
+    assert ("old",) not in rows(cache)
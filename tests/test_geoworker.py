@@ -0,0 +1,77 @@
+import threading
+import time
+
+from geocache import LookupFailed
+from geoworker import GeocodeWorker, place_queries
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def test_place_queries():
+    assert place_queries("Tasca", "Lisbon") == ["Tasca Lisbon", "Lisbon"]
+
+
+def test_same_place_submitted_twice_is_geocoded_once():
+    release, lookups, results = threading.Event(), [], []
+
+    def geocode(q):
+        release.wait(5)
+        lookups.append(q)
+        return (1.0, 2.0)
+
+    worker = GeocodeWorker(geocode, lambda ids, coords: results.append((ids, coords)))
+    worker.submit("first", ["Busy"])       # holds the thread
+    wait_for(lambda: not worker._pending)
+    worker.submit_many([("p", ["Tasca Lisbon", "Lisbon"]), ("p", ["tasca  lisbon", "Lisbon"]), ("q", ["Tasca Lisbon", "Lisbon"])])
+    release.set()
+    wait_for(lambda: len(results) == 2)
+    assert results[1] == (["p", "q"], (1.0, 2.0))
+    assert lookups == ["busy", "tasca lisbon"]
+    assert worker.counters["coalesced"] == 1
+
+
+def test_failed_lookups_are_retried():
+    attempts, results = [], []
+
+    def geocode(q):
+        attempts.append(q)
+        if len(attempts) < 3:
+            raise LookupFailed("down")
+        return None
+
+    worker = GeocodeWorker(geocode, lambda ids, coords: results.append((ids, coords)), retry_delay=0.01)
+    worker.submit("p", ["Nowhere"])
+    wait_for(lambda: results)
+    assert results == [(["p"], None)]
+    assert worker.counters["failed"] == 2 and worker.counters["not_found"] == 1
+
+
+def test_unexpected_errors_do_not_kill_the_thread():
+    results = []
+
+    def geocode(q):
+        if q == "broken":
+            raise KeyError(q)
+        return (0.5, 0.5)
+
+    worker = GeocodeWorker(geocode, lambda ids, coords: results.append(ids), retry_delay=60)
+    worker.submit("a", ["broken"])
+    worker.submit("b", ["fine"])
+    wait_for(lambda: results)
+    assert results == [["b"]] and worker._thread.is_alive()
+
+
+def test_pending_counts_queued_and_retrying_places():
+    def down(q):
+        raise LookupFailed("down")
+
+    worker = GeocodeWorker(down, lambda ids, coords: None, retry_delay=60)
+    assert worker.pending() == 0
+    worker.submit_many([("a", ["x"]), ("b", ["x"]), ("c", ["y"])])
+    wait_for(lambda: worker.counters["failed"] == 2)
+    assert worker.pending() == 3
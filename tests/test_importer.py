@@ -0,0 +1,117 @@
+import io
+import json
+
+import pytest
+
+import importer
+from importer import iter_csv, iter_geojson, run_import, to_place
+from storage import Store
+
+OWNER = "ana@example.com"
+
+
+@pytest.fixture
+def store():
+    return Store(":memory:")
+
+
+def import_bytes(store, data: bytes, filename: str, **kwargs):
+    return list(run_import(store, io.BytesIO(data), filename, OWNER, **kwargs))
+
+
+def geojson(features) -> bytes:
+    return json.dumps({"type": "FeatureCollection", "features": features}).encode()
+
+
+def feature(name, lon=-9.1, lat=38.7, **props):
+    return {"type": "Feature", "geometry": {"type": "Point", "coordinates": [lon, lat]}, "properties": {"name": name, **props}}
+
+
+def test_csv_delimiter_and_aliases():
+    rows = list(iter_csv(io.StringIO("Title;Town;Food\nTasca;Lisbon;4\n")))
+    assert rows == [{"Title": "Tasca", "Town": "Lisbon", "Food": "4"}]
+    place, queries = to_place(rows[0], OWNER)
+    assert (place["name"], place["city"], place["food"], place["geo_status"]) == ("Tasca", "Lisbon", 4, "pending")
+    assert queries
+
+
+def test_csv_header_only():
+    assert list(iter_csv(io.StringIO("name,city\n"))) == []
+
+
+def test_to_place_rejects_bad_rows():
+    with pytest.raises(ValueError, match="no name"):
+        to_place({"city": "Lisbon"}, OWNER)
+    with pytest.raises(ValueError, match="food"):
+        to_place({"name": "X", "food": "great"}, OWNER)
+    place, _ = to_place({"name": "X", "lat": "0", "lon": "0", "tags": "pizza; bar|pizza"}, OWNER)
+    assert place["lat"] is None and place["tags"] == ["Pizza", "Bar"]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 64 * 1024])
+def test_geojson_streams_across_chunks(chunk_size):
+    data = geojson([feature(f"Place {i}", notes="braces } and ] inside") for i in range(5)]).decode()
+    found = list(iter_geojson(io.StringIO(data), chunk_size=chunk_size))
+    assert [f["properties"]["name"] for f in found] == [f"Place {i}" for i in range(5)]
+
+
+def test_geojson_empty_and_top_level_array():
+    assert list(iter_geojson(io.StringIO('{"type": "FeatureCollection", "features": []}'))) == []
+    assert len(list(iter_geojson(io.StringIO(json.dumps([feature("A")]))))) == 1
+
+
+def test_geojson_truncated():
+    data = geojson([feature("A"), feature("B")]).decode()[:-20]
+    with pytest.raises(ValueError):
+        list(iter_geojson(io.StringIO(data), chunk_size=16))
+
+
+def test_takeout_nested_location():
+    record = importer.feature_record({
+        "type": "Feature",
+        "geometry": {"type": "Point", "coordinates": [0, 0]},
+        "properties": {"Title": "Cafe", "Location": {"Address": "Rua 1, Porto", "Geo Coordinates": {"Latitude": "41.1", "Longitude": "-8.6"}}},
+    })
+    place, _ = to_place(record, OWNER)
+    assert (place["name"], place["lat"], place["lon"]) == ("Cafe", 41.1, -8.6)
+
+
+def test_import_counts_failures_and_submits_pending(store):
+    jobs = []
+    data = b"name,city,lat,lon\nA,Lisbon,38.7,-9.1\n,Porto,,\nB,Porto,,\n"
+    progress = import_bytes(store, data, "places.csv", submit_geocodes=jobs.extend)[-1]
+    assert (progress["imported"], progress["failed"], progress["done"]) == (2, 1, True)
+    assert progress["errors"] == [[2, "no name"]]
+    assert store.count_places(owner=OWNER) == 2
+    assert len(jobs) == 1
+
+
+def test_import_of_an_empty_file(store):
+    progress = import_bytes(store, b"name,city\n", "places.csv")[-1]
+    assert progress["done"] and progress["imported"] == 0
+
+
+def test_import_resumes_after_the_last_batch(store, monkeypatch):
+    data = geojson([feature(f"P{i}") for i in range(7)])
+    real = store.add_places
+    calls = []
+
+    def flaky(batch, **kwargs):
+        calls.append(len(batch))
+        if len(calls) == 2:
+            raise RuntimeError("tab closed")
+        return real(batch, **kwargs)
+
+    monkeypatch.setattr(store, "add_places", flaky)
+    with pytest.raises(RuntimeError):
+        import_bytes(store, data, "saved.json", batch_size=3)
+    assert store.count_places() == 3
+
+    monkeypatch.setattr(store, "add_places", real)
+    progress = import_bytes(store, data, "saved.json", batch_size=3)
+    assert progress[0]["resumed_from"] == 3
+    assert progress[-1]["imported"] == 7 and progress[-1]["done"]
+    assert sorted(p["name"] for p in store.iter_places()) == [f"P{i}" for i in range(7)]
+
+    again = import_bytes(store, data, "saved.json")
+    assert again == [{**again[0], "already_imported": True}] and store.count_places() == 7
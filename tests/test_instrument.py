@@ -0,0 +1,30 @@
+from instrument import LatencyHistogram, Registry, prometheus_value
+
+
+def test_quantiles():
+    h = LatencyHistogram(buckets=(0.01, 0.1))
+    assert h.quantile(0.5) == 0.0
+    for seconds in (0.005, 0.05, 0.05, 5.0):
+        h.observe(seconds)
+    assert h.quantile(0.5) == 0.1
+    assert h.quantile(0.95) == float("inf")
+    assert h.snapshot()["buckets"] == {"0.01": 1, "0.1": 2, "+Inf": 1}
+
+
+def test_prometheus_values():
+    assert prometheus_value(float("inf")) == "+Inf"
+    assert prometheus_value(float("-inf")) == "-Inf"
+    assert prometheus_value(float("nan")) == "NaN"
+    assert prometheus_value(True) == "1"
+    assert prometheus_value(0.25) == "0.25" and prometheus_value(3) == "3"
+
+
+def test_prometheus_text_has_no_python_inf():
+    registry = Registry()
+    registry.register_collector("http", lambda: {"nominatim p95": float("inf"), "nominatim requests": 2})
+    with registry.span("page.home"):
+        pass
+    text = registry.prometheus_text()
+    assert 'trustbites_http{stat="nominatim p95"} +Inf' in text
+    assert 'le="+Inf"' in text
+    assert " inf" not in text
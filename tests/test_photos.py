@@ -0,0 +1,31 @@
+import os
+from io import BytesIO
+
+import pytest
+
+from photos import FORMATS, RENDITIONS, BlobStore
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def jpeg(color=(200, 40, 40), size=(640, 480)) -> bytes:
+    buf = BytesIO()
+    Image.new("RGB", size, color).save(buf, format="JPEG")
+    return buf.getvalue()
+
+
+def test_put_stores_every_rendition_once(tmp_path):
+    blobs = BlobStore(str(tmp_path))
+    data = jpeg()
+    digest = blobs.put(data)
+    assert blobs.exists(digest)
+    assert all(os.path.exists(blobs.path(digest, r, ext)) for r in RENDITIONS for ext in FORMATS)
+    mtime = os.path.getmtime(blobs.path(digest, "full"))
+    assert blobs.put(data) == digest
+    assert os.path.getmtime(blobs.path(digest, "full")) == mtime
+    assert blobs.url(digest, "card").endswith(f"{digest}_card.jpg")
+
+
+def test_put_rejects_non_images(tmp_path):
+    with pytest.raises(Exception):
+        BlobStore(str(tmp_path)).put(b"not an image")
@@ -0,0 +1,86 @@
+import random
+
+import pytest
+
+from similar import SimilarPlaces
+
+FIELDS = ("food", "service", "location", "price")
+
+
+def place(pid, ratings=(3, 3, 3, 3), tags=(), name=None, city="Lisbon", lat=None, lon=None):
+    return {"id": pid, "name": name or pid, "city": city, "tags": list(tags), "lat": lat, "lon": lon, **dict(zip(FIELDS, ratings))}
+
+
+def ids(found):
+    return [p["id"] for p in found]
+
+
+def test_empty_and_unknown():
+    sim = SimilarPlaces(FIELDS)
+    sim.apply("load", [])
+    assert sim.similar(["nope"]) == {}
+    sim.apply("add", [place("a")])
+    assert sim.similar(["a"]) == {"a": []}
+
+
+def test_neutral_untagged_places_are_alike():
+    sim = SimilarPlaces(FIELDS)
+    sim.apply("load", [place("a"), place("b"), place("c", tags=["Pizza"]), place("d", (5, 5, 5, 5))])
+    assert ids(sim.similar(["a"])["a"]) == ["b"]
+
+
+def test_ratings_and_tags_rank_neighbours():
+    sim = SimilarPlaces(FIELDS)
+    sim.apply("load", [
+        place("a", (5, 4, 4, 2), ["Pizza"]),
+        place("b", (5, 4, 4, 2), ["Pizza"]),
+        place("c", (5, 4, 3, 2), ["Pizza"]),
+        place("d", (1, 1, 2, 5), ["Sushi"]),
+    ])
+    found = sim.similar(["a"])["a"]
+    assert ids(found) == ["b", "c"]
+    assert found[0]["score"] == pytest.approx(1.0)
+
+
+def test_same_restaurant_is_not_similar_to_itself():
+    sim = SimilarPlaces(FIELDS)
+    sim.apply("load", [place("a", name="Tasca"), place("b", name="tasca "), place("c")])
+    assert ids(sim.similar(["a"])["a"]) == ["c"]
+
+
+def test_max_km():
+    sim = SimilarPlaces(FIELDS)
+    sim.apply("load", [place("a", lat=38.7, lon=-9.1), place("b", lat=38.71, lon=-9.1), place("c", lat=41.1, lon=-8.6), place("d")])
+    assert ids(sim.similar(["a"], max_km=25)["a"]) == ["b"]
+    assert sim.similar(["d"], max_km=25) == {"d": []}
+
+
+def test_update_and_delete_reuse_rows():
+    sim = SimilarPlaces(FIELDS)
+    sim.apply("load", [place("a"), place("b")])
+    sim.apply("update", "b", {"food": 5, "service": 5, "location": 5, "price": 5})
+    assert sim.similar(["a"])["a"] == []
+    sim.apply("delete", "b")
+    sim.apply("add", [place("c")])
+    assert len(sim) == 2 and ids(sim.similar(["a"])["a"]) == ["c"]
+
+
+def test_lsh_finds_identical_places():
+    rng = random.Random(5)
+    tags = ["Pizza", "Sushi", "Bar", "Brunch", "Vegan", "Cafe"]
+    places = []
+    for i in range(150):
+        ratings, picked = tuple(rng.randint(1, 5) for _ in FIELDS), rng.sample(tags, 2)
+        places += [place(f"p{i}", ratings, picked), place(f"twin{i}", ratings, picked)]
+    sim = SimilarPlaces(FIELDS, exact_limit=10)
+    sim.apply("load", places)
+    found = sim.similar([f"p{i}" for i in range(150)], k=1)
+    assert sim._codes is not None   # answered through the LSH index
+    for i in range(150):
+        assert found[f"p{i}"][0]["score"] == pytest.approx(1.0)
+
+
+def test_lsh_falls_back_to_the_full_product():
+    sim = SimilarPlaces(FIELDS, exact_limit=1)
+    sim.apply("load", [place("a", (5, 4, 4, 2)), place("b", (5, 4, 3, 2)), place("c", (1, 1, 1, 1))])
+    assert ids(sim.similar(["a"], k=2)["a"]) == ["b"]
@@ -0,0 +1,80 @@
+import pytest
+
+from storage import Store
+
+
+@pytest.fixture
+def store():
+    return Store(":memory:")
+
+
+def add(store, name="Tasca", city="Lisbon", **fields):
+    return store.add_place({"owner": "ana@example.com", "name": name, "city": city, "food": 4, **fields})
+
+
+def test_delete_and_edit_the_only_place(store):
+    p = add(store)
+    store.update_place(p["id"], city="Porto")
+    assert store.ratings.groups("city") == {"Porto": 1}
+    store.delete_place(p["id"])
+    assert store.count_places() == 0
+    assert len(store.ratings) == 0
+
+
+def test_failing_watcher_does_not_undo_the_write(store):
+    seen = []
+
+    def broken(kind, *args):
+        if kind == "delete":
+            raise RuntimeError("boom")
+
+    store.watch(broken)
+    store.watch(lambda kind, *args: seen.append(kind))
+    p = add(store)
+    store.delete_place(p["id"])
+    assert store.count_places() == 0
+    assert len(store.ratings) == 0
+    assert seen == ["load", "add", "delete"]
+
+
+def test_rolled_back_write_leaves_indexes_alone(store):
+    seen = []
+    store.watch(lambda kind, *args: seen.append(kind))
+    p = add(store)
+    with pytest.raises(Exception):
+        store.add_place({"id": p["id"], "owner": "ana@example.com", "name": "Dup"})   # primary key clash
+    assert store.count_places() == 1
+    assert len(store.ratings) == 1
+    assert seen == ["load", "add"]
+
+
+def test_rwlock_readers_share_writers_exclude():
+    import threading
+    import time
+
+    from storage import RWLock
+
+    lock = RWLock()
+    inside, log = [0], []
+    both_read = threading.Barrier(2, timeout=5)
+
+    def reader():
+        with lock.reading():
+            inside[0] += 1
+            both_read.wait()   # two readers in at once, or this times out
+            log.append(("read", inside[0]))
+            time.sleep(0.05)
+            inside[0] -= 1
+
+    def writer():
+        time.sleep(0.01)
+        with lock.writing():
+            log.append(("write", inside[0]))
+
+    threads = [threading.Thread(target=f) for f in (reader, reader, writer)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+    assert ("write", 0) in log   # no reader was inside during the write
+    assert [kind for kind, _ in log].count("read") == 2
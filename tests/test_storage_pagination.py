@@ -0,0 +1,70 @@
+import itertools
+
+import pytest
+
+from storage import SORT_COLUMNS, Store
+
+SORTS = list(SORT_COLUMNS)
+
+
+@pytest.fixture
+def store():
+    store = Store(":memory:")
+    # repeated ratings, names differing only in case and shared timestamps,
+    # so every order has ties for the cursor to break
+    for i, (food, name) in enumerate(zip(itertools.cycle([5, 3, 3, 1, 0]), itertools.cycle(["alma", "Alma", "Bica", "cais"]))):
+        if i == 23:
+            break
+        store.add_place({
+            "owner": "ana@example.com" if i % 3 else "rui@example.com",
+            "name": name,
+            "food": food,
+            "service": i % 4,
+            "created_at": f"2024-01-{1 + i // 3:02d}T12:00:00",
+        })
+    return store
+
+
+def pages(store, sort, size, **filters):
+    after, seen = None, []
+    while True:
+        page = store.list_places(sort=sort, limit=size, after=after, **filters)
+        seen.append([p["id"] for p in page])
+        if len(page) < size:
+            return seen
+        after = store.page_cursor(page[-1], sort)
+
+
+@pytest.mark.parametrize("sort", SORTS)
+@pytest.mark.parametrize("size", [1, 4, 23, 50])
+def test_cursor_pages_match_the_full_list(store, sort, size):
+    full = [p["id"] for p in store.list_places(sort=sort, limit=100)]
+    assert len(full) == 23
+    walked = pages(store, sort, size)
+    assert [pid for page in walked for pid in page] == full
+    assert all(len(page) == size for page in walked[:-1])
+
+
+@pytest.mark.parametrize("sort", SORTS)
+def test_cursor_with_owner_filter(store, sort):
+    full = [p["id"] for p in store.list_places(owner="rui@example.com", sort=sort, limit=100)]
+    walked = pages(store, sort, 2, owner="rui@example.com")
+    assert [pid for page in walked for pid in page] == full
+
+
+def test_cursor_is_stable_under_inserts(store):
+    first = store.list_places(sort="Food", limit=5)
+    store.add_place({"owner": "ana@example.com", "name": "New", "food": 5})
+    second = store.list_places(sort="Food", limit=5, after=store.page_cursor(first[-1], "Food"))
+    full = [p["id"] for p in store.list_places(sort="Food", limit=100)]
+    assert [p["id"] for p in second] == full[full.index(first[-1]["id"]) + 1:][:5]
+
+
+def test_empty_and_single_row():
+    store = Store(":memory:")
+    assert store.list_places() == []
+    assert list(store.iter_places()) == []
+    p = store.add_place({"owner": "ana@example.com", "name": "Only"})
+    assert [x["id"] for x in store.list_places(limit=1)] == [p["id"]]
+    assert store.list_places(after=store.page_cursor(p)) == []
+    assert [x["id"] for x in store.iter_places(batch=1)] == [p["id"]]
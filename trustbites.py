@@ -1,13 +1,21 @@
-import base64
+import html
+import math
+import os
 from datetime import datetime
-from uuid import uuid4
-from io import BytesIO
 
 import streamlit as st
-import folium
-from streamlit_folium import st_folium
-from PIL import Image
-import requests
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from assets import Assets, initials_avatar
+from exporter import FORMATS as EXPORT_FORMATS, Exporter
+from gazetteer import Gazetteer
+from geocache import LOOKUP_FAILED, GeoCache, LookupFailed, normalize_query, snap_to_grid
+from geoworker import GeocodeWorker, TokenBucket, place_queries
+from importer import run_import
+from instrument import count, registry, rerun, span, timed
+from photos import BlobStore
+from spatial import format_distance
+from storage import DISTANCE_SORT, RATING_FIELDS, RELEVANCE_SORT, Store
 
 
 # ------------- PAGE CONFIG -------------
@@ -15,21 +23,7 @@ st.set_page_config(page_title="TrustBites", page_icon="🍴", layout="wide")
 
 
 # ------------- THEME / CSS -------------
-def _load_logo_b64():
-    try:
-        with open("trustbites_logo.png", "rb") as f:  # logo file in same folder
-            return base64.b64encode(f.read()).decode("utf-8")
-    except Exception:
-        return None
-
-
-LOGO_B64 = _load_logo_b64()
-
-
-def inject_styles():
-    st.markdown(
-        """
-    <style>
+STYLES = """
       :root{
         --brand: #2563EB;
         --brand-light: #3B82F6;
@@ -307,16 +301,41 @@ def inject_styles():
         }
       }
 
-    </style>
-    <link href="https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700&display=swap" rel="stylesheet">
-    """,
-        unsafe_allow_html=True,
-    )
+"""
+
+FONT_LINK = '<link href="https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700&display=swap" rel="stylesheet">'
+
+
+@st.cache_resource
+def get_assets():
+    """Minified CSS and the hashed logo rendition, built once per process."""
+    return Assets(STYLES)
+
+
+def inject_styles():
+    st.markdown(f"<style>{get_assets().css}</style>{FONT_LINK}", unsafe_allow_html=True)
+
 
 inject_styles()
 
 
 # ------------- STATE HELPERS -------------
+LIST_PAGE_SIZE = int(os.environ.get("TRUSTBITES_LIST_PAGE_SIZE", 20))   # default places per page in My list
+LIST_PAGE_SIZES = sorted({10, 20, 50, LIST_PAGE_SIZE})
+FEED_PAGE_SIZE = 30   # events loaded per "Show older activity" click
+FEED_MAX_EVENTS = 300   # the feed never reaches further back into the log
+RECOMMEND_VIA_SHOWN = 3   # names listed under a recommendation
+SIMILAR_NEARBY_KM = 25   # "Similar places nearby only" radius
+
+
+@st.cache_resource
+def get_store():
+    """One SQLite-backed store per process, shared by every session."""
+    store = Store()
+    store.migrate_inline_photos(get_blobstore().put)
+    return store
+
+
 def _ensure_state():
     st.session_state.setdefault(
         "auth",
@@ -324,11 +343,8 @@ def _ensure_state():
     )
     st.session_state.setdefault(
         "profile",
-        {"name": "", "bio": "", "photo_b64": None},
+        {"name": "", "bio": "", "photo": None},
     )
-    st.session_state.setdefault("users", {})
-    st.session_state.setdefault("places", [])
-    st.session_state.setdefault("feed", [])
     st.session_state.setdefault("edit_item", None)
     st.session_state.setdefault("page", "Home")   # current page we route on
     st.session_state.setdefault("map_center", None)
@@ -337,9 +353,7 @@ def _ensure_state():
 
 
 def hero(title: str, subtitle: str):
-    logo_html = ""
-    if LOGO_B64:
-        logo_html = f'<img src="data:image/png;base64,{LOGO_B64}" style="height:34px;margin-right:10px;border-radius:8px;" />'
+    logo_html = get_assets().logo_html(style="height:34px;margin-right:10px;border-radius:8px;")
     st.markdown(
         f"""
         <div class="tb-hero">
@@ -357,116 +371,267 @@ def hero(title: str, subtitle: str):
     st.markdown("<div style='height:0.5rem'></div>", unsafe_allow_html=True)
 
 
-def _avatar():
+def _avatar_html(rendition: str, css_class: str = "", style: str = "") -> str:
+    """Profile photo at the given rendition, or the generated initials avatar."""
     p = st.session_state["profile"]
-    if p.get("photo_b64"):
-        return f"data:image/jpeg;base64,{p['photo_b64']}"
+    if p.get("photo"):
+        return photo_html(p["photo"], rendition, style=style, css_class=css_class, alt="Profile")
+    attrs = f' class="{css_class}"' if css_class else ""
+    attrs += f' style="{style}"' if style else ""
+    return f'<img src="{_initials_avatar()}" alt="Profile"{attrs} />'
+
+
+def _initials_avatar():
     a = st.session_state["auth"]
     initials = "".join(
         [x[:1] for x in [a.get("first_name", ""), a.get("last_name", "")] if x]
     ).upper() or "?"
-    svg = f"""
-    <svg xmlns="http://www.w3.org/2000/svg" width="64" height="64">
-      <circle cx="32" cy="32" r="32" fill="#1F2937"/>
-      <text x="50%" y="52%" dominant-baseline="middle" text-anchor="middle"
-            fill="#E5E7EB" font-family="system-ui" font-size="28">{initials}</text>
-    </svg>""".strip()
-    return "data:image/svg+xml;base64," + base64.b64encode(svg.encode()).decode()
+    return initials_avatar(initials)
 
 
-def _feed_push(kind: str, text: str):
-    st.session_state["feed"].append(
-        {
-            "id": str(uuid4()),
-            "ts": datetime.now().isoformat(timespec="seconds"),
-            "kind": kind,
-            "text": text,
-        }
-    )
+@st.cache_resource
+def get_blobstore():
+    """Content-addressed photo renditions, served from static/blobs."""
+    blobs = BlobStore()
+    blobs.backfill_renditions()
+    return blobs
 
 
-def _ensure_places_schema():
-    for p in st.session_state["places"]:
-        p.setdefault("tags", [])
-        p.setdefault("photo_b64", None)
-        p.setdefault("city", "")
-        p.setdefault("food", 0)
-        p.setdefault("service", 0)
-        p.setdefault("location", 0)
-        p.setdefault("price", 0)
-        p.setdefault("notes", "")
-        p.setdefault("lat", None)   
-        p.setdefault("lon", None)
+@st.cache_resource
+def get_exporter():
+    """Background exports, written to static/exports."""
+    return Exporter(get_blobstore())
 
 
-def image_file_to_b64(file, max_size=1024):
+@st.cache_resource
+def get_recommender():
+    """Friend recommendations, kept current by the store's change notifications."""
+    from recommend import Recommender
+
+    recommender = Recommender(RATING_FIELDS)
+    get_store().watch(recommender.apply)
+    return recommender
+
+
+@st.cache_resource
+def get_similar():
+    """"Similar places" vectors, kept current by the store's change notifications."""
+    from similar import SimilarPlaces
+
+    similar = SimilarPlaces(RATING_FIELDS)
+    get_store().watch(similar.apply)
+    return similar
+
+
+def photo_url(digest: str, rendition: str = "full") -> str:
+    return get_blobstore().url(digest, rendition)
+
+
+def photo_html(digest: str, rendition: str, style: str = "", css_class: str = "", alt: str = "") -> str:
+    return get_blobstore().picture_html(digest, rendition, style=style, css_class=css_class, alt=alt)
+
+
+def _processed_upload(uploaded_file):
+    """Digest for an upload (see `store_photo`), stored once per upload.
+
+    Streamlit hands the same UploadedFile back on every rerun, so the result
+    is memoized on its file_id; identical content uploaded again is caught by
+    the blob store's content hash and never decoded twice.
+    """
+    memo = st.session_state.setdefault("_processed_uploads", {})
+    if uploaded_file.file_id in memo:
+        count("photo.upload_memo_hits")
+    else:
+        memo[uploaded_file.file_id] = store_photo(uploaded_file)
+    return memo[uploaded_file.file_id]
+
+
+def store_photo(file):
+    """Store every rendition of an uploaded image once; returns its SHA-256
+    digest, or None (with an error shown) when the image can't be read."""
     if not file:
         return None
     try:
-        img = Image.open(file).convert("RGB")
-        img.thumbnail((max_size, max_size))
-        buf = BytesIO()
-        img.save(buf, format="JPEG", quality=85)
-        return base64.b64encode(buf.getvalue()).decode("utf-8")
-    except Exception:
+        return get_blobstore().put(file.getvalue())
+    except Exception as e:
+        st.error(f"Failed to process photo: {e}")
         return None
 
 
 # ---------- GEO HELPERS ----------
-def geocode_place(query: str):
-    try:
-        url = "https://nominatim.openstreetmap.org/search"
-        headers = {"User-Agent": "TrustBitesStudentProject/0.1"}
-        params = {"q": query, "format": "json", "limit": 1}
-        resp = requests.get(url, params=params, headers=headers, timeout=5)
-        data = resp.json()
-        if not data:
-            return None
-        return float(data[0]["lat"]), float(data[0]["lon"])
-    except Exception:
+@st.cache_resource
+def get_geocache():
+    """Geocoding cache shared by every session (memory LRU + SQLite on disk)."""
+    cache = GeoCache()
+    cache.purge_expired()   # and then every PURGE_INTERVAL, as entries are written
+    registry.register_collector("geocache", cache.stats)
+    return cache
+
+
+@st.cache_resource
+def get_nominatim_limiter():
+    """Process-wide token bucket keeping us within Nominatim's 1 request/second."""
+    return TokenBucket()
+
+
+NOMINATIM_URL = "https://nominatim.openstreetmap.org"
+MIN_CITY_PREFIX = 4   # shorter half-typed city names are too ambiguous to complete
+
+
+@st.cache_resource
+def get_http_client():
+    """Pooled HTTP client (keep-alive, retries, circuit breaker) for all geocoding calls.
+
+    Imported here, not at the top: `requests` is only loaded once a lookup
+    misses both the gazetteer and the cache.
+    """
+    from http_client import HttpClient
+
+    client = HttpClient()
+    registry.register_collector("http", lambda: _http_gauges(client.stats()))
+    return client
+
+
+def _http_gauges(stats: dict) -> dict:
+    gauges = {}
+    for endpoint, h in stats["latency"].items():
+        gauges.update({f"{endpoint} requests": h["count"], f"{endpoint} p50": h["p50"], f"{endpoint} p95": h["p95"]})
+    for host, state in stats["breakers"].items():
+        gauges[f"{host} circuit_open"] = int(state != "closed")
+    return gauges
+
+
+def _nominatim_search(query: str):
+    params = {"q": query, "format": "json", "limit": 1}
+    data = get_http_client().get_json(
+        f"{NOMINATIM_URL}/search", params=params, limiter=get_nominatim_limiter()
+    )
+    if not data:
         return None
+    return float(data[0]["lat"]), float(data[0]["lon"])
+
+
+def _nominatim_reverse_city(lat: float, lon: float):
+    params = {
+        "lat": lat,
+        "lon": lon,
+        "format": "json",
+        "zoom": 10,
+    }
+    data = get_http_client().get_json(
+        f"{NOMINATIM_URL}/reverse", params=params, limiter=get_nominatim_limiter()
+    )
+    addr = data.get("address", {})
+    for key in ["city", "town", "village", "municipality"]:
+        if addr.get(key):
+            return addr[key]
+    return None
 
 
+@st.cache_resource
+def get_gazetteer():
+    """Offline city index: answers city-only lookups without touching Nominatim."""
+    return Gazetteer()
+
+
+@timed("geocode.search")
+def geocode_place(query: str):
+    """(lat, lon), or None if nothing matches; raises LookupFailed when
+    Nominatim can't be reached, so the worker retries instead of giving up.
+    When neither the gazetteer nor Nominatim knows the query, a half-typed
+    city ("Lisb") is completed to the most populous city it starts."""
+    q = normalize_query(query)
+    if not q:
+        return None
+    # plain city names never need the network
+    coords = get_gazetteer().lookup(q)
+    if coords:
+        count("geocode.gazetteer_hits")
+        return coords
+    coords = get_geocache().cached(f"search:{q}", lambda: _nominatim_search(q), default=LOOKUP_FAILED)
+    if coords is LOOKUP_FAILED:
+        raise LookupFailed(f"geocoding {q!r} failed")
+    if coords:
+        return tuple(coords)
+    if len(q) >= MIN_CITY_PREFIX:
+        cities = get_gazetteer().suggest(q, limit=1)
+        if cities:
+            count("geocode.gazetteer_hits")
+            return get_gazetteer().lookup(cities[0])
+    return None
+
+
+@timed("geocode.reverse")
 def reverse_geocode_city(lat: float, lon: float) -> str:
     """
-    Given coordinates, try to guess the city using OpenStreetMap Nominatim.
+    Given coordinates, guess the city from the offline gazetteer, falling back
+    to OpenStreetMap Nominatim when no known city is close enough.
     Returns a short city/town/village string or 'Unknown city'.
+    Nominatim lookups are snapped to a small grid so nearby clicks share a cache entry.
     """
-    try:
-        url = "https://nominatim.openstreetmap.org/reverse"
-        headers = {"User-Agent": "TrustBites/0.1 (student project)"}
-        params = {
-            "lat": lat,
-            "lon": lon,
-            "format": "json",
-            "zoom": 10,
-        }
-        resp = requests.get(url, headers=headers, params=params, timeout=5)
-        data = resp.json()
-        addr = data.get("address", {})
-        for key in ["city", "town", "village", "municipality"]:
-            if addr.get(key):
-                return addr[key]
-    except Exception:
-        pass
-    return "Unknown city"
+    city = get_gazetteer().reverse_city(lat, lon)
+    if city:
+        count("geocode.gazetteer_hits")
+        return city
+    slat, slon = snap_to_grid(lat, lon)
+    city = get_geocache().cached(
+        f"reverse:{slat:.6f},{slon:.6f}", lambda: _nominatim_reverse_city(slat, slon)
+    )
+    return city or "Unknown city"
 
 
-CITY_CENTERS = {
-    "Lisbon": (38.7223, -9.1393),
-    "Milan": (45.4642, 9.19),
-}
+@st.cache_resource
+def get_geoworker():
+    """Background geocoder; picks up places still pending from a previous run."""
+    store = get_store()
+    worker = GeocodeWorker(geocode_place, store.set_coords)
+    worker.submit_many((p["id"], place_queries(p["name"], p["city"])) for p in store.pending_geocodes())
+    registry.register_collector("geoworker", lambda: {**worker.counters, "pending": worker.pending()})
+    return worker
+
+
+DEFAULT_MAP_CENTER = (38.7223, -9.1393)   # Lisbon
+MAP_WIDTH, MAP_HEIGHT, MAP_ZOOM = 980, 560, 13
+MAP_MARGIN = 0.5          # load this fraction of the viewport beyond each edge
+MAP_MAX_MARKERS = 5000
+MAP_NEARBY, MAP_NEARBY_KM = 5, 2.0   # saved places listed under a clicked point
+DUPLICATE_PIN_KM = 0.03
+
+def _map_bbox(view):
+    """(south, west, north, east) of the last reported viewport grown by MAP_MARGIN.
+
+    Before the browser has reported bounds, the box is estimated from the
+    center and zoom (Web Mercator: 256px tiles, 2**zoom tiles per 360°).
+    """
+    bounds = view.get("bounds") or {}
+    sw, ne = bounds.get("_southWest") or {}, bounds.get("_northEast") or {}
+    if None not in (sw.get("lat"), sw.get("lng"), ne.get("lat"), ne.get("lng")):
+        south, west, north, east = sw["lat"], sw["lng"], ne["lat"], ne["lng"]
+    else:
+        lat, lon = view["center"]
+        deg_per_px = 360 / (256 * 2 ** view["zoom"])
+        half_w = MAP_WIDTH / 2 * deg_per_px
+        half_h = MAP_HEIGHT / 2 * deg_per_px * math.cos(math.radians(lat))
+        south, west, north, east = lat - half_h, lon - half_w, lat + half_h, lon + half_w
+
+    width = east - west if east >= west else east + 360 - west
+    dy, dx = (north - south) * MAP_MARGIN, width * MAP_MARGIN
+    south, north = max(-90.0, south - dy), min(90.0, north + dy)
+    if width + 2 * dx >= 360:
+        return south, -180.0, north, 180.0
+    # Leaflet reports unwrapped longitudes after panning past ±180
+    west = (west - dx + 180) % 360 - 180
+    east = (east + dx + 180) % 360 - 180
+    return south, west, north, east
 
 
 # ---------- NAV + TOP BAR ----------
 def _render_header():
     """Render the logo and user info header."""
     auth = st.session_state["auth"]
-    avatar_url = _avatar()
+    avatar_html = _avatar_html("header", css_class="tb-avatar-small")
     
-    logo_html = ""
-    if LOGO_B64:
-        logo_html = f'<img src="data:image/png;base64,{LOGO_B64}" alt="TrustBites" />'
+    logo_html = get_assets().logo_html()
     
     if auth["signed_in"]:
         user_name = f"{auth.get('first_name', '')} {auth.get('last_name', '')}".strip() or auth['email'].split('@')[0]
@@ -479,8 +644,8 @@ def _render_header():
                     <span>TrustBites</span>
                 </div>
                 <div class="tb-user-menu">
-                    <span class="tb-user-name">{user_name}</span>
-                    <img src="{avatar_url}" class="tb-avatar-small" alt="Profile" />
+                    <span class="tb-user-name">{html.escape(user_name)}</span>
+                    {avatar_html}
                 </div>
             </div>
             ''',
@@ -510,7 +675,7 @@ def _navbar():
     if auth["signed_in"]:
         current_page = st.session_state.get("page", "Home")
         
-        col1, col2, col3, col4, col5, col6, col_spacer, col_signout = st.columns([1.2, 1.4, 1, 0.8, 0.8, 1.2, 2, 1])
+        col1, col2, col3, col4, col5, col7, col6, col_spacer, col_signout = st.columns([1.2, 1.4, 1, 0.8, 0.8, 0.9, 1.2, 1.1, 1])
         
         with col1:
             if st.button("🏠 Home", key="nav_Home", type="primary" if current_page == "Home" else "secondary", use_container_width=True):
@@ -537,6 +702,11 @@ def _navbar():
                 st.session_state["page"] = "Feed"
                 st.rerun()
         
+        with col7:
+            if st.button("📊 Stats", key="nav_Stats", type="primary" if current_page == "Stats" else "secondary", use_container_width=True):
+                st.session_state["page"] = "Stats"
+                st.rerun()
+
         with col6:
             if st.button("👤 Profile", key="nav_Profile", type="primary" if current_page == "Profile" else "secondary", use_container_width=True):
                 st.session_state["page"] = "Profile"
@@ -550,7 +720,7 @@ def _navbar():
                     "first_name": "",
                     "last_name": "",
                 }
-                st.session_state["profile"] = {"name": "", "bio": "", "photo_b64": None}
+                st.session_state["profile"] = {"name": "", "bio": "", "photo": None}
                 st.rerun()
         
         st.markdown("<div style='margin-bottom:1rem'></div>", unsafe_allow_html=True)
@@ -560,10 +730,11 @@ def _navbar():
         return "Home"
                 
 # ---------- AUTH / PROFILE ----------
+@timed("page.auth")
 def page_auth_home():
     hero("TrustBites", "Discover trusted restaurant recommendations from your friends.")
     auth = st.session_state["auth"]
-    users = st.session_state["users"]
+    store = get_store()
 
     st.markdown('<div class="tb-card">', unsafe_allow_html=True)
     tab_signup, tab_signin = st.tabs(["Create account", "Sign in"])
@@ -590,18 +761,19 @@ def page_auth_home():
                     st.error("Please fill in all required fields.")
                 elif "@" not in email:
                     st.error("Please enter a valid email address.")
-                elif email in users:
+                elif store.get_user(email):
                     st.error("An account with this email already exists. Please sign in.")
                 else:
-                    users[email] = {
-                        "password": pw,
-                        "first_name": first,
-                        "last_name": last,
-                        "city": city,
-                        "fav": fav,
-                        "bio": bio,
-                    }
-                    st.session_state["users"] = users
+                    store.add_user(
+                        email,
+                        pw,
+                        first_name=first,
+                        last_name=last,
+                        city=city,
+                        fav=fav,
+                        bio=bio,
+                        event=("join", f"{first} {last} joined TrustBites."),
+                    )
                     auth.update(
                         {
                             "signed_in": True,
@@ -613,7 +785,6 @@ def page_auth_home():
                     st.session_state["profile"].update(
                         {"name": f"{first} {last}".strip(), "bio": bio}
                     )
-                    _feed_push("join", f"{first} {last} joined TrustBites.")
                     st.success("Welcome! Account created.")
                     st.rerun()
 
@@ -625,22 +796,24 @@ def page_auth_home():
             s = st.form_submit_button("Sign in")
 
             if s:
-                if email2 not in users:
+                user = store.get_user(email2)
+                if not user:
                     st.error("No account found with this email. Please sign up first.")
-                elif users[email2]["password"] != pw2:
+                elif not store.authenticate(email2, pw2):
                     st.error("Incorrect password.")
                 else:
                     auth.update(
                         {
                             "signed_in": True,
                             "email": email2,
-                            "first_name": users[email2].get("first_name", ""),
-                            "last_name": users[email2].get("last_name", ""),
+                            "first_name": user.get("first_name", ""),
+                            "last_name": user.get("last_name", ""),
                         }
                     )
+                    st.session_state["profile"]["photo"] = user.get("photo")
                     if not st.session_state["profile"]["name"]:
-                        fn = users[email2].get("first_name", "")
-                        ln = users[email2].get("last_name", "")
+                        fn = user.get("first_name", "")
+                        ln = user.get("last_name", "")
                         st.session_state["profile"]["name"] = f"{fn} {ln}".strip()
                     st.success("Signed in!")
                     st.rerun()
@@ -648,27 +821,12 @@ def page_auth_home():
     st.markdown("</div>", unsafe_allow_html=True)
 
 
-def process_uploaded_photo(uploaded_file):
-    """Process an uploaded photo file and return base64 string."""
-    if uploaded_file is None:
-        return None
-    try:
-        file_bytes = uploaded_file.getvalue()
-        img = Image.open(BytesIO(file_bytes)).convert("RGB")
-        img.thumbnail((1024, 1024))
-        buf = BytesIO()
-        img.save(buf, format="JPEG", quality=85)
-        return base64.b64encode(buf.getvalue()).decode("utf-8")
-    except Exception as e:
-        st.error(f"Failed to process photo: {e}")
-        return None
-
-
+@timed("page.profile")
 def page_profile():
     auth = st.session_state["auth"]
-    users = st.session_state["users"]
+    store = get_store()
     email = auth["email"]
-    user_record = users.get(email, {})
+    user_record = store.get_user(email) or {}
 
     hero("Profile", "Update your basic profile information.")
 
@@ -678,9 +836,13 @@ def page_profile():
 
     st.markdown('<div class="tb-card">', unsafe_allow_html=True)
     
-    current_photo = st.session_state["profile"].get("photo_b64")
+    current_photo = st.session_state["profile"].get("photo")
     if current_photo:
-        st.image(f"data:image/jpeg;base64,{current_photo}", width=100, caption="Current avatar")
+        st.markdown(
+            photo_html(current_photo, "avatar", style="width:100px;border-radius:8px;"),
+            unsafe_allow_html=True,
+        )
+        st.caption("Current avatar")
     
     uploaded_photo = st.file_uploader(
         "Avatar photo (optional)", 
@@ -689,14 +851,11 @@ def page_profile():
     )
     
     if uploaded_photo is not None:
-        file_id = f"{uploaded_photo.name}_{uploaded_photo.size}"
-        last_processed = st.session_state.get("_last_processed_photo")
-        if file_id != last_processed:
-            photo_b64 = process_uploaded_photo(uploaded_photo)
-            if photo_b64:
-                st.session_state["profile"]["photo_b64"] = photo_b64
-                st.session_state["_last_processed_photo"] = file_id
-                st.rerun()
+        photo = _processed_upload(uploaded_photo)
+        if photo and photo != current_photo:
+            st.session_state["profile"]["photo"] = photo
+            store.update_user(email, photo=photo)
+            st.rerun()
     
     with st.form("profile_form"):
         c1, c2 = st.columns(2)
@@ -715,15 +874,12 @@ def page_profile():
                 st.error("First name, last name and email cannot be empty.")
             elif "@" not in email_new:
                 st.error("Please enter a valid email address.")
-            elif email_new != email and email_new in users:
+            elif email_new != email and store.get_user(email_new):
                 st.error("Another account already uses this email.")
             else:
-                record = users.pop(email, user_record)
-                record["first_name"] = first
-                record["last_name"] = last
-                record["bio"] = bio
-                users[email_new] = record
-                st.session_state["users"] = users
+                store.update_user(
+                    email, new_email=email_new, first_name=first, last_name=last, bio=bio
+                )
 
                 st.session_state["auth"].update(
                     {"email": email_new, "first_name": first, "last_name": last}
@@ -736,8 +892,45 @@ def page_profile():
 
     st.markdown("</div>", unsafe_allow_html=True)
 
+    _friends(email)
+
+
+def _friends(email: str):
+    store = get_store()
+    st.markdown("### Friends")
+    following = store.following(email)
+    st.caption(f"Following {len(following)} · {store.count_followers(email)} followers")
+    with st.form("follow_form", clear_on_submit=True):
+        c1, c2 = st.columns([3, 1])
+        with c1:
+            other = st.text_input("Follow someone by email", label_visibility="collapsed", placeholder="friend@example.com")
+        with c2:
+            follow = st.form_submit_button("Follow", use_container_width=True)
+    if follow and other.strip():
+        other = other.strip()
+        user = store.get_user(other)
+        if not user:
+            st.error(f"No account for {other}.")
+        elif other == email:
+            st.error("That's you.")
+        else:
+            names = store.display_names([email, other])
+            name = names[other]
+            if store.follow(email, other, event=("follow", f"{names[email]} followed {name}.")):
+                st.rerun()
+            st.info(f"You already follow {name}.")
+
+    names = store.display_names(following)
+    for friend in following:
+        c1, c2 = st.columns([3, 1])
+        c1.markdown(f"{names.get(friend, friend)} · `{friend}`")
+        if c2.button("Unfollow", key=f"unfollow_{friend}", use_container_width=True):
+            store.unfollow(email, friend)
+            st.rerun()
+
 
 # ---------- APP PAGES ----------
+@timed("page.home")
 def page_home():
     hero("TrustBites", "Discover trusted restaurant recommendations from your friends.")
     st.markdown("### Quick actions")
@@ -852,11 +1045,42 @@ def page_home():
             st.session_state["page"] = "Feed"
             st.rerun()
 
+    _recommendations()
+
+
+def _recommendations():
+    """Top places among the people you follow (and the people they follow)."""
+    st.markdown("### Recommended for you")
+    me = st.session_state["auth"]["email"]
+    with span("home.recommend"):
+        recs = get_recommender().recommend(me)
+    if not recs:
+        st.caption("Follow friends from your *Profile* to get recommendations from the places they rate.")
+        return
+    names = get_store().display_names({e for r in recs for e in r["via"][:RECOMMEND_VIA_SHOWN]})
+    for r in recs:
+        via = ", ".join(names.get(e, e) for e in r["via"][:RECOMMEND_VIA_SHOWN])
+        if len(r["via"]) > RECOMMEND_VIA_SHOWN:
+            via += f" +{len(r['via']) - RECOMMEND_VIA_SHOWN}"
+        city = f" – {html.escape(r['city'])}" if r["city"] else ""
+        st.markdown(
+            f"""
+            <div class="tb-card">
+              <div style="font-weight:600;">{html.escape(r['name'])}{city} · ⭐ {r['score']:.1f}</div>
+              <div style="opacity:.7;font-size:13px;">Rated by {html.escape(via)}</div>
+            </div>
+            """,
+            unsafe_allow_html=True,
+        )
+
+@timed("page.add_place")
 def page_add_place():
     hero("Add a new place", "Add ratings, tags and notes for a restaurant.")
 
-    _ensure_places_schema()
+    store = get_store()
+    # the session keeps only the id; the place itself is read fresh
     editing = st.session_state.get("edit_item")
+    editing = store.get_place(editing) if editing else None
 
     st.markdown('<div class="tb-card">', unsafe_allow_html=True)
 
@@ -865,17 +1089,6 @@ def page_add_place():
     else:
         st.markdown("#### New place")
 
-    name = st.text_input("Place name", value=editing["name"] if editing else "")
-    city = st.text_input("City", value=editing["city"] if editing else "")
-
-    c1, c2 = st.columns(2)
-    with c1:
-        food = st.slider("Food", 1, 5, editing["food"] if editing else 3)
-        location = st.slider("Location", 1, 5, editing["location"] if editing else 3)
-    with c2:
-        service = st.slider("Service", 1, 5, editing["service"] if editing else 3)
-        price = st.slider("Price", 1, 5, editing["price"] if editing else 3)
-
     predefined_tags = ["Casual", "Romantic", "Pizza", "Seafood", "Cocktails", "Brunch"]
 
     if editing:
@@ -885,26 +1098,43 @@ def page_add_place():
     else:
         default_tags = []
 
-    selected_tags = st.multiselect(
-        "Tags",
-        options=predefined_tags,
-        default=default_tags,
-    )
-    other_tags_raw = st.text_input(
-        "Other tags (comma separated, optional)", value=""
-    )
-    notes = st.text_area("Notes", height=140, value=editing["notes"] if editing else "")
+    # one form: sliders and inputs don't rerun the script until "Save place"
+    with st.form("place_form"):
+        name = st.text_input("Place name", value=editing["name"] if editing else "")
+        city = st.text_input("City", value=editing["city"] if editing else "")
 
-    up = st.file_uploader("Photo (optional)", type=["png", "jpg", "jpeg"])
-    photo_b64_preview = image_file_to_b64(up) if up else None
+        c1, c2 = st.columns(2)
+        with c1:
+            food = st.slider("Food", 1, 5, editing["food"] if editing else 3)
+            location = st.slider("Location", 1, 5, editing["location"] if editing else 3)
+        with c2:
+            service = st.slider("Service", 1, 5, editing["service"] if editing else 3)
+            price = st.slider("Price", 1, 5, editing["price"] if editing else 3)
+
+        selected_tags = st.multiselect(
+            "Tags",
+            options=predefined_tags,
+            default=default_tags,
+        )
+        other_tags_raw = st.text_input(
+            "Other tags (comma separated, optional)", value=""
+        )
+        notes = st.text_area("Notes", height=140, value=editing["notes"] if editing else "")
 
-    clicked_save = st.button("Save place", use_container_width=True, key="save_place")
+        up = st.file_uploader("Photo (optional)", type=["png", "jpg", "jpeg"])
+
+        clicked_save = st.form_submit_button("Save place", use_container_width=True)
 
     st.markdown("</div>", unsafe_allow_html=True)
 
+    if not editing:
+        _import_places()
+
     if not clicked_save:
         return
 
+    photo = _processed_upload(up) if up else None
+
     if not name or not city:
         st.error("Please provide both a place name and a city.")
         return
@@ -916,30 +1146,24 @@ def page_add_place():
         tags_final.extend(extra)
 
     if editing:
-        # try to (re)geocode if we have a city
-        lat, lon = editing.get("lat"), editing.get("lon")
-        if city.strip():
-            coords = geocode_place(f"{name} {city}")
-            if coords:
-                lat, lon = coords
-
-        editing.update(
-            {
-                "name": name.strip(),
-                "city": city.strip(),
-                "food": int(food),
-                "service": int(service),
-                "location": int(location),
-                "price": int(price),
-                "notes": notes.strip(),
-                "tags": tags_final,
-                "photo_b64": photo_b64_preview or editing.get("photo_b64"),
-                # "lat": lat,
-                # "lon": lon,
-            }
+        store.update_place(
+            editing["id"],
+            name=name.strip(),
+            city=city.strip(),
+            food=int(food),
+            service=int(service),
+            location=int(location),
+            price=int(price),
+            notes=notes.strip(),
+            tags=tags_final,
+            photo=photo or editing.get("photo"),
+            event=("edit", f"Edited {name} in {city}."),
         )
+        # places that never got coordinates get another try in the background
+        if editing.get("lat") is None and city.strip():
+            store.update_place(editing["id"], geo_status="pending")
+            get_geoworker().submit(editing["id"], place_queries(name, city))
 
-        _feed_push("edit", f"Edited {name} in {city}.")
         st.success("Place updated.")
 
         # ✅ finish the edit session
@@ -950,21 +1174,11 @@ def page_add_place():
         st.rerun()
         return
                     
-    # --- NEW: try to geocode the place so it appears on the map ---
-    lat, lon = None, None
-    query = f"{name} {city}".strip()
-    if query:
-        coords = geocode_place(query)
-        if not coords and city.strip():
-            # fallback: try just the city
-            coords = geocode_place(city.strip())
-        if coords:
-            lat, lon = coords
-
-    st.session_state["places"].insert(
-        0,
+    # coordinates are filled in by the background geocoder so the place
+    # shows up on the map on a later render
+    place = store.add_place(
         {
-            "id": str(uuid4()),
+            "owner": st.session_state["auth"]["email"],
             "name": name.strip(),
             "city": city.strip(),
             "food": int(food),
@@ -973,25 +1187,34 @@ def page_add_place():
             "price": int(price),
             "notes": notes.strip(),
             "tags": tags_final,
-            "photo_b64": photo_b64_preview,
+            "photo": photo,
             "created_at": datetime.utcnow().isoformat(timespec="seconds"),
-            "lat": lat,
-            "lon": lon,
+            "geo_status": "pending",
         },
+        event=("add", f"Added {name} in {city}."),
     )
-    _feed_push("add", f"Added {name} in {city}.")
+    get_geoworker().submit(place["id"], place_queries(name, city))
     st.success("Place added.")
     st.session_state["page"] = "My list"   # ⬅️ go straight to My list
     st.rerun()
 
-def render_place_card(p):
+def render_place_card(p, mine=True, author=None, similar=None):
+    """Only the viewer's own places (`mine`) get Edit/Delete; `author` is the
+    display name of someone else's. `similar` lists the places most like it
+    (see similar.py)."""
     left, mid, right = st.columns([1.15, 3, 1])
 
     with left:
-        if p.get("photo_b64"):
+        if p.get("photo"):
+            # card-sized rendition, linking to the full-size photo
+            card = photo_html(
+                p["photo"],
+                "card",
+                style="width:220px;height:150px;object-fit:cover;border-radius:12px;",
+                alt=p["name"],
+            )
             st.markdown(
-                f'<img src="data:image/jpeg;base64,{p["photo_b64"]}" '
-                f'style="width:220px;height:150px;object-fit:cover;border-radius:12px;" />',
+                f'<a href="{photo_url(p["photo"])}" target="_blank">{card}</a>',
                 unsafe_allow_html=True,
             )
         else:
@@ -999,7 +1222,12 @@ def render_place_card(p):
 
     with mid:
         st.subheader(p["name"])
-        st.caption(p["city"] or "—")
+        city = p["city"] or "—"
+        if p.get("distance_km") is not None:
+            city += f" · {format_distance(p['distance_km'])} away"
+        st.caption(city)
+        if p.get("geo_status") == "pending":
+            st.caption("📍 Locating on the map…")
 
         # ratings first
         m1, m2, m3, m4 = st.columns(4)
@@ -1014,154 +1242,340 @@ def render_place_card(p):
 
         # tags just below ratings
         if p.get("tags"):
-            chips = "".join(f'<span class="tb-chip">{t}</span>' for t in p["tags"])
+            chips = "".join(f'<span class="tb-chip">{html.escape(t)}</span>' for t in p["tags"])
             st.markdown(chips, unsafe_allow_html=True)
 
         if p.get("notes"):
             st.markdown(f"*Notes*: {p['notes']}")
         st.caption(f"Added: {p.get('created_at', '—')}")
+        if author:
+            st.caption(f"Recommended by {author}")
+        if similar:
+            st.caption(
+                "Similar: " + " · ".join(f"{s['name']} ({s['city']})" if s["city"] else s["name"] for s in similar)
+            )
+
+    if not mine:
+        return
 
     with right:
         if st.button("Edit", key=f"edit_{p['id']}", use_container_width=True):
-            st.session_state["edit_item"] = p
+            st.session_state["edit_item"] = p["id"]
             st.session_state["page"] = "Add a place"
             st.rerun()
 
         if st.button("Delete", key=f"del_{p['id']}", use_container_width=True):
-            st.session_state["places"] = [
-                x for x in st.session_state["places"] if x["id"] != p["id"]
-            ]
+            get_store().delete_place(p["id"], event=("delete", f"Removed {p['name']}."))
             st.success("Place deleted.")
             st.rerun()
 
 
+def _import_places():
+    """Bulk import from a file; importing an interrupted file again resumes it."""
+    with st.expander("📥 Import places from a file"):
+        st.caption(
+            "CSV (a name column, plus any of city, notes, tags, food, service, "
+            "location, price, lat/lon), GeoJSON, or Google Takeout's *Saved Places.json* "
+            "and saved-list CSVs. Places without coordinates are located in the background."
+        )
+        up = st.file_uploader("File", type=["csv", "json", "geojson"], key="import_file")
+        if not up or not st.button("Import", key="import_start"):
+            return
+
+        bar = st.progress(0.0, text="Importing…")
+        progress = None
+        try:
+            with span("import.run"):
+                for progress in run_import(
+                    get_store(), up, up.name, st.session_state["auth"]["email"],
+                    submit_geocodes=get_geoworker().submit_many,
+                ):
+                    bar.progress(
+                        progress["fraction"],
+                        text=f"{progress['imported']} imported · {progress['failed']} skipped",
+                    )
+        except ValueError as e:
+            st.error(f"Import stopped: {e}. Import the same file again to continue after the last saved batch.")
+            return
+
+        if progress.get("already_imported"):
+            st.info(f"{up.name} was already imported ({progress['imported']} places).")
+            return
+        resumed = f" (resumed after row {progress['resumed_from']})" if progress["resumed_from"] else ""
+        st.success(f"Imported {progress['imported']} places{resumed}.")
+        if progress["failed"]:
+            st.warning(
+                f"{progress['failed']} rows skipped: "
+                + "; ".join(f"row {row}: {reason}" for row, reason in progress["errors"])
+            )
+
+
+@timed("page.list")
 def page_list():
     hero("My list", "Discover trusted restaurant recommendations from your friends.")
-    _ensure_places_schema()
+    store = get_store()
+    me = st.session_state["auth"]["email"]
 
-    if not st.session_state["places"]:
+    scope = st.radio("Show", ["My places", "Everyone's"], horizontal=True, key="list_scope")
+    owner = me if scope == "My places" else None
+
+    if not store.count_places(owner=owner):
         st.info("No places yet. Add your first one from *Add a place*.")
         return
 
+    near_options = {"Anywhere": None}
+    last_click = st.session_state.get("last_map_click")
+    if last_click:
+        near_options["Point selected on the map"] = (last_click["lat"], last_click["lng"])
+    user_city = (store.get_user(me) or {}).get("city") or ""
+    city_center = get_gazetteer().lookup(user_city) if user_city else None
+    if city_center:
+        near_options[f"Center of {user_city}"] = city_center
+
     c1, c2, c3 = st.columns([2, 2, 1.5])
+    n1, n2, n3 = st.columns([2, 2, 1.5])
     with c1:
-        q = st.text_input("Search by name/city", placeholder="e.g. trattoria, Lisbon")
+        q = st.text_input("Search name, city, notes or tags", placeholder="e.g. trattoria, Lisbon")
+    with n1:
+        near_label = st.selectbox("Near here", list(near_options))
+    near_point = near_options[near_label]
+    with n2:
+        radius_km = st.slider("Within (km)", 1, 50, 5, disabled=near_point is None)
+    near = (*near_point, radius_km) if near_point else None
+    with n3:
+        similar_nearby = st.toggle(
+            "Similar places nearby only", key="similar_nearby", help=f"Suggest similar places within {SIMILAR_NEARBY_KM} km"
+        )
     with c2:
-        tag_options = sorted(
-            {t for p in st.session_state["places"] for t in p.get("tags", [])}
+        # facet counts for the current search, place and tag selection
+        selected = st.session_state.get("list_tags", [])
+        with span("list.facets"):
+            counts = store.tag_counts(owner=owner, q=q.strip(), tags=selected, near=near)
+            tag_options = store.distinct_tags(owner=owner)
+        tag_filter = st.multiselect(
+            "Filter by tags",
+            options=tag_options,
+            format_func=lambda t: f"{t} ({counts.get(t, 0)})",
+            key="list_tags",
         )
-        tag_filter = st.multiselect("Filter by tags", options=tag_options)
     with c3:
-        sort_by = st.selectbox(
-            "Sort by", ["Newest", "Name", "Food", "Service", "Location", "Price"]
+        sort_options = ["Newest", "Name", "Food", "Service", "Location", "Price"]
+        if near_point:
+            sort_options.insert(0, DISTANCE_SORT)
+        if q.strip():
+            sort_options.insert(0, RELEVANCE_SORT)
+        sort_by = st.selectbox("Sort by", sort_options)
+
+    q = q.strip()
+    with span("list.count"):
+        total = store.count_places(owner=owner, q=q, tags=tag_filter, near=near)
+    page_size = st.session_state.get("list_page_size", LIST_PAGE_SIZE)
+    pages = max(1, -(-total // page_size))
+
+    # Keyset pagination: the stack holds the cursor each visited page starts
+    # after, so a page stays put when places are added or removed before it.
+    # Back to the first page whenever the filters change.
+    filters = (owner, q, tuple(tag_filter), sort_by, near, page_size)
+    if st.session_state.get("list_filters") != filters:
+        st.session_state["list_filters"] = filters
+        st.session_state["list_cursors"] = [None]
+    cursors = st.session_state["list_cursors"]
+    page_no = len(cursors) - 1
+
+    with span("list.query"):
+        items = store.list_places(
+            owner=owner,
+            q=q,
+            tags=tag_filter,
+            sort=sort_by,
+            limit=page_size,
+            after=cursors[-1],
+            near=near,
         )
+    if not items and page_no:
+        # everything after the cursor is gone: step back a page
+        cursors.pop()
+        st.rerun()
 
-    def sort_key(p):
-        mapping = {
-            "Name": p["name"].lower(),
-            "Food": p["food"],
-            "Service": p["service"],
-            "Location": p["location"],
-            "Price": p["price"],
-            "Newest": p.get("created_at", ""),
-        }
-        return mapping[sort_by]
+    if near and not items:
+        st.info(f"No saved places within {radius_km} km.")
+
+    authors = store.display_names({p["owner"] for p in items if p["owner"] != me})
+    with span("list.similar"):
+        similar = get_similar().similar([p["id"] for p in items], max_km=SIMILAR_NEARBY_KM if similar_nearby else None)
+    count("list.cards", len(items))
+    with span("list.cards"):
+        for p in items:
+            st.markdown('<div class="tb-card">', unsafe_allow_html=True)
+            render_place_card(
+                p, mine=p["owner"] == me, author=authors.get(p["owner"]), similar=similar.get(p["id"])
+            )
+            st.markdown("</div>", unsafe_allow_html=True)
 
-    items = st.session_state["places"]
+    has_next = len(items) == page_size and page_no < pages - 1
+    prev_col, info_col, size_col, next_col = st.columns([1, 1.5, 0.8, 1])
+    with prev_col:
+        if st.button("← Previous", key="list_prev", disabled=page_no == 0, use_container_width=True):
+            cursors.pop()
+            st.rerun()
+    with info_col:
+        st.caption(f"Page {page_no + 1} of {pages} · {total} places")
+    with size_col:
+        st.selectbox(
+            "Per page",
+            LIST_PAGE_SIZES,
+            index=LIST_PAGE_SIZES.index(page_size),
+            key="list_page_size",
+            label_visibility="collapsed",
+        )
+    with next_col:
+        if st.button("Next →", key="list_next", disabled=not has_next, use_container_width=True):
+            cursors.append(store.page_cursor(items[-1], sort_by, near))
+            st.rerun()
 
-    if q:
-        ql = q.lower().strip()
-        items = [
-            p
-            for p in items
-            if ql in p["name"].lower() or ql in p["city"].lower()
-        ]
-    if tag_filter:
-        items = [
-            p
-            for p in items
-            if set(tag_filter).issubset(set(p.get("tags", [])))
-        ]
+    _export_places(owner=owner, q=q, tags=tag_filter, sort=sort_by, near=near, total=total)
 
-    items = sorted(items, key=sort_key, reverse=True)
 
-    for p in items:
-        st.markdown('<div class="tb-card">', unsafe_allow_html=True)
-        render_place_card(p)
-        st.markdown("</div>", unsafe_allow_html=True)
+def _export_places(total: int, **filters):
+    """Export of the places matching the list filters, built in the background."""
+    with st.expander("📤 Export these places"):
+        st.caption(
+            f"The {total} places matching the search and tags above. Photos are "
+            "linked by URL, or bundled as files in a zip archive."
+        )
+        c1, c2 = st.columns([1, 1])
+        with c1:
+            fmt = st.radio("Format", list(EXPORT_FORMATS), horizontal=True, key="export_format")
+        with c2:
+            archive = st.checkbox("Zip with photos", key="export_archive")
+        if st.button("Export", key="export_start", disabled=not total):
+            job = get_exporter().start(get_store(), EXPORT_FORMATS[fmt], archive=archive, **filters)
+            st.session_state["export_job"] = job.id
+
+        job = get_exporter().get(st.session_state.get("export_job", ""))
+        if job is None:
+            return
+        if job.status in ("queued", "running"):
+            _export_progress(job.id)
+        elif job.status == "failed":
+            st.error(f"Export failed: {job.error}")
+        else:
+            st.markdown(
+                f'<a href="{job.url}" download="{job.filename}">⬇️ Download {job.filename}</a> · {job.rows} places',
+                unsafe_allow_html=True,
+            )
 
 
+@st.fragment(run_every=1)
+def _export_progress(job_id: str):
+    job = get_exporter().get(job_id)
+    if job.status not in ("queued", "running"):
+        st.rerun()   # the whole page, to show the result
+    st.progress(min(1.0, job.rows / job.total) if job.total else 0.0, text=f"Exporting… {job.rows} of {job.total}")
+
+
+@timed("page.map")
 def page_map():
+    from mapview import base_map, marker_layer, st_folium
+
     hero("Map", "Pin places and explore restaurants on a map.")
     st.title("Map")
 
-    _ensure_places_schema()
+    store = get_store()
+    owner = st.session_state["auth"]["email"]
+    everyone = st.toggle("Show everyone's places", key="map_everyone")
+    shown_owner = None if everyone else owner
 
     # --- choose center: last clicked point or default Lisbon ---
-    default_center = (38.7223, -9.1393)
+    user = store.get_user(owner) or {}
+    default_center = get_gazetteer().lookup(user.get("city") or "") or DEFAULT_MAP_CENTER
     last_click = st.session_state.get("last_map_click")
-    if last_click:
-        center = (last_click["lat"], last_click["lng"])
-    else:
-        center = default_center
-
-    # --- build folium map with existing pins ---
-    fmap = folium.Map(location=center, zoom_start=13, tiles="OpenStreetMap")
+    center = (last_click["lat"], last_click["lng"]) if last_click else None
 
-    # existing saved places (red pins)
-    for p in st.session_state["places"]:
-        if p.get("lat") is not None and p.get("lon") is not None:
-            folium.Marker(
-                [p["lat"], p["lon"]],
-                popup=f"{p['name']} – {p.get('city','')}",
-                icon=folium.Icon(color="red", icon="cutlery", prefix="fa"),
-            ).add_to(fmap)
+    # the base map only depends on the user's city, so panning, zooming and
+    # clicking never rebuild it; pins go in a layer the component swaps in place
+    fmap = base_map(default_center, MAP_ZOOM)
 
+    view = st.session_state.get("map_view") or {"center": center or default_center, "zoom": MAP_ZOOM}
+    south, west, north, east = _map_bbox(view)
+    with span("map.query"):
+        visible = store.places_in_bbox(south, west, north, east, owner=shown_owner, limit=MAP_MAX_MARKERS)
+    count("map.markers", len(visible))
     # temporary pin at last selected point (blue)
-    if last_click:
-        folium.Marker(
-            [last_click["lat"], last_click["lng"]],
-            popup="Selected point",
-            icon=folium.Icon(color="blue", icon="map-marker", prefix="fa"),
-        ).add_to(fmap)
+    layer = marker_layer(visible, selected=center)
+
+    # show the map and capture clicks and the viewport
+    with span("map.render"):
+        map_state = st_folium(
+            fmap,
+            width=MAP_WIDTH,
+            height=MAP_HEIGHT,
+            key="trustbites_map",
+            center=center,
+            feature_group_to_add=layer,
+            returned_objects=["last_clicked", "bounds", "zoom", "center"],
+        )
 
-    # show the map and capture clicks
-    map_state = st_folium(fmap, width=980, height=560, key="trustbites_map")
+    if map_state:
+        if map_state.get("center") and map_state.get("zoom") is not None:
+            st.session_state["map_view"] = {
+                "center": (map_state["center"]["lat"], map_state["center"]["lng"]),
+                "zoom": map_state["zoom"],
+                "bounds": map_state.get("bounds"),
+            }
+        # if user clicked, remember that location for the NEXT rerun
+        if map_state.get("last_clicked"):
+            st.session_state["last_map_click"] = map_state["last_clicked"]
+            last_click = st.session_state["last_map_click"]
 
-    # if user clicked, remember that location for the NEXT rerun
-    if map_state and map_state.get("last_clicked"):
-        st.session_state["last_map_click"] = map_state["last_clicked"]
-        last_click = st.session_state["last_map_click"]
+    if len(visible) >= MAP_MAX_MARKERS:
+        st.caption(f"Showing the first {MAP_MAX_MARKERS} places in this area — zoom in to see the rest.")
 
     # --- form to add a place from selected point ---
     if last_click:
         st.success(f"Selected: {last_click['lat']:.5f}, {last_click['lng']:.5f}")
 
-        pname = st.text_input("Place name *", key="map_pname")
-        city = st.text_input("City", key="map_city")
-
-        colf, cols, coll, colp = st.columns(4)
-        food = colf.slider("Food", 1, 5, 3, key="mf")
-        serv = cols.slider("Service", 1, 5, 3, key="ms")
-        loc_ = coll.slider("Location", 1, 5, 3, key="ml")
-        price = colp.slider("Price", 1, 5, 3, key="mp")
+        nearby = store.nearest_places(last_click["lat"], last_click["lng"], k=MAP_NEARBY, owner=owner, max_km=MAP_NEARBY_KM)
+        if nearby:
+            if nearby[0]["distance_km"] < DUPLICATE_PIN_KM:
+                st.warning(f"You already saved **{nearby[0]['name']}** right here.")
+            st.caption(
+                "Nearby: "
+                + " · ".join(f"{p['name']} ({format_distance(p['distance_km'])})" for p in nearby)
+            )
 
-        notes = st.text_area("Notes", height=80, key="map_notes")
-        tags = st.multiselect(
-            "Tags",
-            ["Casual", "Romantic", "Pizza", "Seafood", "Cocktails", "Brunch"],
-            key="map_tags",
-        )
+        # a form, so moving a slider doesn't rebuild the whole map
+        with st.form("map_place_form"):
+            pname = st.text_input("Place name *", key="map_pname")
+            city = st.text_input("City", key="map_city")
+
+            colf, cols, coll, colp = st.columns(4)
+            food = colf.slider("Food", 1, 5, 3, key="mf")
+            serv = cols.slider("Service", 1, 5, 3, key="ms")
+            loc_ = coll.slider("Location", 1, 5, 3, key="ml")
+            price = colp.slider("Price", 1, 5, 3, key="mp")
+
+            notes = st.text_area("Notes", height=80, key="map_notes")
+            tags = st.multiselect(
+                "Tags",
+                ["Casual", "Romantic", "Pizza", "Seafood", "Cocktails", "Brunch"],
+                key="map_tags",
+            )
 
-        submitted = st.button("Add this place", key="map_add_btn")
+            submitted = st.form_submit_button("Add this place")
 
         if submitted:
             if not pname.strip():
                 st.error("Place name is required.")
             else:
-                st.session_state["places"].append(
+                # Determine city for the feed: use input if present, otherwise reverse-geocode
+                city_text = city.strip()
+                if not city_text:
+                    city_text = reverse_geocode_city(last_click["lat"], last_click["lng"])
+
+                store.add_place(
                     {
-                        "id": str(uuid4()),
+                        "owner": owner,
                         "name": pname.strip(),
                         "city": city.strip(),
                         "food": int(food),
@@ -1170,44 +1584,69 @@ def page_map():
                         "price": int(price),
                         "notes": notes.strip(),
                         "tags": [t.strip().title() for t in tags],
-                        "photo_b64": None,
+                        "photo": None,
                         "created_at": datetime.utcnow().isoformat(timespec="seconds"),
                         "lat": last_click["lat"],
                         "lon": last_click["lng"],
-                    }
+                        "geo_status": "ok",
+                    },
+                    event=("pin", f"pinned {pname.strip()} in {city_text}."),
                 )
 
-                # Determine city for the feed: use input if present, otherwise reverse-geocode
-                city_text = city.strip()
-                if not city_text:
-                    city_text = reverse_geocode_city(last_click["lat"], last_click["lng"])
-
-                _feed_push("pin", f"pinned {pname.strip()} in {city_text}.")
-
                 st.session_state["last_map_click"] = None
                 st.success("Place added to your list.")
                 st.rerun()
 
+    with st.expander("Geocoding stats"):
+        stats = get_geocache().stats()
+        g1, g2, g3 = st.columns(3)
+        g1.metric("Hit rate", f"{stats['hit_rate']:.0%}")
+        g2.metric("Lookups saved", stats["memory_hits"] + stats["disk_hits"])
+        g3.metric("Time saved", f"{stats['saved_seconds']:.1f} s")
+        st.caption(
+            f"{stats['misses']} misses ({stats['errors']} failed), "
+            f"avg lookup {stats['avg_lookup_seconds'] * 1000:.0f} ms, "
+            f"{stats['memory_entries']} entries in memory · "
+            f"{get_geoworker().pending()} places waiting for coordinates"
+        )
+        # no Nominatim call yet means no HTTP client (nor requests) to ask
+        http = get_http_client().stats() if "http" in registry.collectors else {"latency": {}, "breakers": {}}
+        for endpoint, h in http["latency"].items():
+            st.caption(
+                f"`{endpoint}` · {h['count']} calls · p50 ≤ {h['p50'] * 1000:.0f} ms · "
+                f"p95 ≤ {h['p95'] * 1000:.0f} ms"
+            )
+        for host, state in http["breakers"].items():
+            if state != "closed":
+                st.warning(f"{host} circuit is {state.replace('_', '-')}: lookups fail fast for now.")
+
+@timed("page.feed")
 def page_feed():
-    hero("Feed", "See recent activity from your session.")
-    feed = list(reversed(st.session_state["feed"]))
+    hero("Feed", "See what everyone has been adding lately.")
+    store = get_store()
+    shown = st.session_state.get("feed_shown", FEED_PAGE_SIZE)
+    with span("feed.query"):
+        feed = store.list_events(limit=shown)
+        names = store.display_names({ev["actor"] for ev in feed if ev["actor"]})
+    count("feed.events", len(feed))
 
     if not feed:
         st.info("No activity yet.")
         return
 
-    icon_for_kind = {"join": "👤", "add": "➕", "edit": "✏️", "pin": "📍"}
+    icon_for_kind = {"join": "👤", "add": "➕", "edit": "✏️", "pin": "📍", "delete": "🗑️", "import": "📥", "follow": "🤝"}
 
     for ev in feed:
         icon = icon_for_kind.get(ev["kind"], "🧾")
+        meta = " · ".join(x for x in (names.get(ev["actor"]), ev["ts"]) if x)
         st.markdown(
             f"""
         <div class="tb-card">
           <div style="display:flex;gap:12px;align-items:center;">
             <div class="tb-feed-icon">{icon}</div>
             <div>
-              <div style="font-weight:600;">{ev['text']}</div>
-              <div style="opacity:.7;font-size:13px;">{ev['ts']}</div>
+              <div style="font-weight:600;">{html.escape(ev['text'])}</div>
+              <div style="opacity:.7;font-size:13px;">{html.escape(meta)}</div>
             </div>
           </div>
         </div>
@@ -1215,30 +1654,166 @@ def page_feed():
             unsafe_allow_html=True,
         )
 
+    if shown < FEED_MAX_EVENTS and store.count_events() > shown:
+        if st.button("Show older activity", key="feed_more"):
+            st.session_state["feed_shown"] = min(shown + FEED_PAGE_SIZE, FEED_MAX_EVENTS)
+            st.rerun()
+
+
+STATS_TOP_CITIES = 20   # rows in the cities table
+
+
+def _mean(stats: dict) -> str:
+    return f"{stats['mean']:.2f}" if stats["mean"] is not None else "—"
+
+
+@timed("page.stats")
+def page_stats():
+    """Reads only the store's precomputed aggregates: no query runs here."""
+    hero("Stats", "How places rate, by city and by tag.")
+    ratings = get_store().ratings
+    if not len(ratings):
+        st.info("No places yet.")
+        return
+
+    c1, c2 = st.columns(2)
+    with c1:
+        cities = ratings.groups("city")
+        city = st.selectbox(
+            "City", ["", *cities], format_func=lambda c: f"{c} ({cities[c]})" if c else "All cities", key="stats_city"
+        )
+    with c2:
+        tags = ratings.groups("city_tag", city) if city else ratings.groups("tag")
+        tag = st.selectbox(
+            "Tag", ["", *tags], format_func=lambda t: f"{t} ({tags[t]})" if t else "All tags", key="stats_tag"
+        )
+    if city and tag:
+        key = ("city_tag", city, tag)
+    elif city or tag:
+        key = ("city", city) if city else ("tag", tag)
+    else:
+        key = ("all",)
+
+    with span("stats.read"):
+        stats = ratings.stats(key)
+        top = ratings.top(key)
+
+    overall = stats["overall"]
+    cols = st.columns(6)
+    cols[0].metric("Places", stats["places"])
+    cols[1].metric(
+        "Overall",
+        _mean(overall),
+        help=f"Mean of each place's ratings · σ {overall['stdev']:.2f}" if overall["stdev"] is not None else None,
+    )
+    for col, field in zip(cols[2:], RATING_FIELDS):
+        col.metric(field.title(), _mean(stats[field]), help=f"{stats[field]['count']} rated")
+
+    where = " · ".join(x for x in (tag, city) if x) or "everywhere"
+    st.markdown(f"### Top {len(top)} · {where}")
+    if not top:
+        st.caption("No rated places here yet.")
+    for i, p in enumerate(top, start=1):
+        city_part = f" – {p['city']}" if p["city"] and not city else ""
+        st.markdown(f"**{i}.** {p['name']}{city_part} · ⭐ {p['score']:.2f}")
+
+    if not city:
+        st.markdown("### Cities")
+        rows = []
+        for name in list(cities)[:STATS_TOP_CITIES]:
+            city_stats = ratings.stats(("city", name))
+            rows.append({"city": name, "places": city_stats["places"], "overall": city_stats["overall"]["mean"]})
+        st.dataframe(rows, hide_index=True, use_container_width=True)
+
+
+# ------------- DEBUG PANEL -------------
+DEBUG_PANEL = os.environ.get("TRUSTBITES_DEBUG") == "1"   # or open the app with ?debug=1
+
+
+def _debug_enabled() -> bool:
+    return DEBUG_PANEL or st.query_params.get("debug") == "1"
+
+
+def _widget_count() -> int:
+    ctx = get_script_run_ctx()
+    return len(ctx.widget_ids_this_run) if ctx else 0
+
+
+def _debug_panel(trace):
+    """Where this rerun's time went, plus span latencies since the process started."""
+    with st.expander("⏱️ Rerun profile"):
+        st.caption(
+            f"{trace.page} · {trace.elapsed() * 1000:.0f} ms so far · "
+            f"{trace.gauges.get('widgets', 0)} widgets"
+        )
+        st.dataframe(
+            [
+                {"span": "\u2003" * depth + name, "start (ms)": round(start * 1000, 1), "ms": round(secs * 1000, 1)}
+                for name, depth, start, secs in trace.spans
+            ],
+            hide_index=True,
+            use_container_width=True,
+        )
+        if trace.counts:
+            st.caption(" · ".join(f"{name}: {n}" for name, n in sorted(trace.counts.items())))
+
+        st.markdown("**Since the app started**")
+        snap = registry.snapshot()
+        st.dataframe(
+            [
+                {
+                    "span": name,
+                    "count": h["count"],
+                    "avg (ms)": round(h["sum"] / h["count"] * 1000, 1) if h["count"] else 0.0,
+                    "p50 (ms) ≤": h["p50"] * 1000,
+                    "p95 (ms) ≤": h["p95"] * 1000,
+                }
+                for name, h in snap["spans"].items()
+            ],
+            hide_index=True,
+            use_container_width=True,
+        )
+        for collector, stats in snap["collectors"].items():
+            if stats:
+                st.caption(f"{collector}: " + " · ".join(f"{k} {v:g}" for k, v in sorted(stats.items())))
+        if registry.export_path:
+            st.caption(f"Exporting {registry.export_format} to `{registry.export_path}`")
+
 
 # ------------- MAIN ROUTING -------------
 _ensure_state()
 
 auth = st.session_state["auth"]
 
-current = _navbar()   # renders top nav and handles navigation state
-
-if st.session_state.get("force_page") is not None:
-    current = st.session_state["force_page"]
-    st.session_state["force_page"] = None   
-
-if not auth["signed_in"]:
-    page_auth_home()
-else:
-    if current == "Home":
-        page_home()
-    elif current == "Add a place":
-        page_add_place()
-    elif current == "My list":
-        page_list()
-    elif current == "Map":
-        page_map()
-    elif current == "Feed":
-        page_feed()
-    elif current == "Profile":
-        page_profile()
\ No newline at end of file
+with rerun(st.session_state["page"]) as trace:
+    current = _navbar()   # renders top nav and handles navigation state
+
+    if st.session_state.get("force_page") is not None:
+        current = st.session_state["force_page"]
+        st.session_state["force_page"] = None
+    trace.page = current if auth["signed_in"] else "Sign in"
+
+    if not auth["signed_in"]:
+        page_auth_home()
+    else:
+        # started before anything can be saved, so the places it picks up as
+        # pending at startup never include one that is also submitted
+        get_geoworker()
+        if current == "Home":
+            page_home()
+        elif current == "Add a place":
+            page_add_place()
+        elif current == "My list":
+            page_list()
+        elif current == "Map":
+            page_map()
+        elif current == "Feed":
+            page_feed()
+        elif current == "Stats":
+            page_stats()
+        elif current == "Profile":
+            page_profile()
+
+    trace.gauges["widgets"] = _widget_count()
+    if _debug_enabled():
+        _debug_panel(trace)